@@ -7,11 +7,14 @@ import {
   ActivityIndicator,
   RefreshControl,
   Alert,
+  NativeScrollEvent,
+  NativeSyntheticEvent,
 } from 'react-native';
 import { Ionicons } from '@expo/vector-icons';
 import { useDisplayName } from '@/hooks/useDisplayName';
 
 const API_BASE_URL = 'https://mission-two-server.onrender.com';
+const USERS_PAGE_SIZE = 50;
 
 interface User {
   id: string;
@@ -27,6 +30,9 @@ interface ConversationStarters {
 
 export default function SparkScreen() {
   const [users, setUsers] = useState<User[]>([]);
+  const [totalUsers, setTotalUsers] = useState(0);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [refreshing, setRefreshing] = useState(false);
   const [selectedUser, setSelectedUser] = useState<User | null>(null);
@@ -38,15 +44,27 @@ export default function SparkScreen() {
     fetchUsers();
   }, [displayName]);
 
+  // Fetch one page of users; pass the previous page's cursor to append the next one
+  const fetchUsersPage = async (cursor: string | null) => {
+    // exclude keeps the current user out of the page and out of the total
+    const exclude = displayName ? `&exclude=${encodeURIComponent(displayName)}` : '';
+    const query = cursor
+      ? `?limit=${USERS_PAGE_SIZE}&cursor=${encodeURIComponent(cursor)}${exclude}`
+      : `?limit=${USERS_PAGE_SIZE}${exclude}`;
+    const response = await fetch(`${API_BASE_URL}/api/users${query}`);
+    const data = await response.json();
+    
+    // Filter out current user
+    const otherUsers = data.users.filter((user: User) => user.display_name !== displayName);
+    setUsers((previous) => (cursor ? [...previous, ...otherUsers] : otherUsers));
+    setTotalUsers(data.total);
+    setNextCursor(data.next_cursor ?? null);
+  };
+
   const fetchUsers = async () => {
     try {
       setLoading(true);
-      const response = await fetch(`${API_BASE_URL}/api/users`);
-      const data = await response.json();
-      
-      // Filter out current user
-      const otherUsers = data.users.filter((user: User) => user.display_name !== displayName);
-      setUsers(otherUsers);
+      await fetchUsersPage(null);
     } catch (error) {
       console.error('Error fetching users:', error);
       Alert.alert('Error', 'Failed to load users');
@@ -55,6 +73,25 @@ export default function SparkScreen() {
     }
   };
 
+  const loadMoreUsers = async () => {
+    if (!nextCursor || loadingMore) return;
+    try {
+      setLoadingMore(true);
+      await fetchUsersPage(nextCursor);
+    } catch (error) {
+      console.error('Error fetching more users:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  const handleScroll = ({ nativeEvent }: NativeSyntheticEvent<NativeScrollEvent>) => {
+    const { layoutMeasurement, contentOffset, contentSize } = nativeEvent;
+    if (layoutMeasurement.height + contentOffset.y >= contentSize.height - 400) {
+      loadMoreUsers();
+    }
+  };
+
   const onRefresh = async () => {
     setRefreshing(true);
     await fetchUsers();
@@ -200,13 +237,15 @@ export default function SparkScreen() {
       ) : (
         <ScrollView
           className="flex-1"
+          onScroll={handleScroll}
+          scrollEventThrottle={200}
           refreshControl={
             <RefreshControl refreshing={refreshing} onRefresh={onRefresh} colors={['#6366f1']} />
           }
         >
           <View className="p-4">
             <Text className="text-gray-300 text-sm mb-4">
-              {users.length} {users.length === 1 ? 'user' : 'users'} available
+              {totalUsers} {totalUsers === 1 ? 'user' : 'users'} available
             </Text>
 
             {users.map((user) => (
@@ -230,6 +269,8 @@ export default function SparkScreen() {
                 <Ionicons name="chevron-forward" size={24} color="#6b7280" />
               </TouchableOpacity>
             ))}
+
+            {loadingMore && <ActivityIndicator size="small" color="#6366f1" className="my-4" />}
           </View>
         </ScrollView>
       )}
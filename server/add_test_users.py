@@ -1,6 +1,7 @@
 """
 Script to add test users with memories to mem0 Platform for testing Conversation Spark
 """
+import asyncio
 import os
 import sys
 from dotenv import load_dotenv
@@ -11,12 +12,16 @@ load_dotenv()
 sys.path.insert(0, os.path.dirname(__file__))
 
 from memory_service import get_memory_service
+from memory_spool import MemorySpool
 
 def add_test_users():
     """Add 2 test users with realistic study memories"""
     
     print("🔧 Initializing memory service...")
     memory_service = get_memory_service()
+    # Writes go through the same durable spool as the agent's; anything not
+    # sent before the script exits is sent by the next process using the spool
+    spool = MemorySpool()
     
     # Test User 1: CS student
     user1_name = "Henry"
@@ -32,12 +37,8 @@ def add_test_users():
     ]
     
     for memory in user1_memories:
-        memory_service.add_conversation_turn(
-            user_id=user1_name,
-            user_message=memory,
-            assistant_message=""  # Empty as mem0 only interprets user messages
-        )
-        print(f"  ✅ Added memory: {memory[:50]}...")
+        spool.enqueue_blocking(user1_name, memory)  # mem0 only interprets user messages
+        print(f"  ✅ Queued memory: {memory[:50]}...")
     
     # Test User 2: Physics student
     user2_name = "Isaac"
@@ -53,12 +54,14 @@ def add_test_users():
     ]
     
     for memory in user2_memories:
-        memory_service.add_conversation_turn(
-            user_id=user2_name,
-            user_message=memory,
-            assistant_message=""  # Empty as mem0 only interprets user messages
-        )
-        print(f"  ✅ Added memory: {memory[:50]}...")
+        spool.enqueue_blocking(user2_name, memory)
+        print(f"  ✅ Queued memory: {memory[:50]}...")
+    
+    print("\n📤 Sending queued memories...")
+    sent = asyncio.run(spool.flush(memory_service, timeout=120))
+    spool.close()
+    if not sent:
+        print(f"  ⚠️ Some memories are still queued in {spool.path}; they will be sent later")
     
     # Verify memories were added
     print("\n🔍 Verifying memories...")
@@ -1,49 +1,27 @@
 import os
+import sys
 import asyncio
+import argparse
+import importlib
 import uuid
+from datetime import datetime
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 import json
-import logging
-
-from livekit import agents
-from livekit.agents import AgentSession, Agent, RoomInputOptions, RoomOutputOptions
-from livekit.plugins import (
-    openai,
-    google,
-    tavus,
-    deepgram,
-    silero,
-    elevenlabs,
-)
-
-# Monkey-patch approach: intercept logger.debug() calls directly
-_original_livekit_logger_debug = None
-
-def _patched_debug(msg, *args, **kwargs):
-    """Intercept debug calls to capture transcript data"""
-    # Call original first
-    _original_livekit_logger_debug(msg, *args, **kwargs)
-    
-    # Check if this is a transcript message
-    if "received user transcript" in str(msg):
-        # kwargs might contain the transcript data in structured logging
-        if 'extra' in kwargs and isinstance(kwargs['extra'], dict):
-            transcript = kwargs['extra'].get('user_transcript')
-            if transcript:
-                _global_transcript_history.append(f"User: {transcript}")
-                _global_last_transcript[0] = transcript
-        
-        # Or it might be in args as a dict
-        if args and isinstance(args[0], dict):
-            transcript = args[0].get('user_transcript')
-            if transcript:
-                _global_transcript_history.append(f"User: {transcript}")
-                _global_last_transcript[0] = transcript
+
+from livekit import agents, api, rtc
+from livekit.agents import AgentSession, Agent, RoomInputOptions
+
+from prompts import build_instructions
+from memory_spool import MemorySpool
+from startup_timeline import StartupTimeline
+from room_stats import RoomStats
+from transcripts import TranscriptBuffer, TranscriptCompactor, TranscriptStreamer
 
 # Import memory service
 try:
-    from memory_service import get_memory_service
+    from memory_service import get_async_memory_service
+    from memory_ranker import MEMORY_CANDIDATES, rank_memories, session_query
     MEMORY_ENABLED = True
     print("[avatar_agent] ✅ Memory service available")
 except Exception as e:
@@ -66,19 +44,73 @@ USER_DISPLAY_NAME = os.getenv("USER_DISPLAY_NAME", "")  # Get display name for m
 LANGUAGE_CODE = os.getenv("LANGUAGE", "en-US")
 LANGUAGE = LANG_EN if LANGUAGE_CODE == "en-US" else LANG_ZH
 
-# Global transcript capture storage (shared across sessions in same process)
-_global_transcript_history = []
-_global_last_transcript = [None]
-
-# Apply monkey-patch at module level (before LiveKit initializes)
-_livekit_logger = logging.getLogger("livekit.agents")
-_original_livekit_logger_debug = _livekit_logger.debug
-_livekit_logger.debug = _patched_debug
-print("[avatar_agent] 🐵 Monkey-patched livekit.agents logger.debug()")
+LIVEKIT_URL = os.getenv("LIVEKIT_URL")
+LIVEKIT_API_KEY = os.getenv("LIVEKIT_API_KEY")
+LIVEKIT_API_SECRET = os.getenv("LIVEKIT_API_SECRET")
+
+# Worker mode: seconds to wait for a user to join before giving up on a room
+AVATAR_JOIN_TIMEOUT = float(os.getenv("AVATAR_JOIN_TIMEOUT", "300"))
+# How long a session waits for the memory context the server prefetches in /join-room
+MEMORY_HANDOFF_TIMEOUT = float(os.getenv("MEMORY_HANDOFF_TIMEOUT", "3"))
+# Session transcripts are saved to memory in chunks while the session runs:
+# once this many characters are unsaved, and at least every flush interval
+TRANSCRIPT_FLUSH_CHARS = int(os.getenv("TRANSCRIPT_FLUSH_CHARS", "4000"))
+TRANSCRIPT_FLUSH_SECONDS = float(os.getenv("TRANSCRIPT_FLUSH_SECONDS", "300"))
+# Unsaved turns a session keeps if writes fall behind (oldest are dropped first)
+TRANSCRIPT_BUFFER_TURNS = int(os.getenv("TRANSCRIPT_BUFFER_TURNS", "500"))
+# Chunks are compacted before they are saved (filler and repeats dropped); with a
+# budget, each chunk is also shrunk to that many estimated tokens (0: no budget)
+TRANSCRIPT_TOKEN_BUDGET = int(os.getenv("TRANSCRIPT_TOKEN_BUDGET", "0"))
+
+
+# LiveKit plugins the session pipeline uses, by role. They are imported when a
+# process is about to run sessions (load_pipeline_plugins), not with this
+# module, so importing avatar_agent stays cheap (see bench_import_time.py).
+PIPELINE_PLUGINS = {"llm": "google", "stt": "deepgram", "tts": "openai", "avatar": "tavus"}
+
+
+def load_plugin(name: str):
+    """Import livekit.plugins.<name> (cached by the import system after the first call)."""
+    return importlib.import_module(f"livekit.plugins.{name}")
+
+
+def load_pipeline_plugins() -> None:
+    """
+    Import the pipeline's plugins up front.
+
+    LiveKit plugins register themselves on import and must do so on the main
+    thread, so this runs at process start rather than inside a session.
+    """
+    for name in sorted(set(PIPELINE_PLUGINS.values())):
+        load_plugin(name)
+    print(f"[avatar_agent] 🔌 Loaded plugins: {', '.join(sorted(set(PIPELINE_PLUGINS.values())))}")
+
+
+def build_plugins(language: str) -> Dict:
+    """LLM/STT/TTS plugins for a session; they don't depend on memory, so they are built while it loads."""
+    is_chinese = language == "cmn-CN"
+    google = load_plugin(PIPELINE_PLUGINS["llm"])
+    deepgram = load_plugin(PIPELINE_PLUGINS["stt"])
+    openai = load_plugin(PIPELINE_PLUGINS["tts"])
+    return {
+        "llm": google.LLM(model="gemini-2.0-flash-exp", temperature=0.8),
+        "stt": deepgram.STT(
+            model="nova-2-general" if is_chinese else "nova-3",  # nova-2 supports Chinese
+            language="zh-CN" if is_chinese else "en-US",
+        ),
+        "tts": openai.TTS(voice="nova"),  # Supports both English and Chinese
+    }
 
 
 class VideoAssistant(Agent):
-    def __init__(self, memory_context: str = "", memory_service=None, user_name: str = None, language: str = "en-US") -> None:
+    def __init__(
+        self,
+        memory_context: str = "",
+        memory_service=None,
+        user_name: str = None,
+        language: str = "en-US",
+        plugins: Optional[Dict] = None,
+    ) -> None:
         # Store memory service and user_name for runtime use
         self.memory_service = memory_service
         self.user_name = user_name
@@ -87,173 +119,52 @@ class VideoAssistant(Agent):
         self.last_user_transcript = ""
         self.last_agent_transcript = ""
         
-        # Determine if Chinese or English
-        is_chinese = language == "cmn-CN"
-        
-        # Build instructions with memory context if available
-        memory_instructions = ""
-        if memory_context:
-            memory_instructions = f"""
-            
-            ---
-            
-            # IMPORTANT: Previous Conversation Context
-            You have had previous study sessions with this user. Here's what you remember:
-            
-            {memory_context}
-            
-            **In your FIRST response**, acknowledge that you remember them by mentioning you've studied together before. Be specific if possible (e.g., "Good to see you again! Last time we were looking at algebra together").
-            
-            Use this context throughout the conversation naturally. Build on previous topics when relevant.
-            
-            ---
-            """
+        # Prompt compiled once per language; the memory section is capped
+        instructions, self.prompt_stats = build_instructions(language, memory_context)
         
         super().__init__(
-            instructions = f"""
-            You are StudyMate, a real-time, voice-first Study Partner for a student.
-            {'你是 StudyMate，一个实时的、以语音为主的学习伙伴。' if is_chinese else ''}
-            
-            {'🌐 语言: 全程使用中文（普通话）交流。自然、温暖、支持的语气。' if is_chinese else '🌐 Language: Communicate entirely in English. Natural, warm, supportive tone.'}
-            
-            {memory_instructions}
+            instructions=instructions,
+            **(plugins or build_plugins(language)),
+        )
 
-            You operate on two main tracks:
-            (1) SUPPORT — counselling and emotional reassurance when the user seems worried, demotivated, or in a low mood.
-            (2) ACADEMICS — providing study advice, concept explanations, and effective learning techniques.
+# Write-behind queue for this process's memory writes; see get_memory_spool()
+_memory_spool: Optional[MemorySpool] = None
 
-            ---
 
-            # Core Persona
-            - Warm, steady, genuine — speak like a calm, caring friend.
-            - Prioritize emotional safety and small wins.
-            - Use natural voice pacing: 1–3 short sentences, then pause.
-            - Match user tone and language (English ↔ Chinese).
-            - Ask at most ONE question per turn.
+def get_memory_spool(memory_service) -> MemorySpool:
+    """The process's memory write spool, with its drainer started on first use."""
+    global _memory_spool
+    if _memory_spool is None:
+        _memory_spool = MemorySpool()
+        _memory_spool.start(memory_service)
+    return _memory_spool
 
-            ---
 
-            # Session Start
-            - First line: greet warmly in one sentence.
-            - Then ask: “Quick check—focus on studies, or talk a bit first?”
-            - Wait for the user’s choice.  
-            If silence >4s: say once, “We can do focus or unwind. You choose.”
+async def stop_memory_spool() -> None:
+    """Give spooled writes a last chance to go out before the process exits."""
+    if _memory_spool is not None:
+        await _memory_spool.stop()
 
-            ---
 
-            # SUPPORT TRACK (Counselling)
-            When the user sounds tense, down, or uncertain, switch gently into SUPPORT mode.  
-            Your goal is not to fix the problem, but to **help them think clearly and feel seen.**
+async def init_memory_service(user_name: Optional[str]):
+    """Get the async memory service for a session, or None if memory is unavailable."""
+    if MEMORY_ENABLED and user_name:
+        try:
+            memory_service = await get_async_memory_service()
+            print(f"[avatar_agent] 🧠 Memory enabled for user: {user_name}")
+            return memory_service
+        except Exception as e:
+            print(f"[avatar_agent] ⚠️ Could not initialize memory service: {e}")
+            return None
+    else:
+        print(f"[avatar_agent] ⚠️ Memory disabled (MEMORY_ENABLED={MEMORY_ENABLED}, user_name={bool(user_name)})")
+        return None
 
-            Use **two main counselling tools** — Acknowledgement and Cognitive Reframe — naturally throughout conversation.
 
-            ### 1. {'认可与共情' if is_chinese else 'Acknowledgement'}
-            {'''用同理心接纳用户，不要过度分析。
-            - 倾听情绪信号（例如："我跟不上了"）
-            - 用一句简短、自然的话反映他们的感受。
-            
-            示例：
-            - "听起来确实很让人沮丧。"
-            - "我明白 —— 努力了却感觉卡住了，真的很难受。"
-            - "任何人在你的处境都会有同样的感受。"''' if is_chinese else '''Show empathy and acceptance without overanalyzing.  
-            - Listen for emotional cues (e.g., "I'm so behind")
-            - Reflect what they feel in one short, natural sentence.  
-            
-            Examples:
-            - "That sounds really frustrating."  
-            - "I get it — it's hard when you're trying but it feels stuck."  
-            - "Anyone in your shoes would feel the same."'''}
-
-            ### 2. {'认知重构' if is_chinese else 'Cognitive Reframe'}
-            {'''在认可之后，温和地提供一个新的视角 —— 绝不轻视，始终温柔。
-            - 关注 **可控的事情** 和 **已经做对的事情**。
-            - 保持简洁和可信。
-
-            示例：
-            - "你不是在失败 —— 只是在学习的过程中。"
-            - "不是你无法集中注意力 —— 是你的大脑累了。我们一起重新开始吧。"
-            - "落后不代表追不上。你已经意识到了，这就是开始。"
-
-            指导原则：
-            - 不要说"别担心"或"你没事" —— 用共情 + 重构代替
-            - 在重构后提供 *一个* 可行的下一步''' if is_chinese else '''After acknowledging, offer a small shift in perspective — never dismissive, always gentle.
-            - Focus on what's **within control** and **what's already done right**.
-            - Keep it concise and believable.
-
-            Examples:
-            - "You're not failing — you're just in the middle of learning."  
-            - "It's not that you can't focus — your brain's just tired. Let's reset together."  
-            - "Falling behind doesn't mean you can't catch up. You've already started by noticing it."
-
-            Guidelines:
-            - Do not say "don't worry" or "you're fine" - use empathy + reframe instead
-            - Offer *one actionable next step* after reframing'''}
-
-            ### Optional Third Technique — Gentle Direction
-            If the user stays quiet or withdrawn:
-            - Invite without pressure:  
-            - “We can take this slow. Want me to just talk for a bit?”  
-            - “You don’t have to fix everything now — small steps count.”
-
-            ---
-
-            # ACADEMICS TRACK (Study Focus)
-            When user chooses to focus, act as a smart study coach.
-
-            1. Start with a **tiny plan:** Goal → Approach → Timebox → First Step.  
-            - “Goal: finish one concept. Let’s review it for 5 minutes.”
-
-            2. Focus on **three proven study techniques:**
-            - **Active Recall:** Ask short recall questions. “Try saying the formula aloud before I show it.”
-            - **Pomodoro Planning:** Encourage brief, timed focus sessions. “Let’s do 20 minutes, then a 3-minute stretch.”
-            - **Interleaving:** Connect related topics. “This pattern also appears in energy equations — let’s link them.”
-
-            3. Keep responses concise, positive, and step-based.  
-            - 1 hint → pause → explanation → recap (3 bullets: What / Key Idea / Next Step).  
-            - Close each turn with a clear action:  
-                “Your turn — say the next step out loud.”
-
-            ---
-
-            # Conversation Hygiene
-            - Speak with one idea per turn.
-            - {'如果听不清楚，说："不好意思，能再说一遍吗？"' if is_chinese else 'If unclear audio: "Sorry, could you repeat that?"'}
-
-            ---
-
-            # Safety and Boundaries
-            - Do not help with cheating or graded tests.
-            - If user expresses harm or hopelessness:  
-            “That sounds really heavy. You deserve support from someone right now — please talk to someone you trust or reach local helplines.”  
-            Then stay calm and grounded.
-            - Respect privacy and avoid remembering sensitive details.
-
-            ---
-
-            # Style and Flow
-            - Compact, natural, emotionally intelligent.  
-            - Prioritize *listening first, then responding briefly*.  
-            - Use empathy + insight instead of textbook positivity.  
-            - {'温暖、尊重的语气，自然的表达（不要太正式）' if is_chinese else 'Casual, friendly, supportive tone'}
-
-            ---
-
-            {'# 示例开场白（中文）' if is_chinese else '# Example openings (English)'}
-            {'''- "嗨，又见面了！快速问一下 —— 想专注学习，还是先聊聊天？"
-            - If "chat": "没问题。今天过得怎么样，有什么想说的吗？"
-            - If "focus": "好的，一步一步来。我们来做个小计划吧。"''' if is_chinese else '''- "Hey, nice to see you again. Quick check — focus on studies, or chat first?"
-            - If "chat": "That's fine. Sounds like it's been a day — what's been on your mind?"
-            - If "focus": "Alright, one topic at a time. Let's make a quick plan."'''}
-
-            {'现在开始：用一句话温暖地问候用户。保持自然和欢迎的态度。等待用户回应后再继续。' if is_chinese else 'Act now: greet warmly in one sentence. Keep it natural and welcoming. Do nothing else until user responds.'}
-            """,
-            llm=google.LLM(model="gemini-2.0-flash-exp", temperature=0.8),
-            stt=deepgram.STT(
-                model="nova-2-general" if is_chinese else "nova-3",  # nova-2 supports Chinese
-                language="zh-CN" if is_chinese else "en-US",
-            ),
-            tts=openai.TTS(voice="nova"),  # Supports both English and Chinese
-        )
+def is_agent_identity(identity: str) -> bool:
+    """True for the avatar/agent participants we put in the room ourselves."""
+    return identity.startswith("tavus-") or identity.startswith("ai-assistant-") or identity.startswith("agent-")
+
 
 async def entrypoint(ctx: agents.JobContext):
     room_name = getattr(ctx, 'room', None)
@@ -268,49 +179,142 @@ async def entrypoint(ctx: agents.JobContext):
     else:
         print(f"[avatar_agent] OpenAI API key loaded: {OPENAI_API_KEY[:5]}...")
     
-    # Initialize memory service if enabled
-    memory_service = None
+    # Load memory while connecting to the room
     user_name = USER_DISPLAY_NAME or None
+    # TRACE_ID ties this run's startup timeline to the request that launched it
+    timeline = StartupTimeline(trace_id=os.getenv("TRACE_ID") or None)
+    memory = asyncio.create_task(prepare_memory(user_name, LANGUAGE_CODE, timeline=timeline))
     
-    if MEMORY_ENABLED and user_name:
-        try:
-            memory_service = get_memory_service()
-            print(f"[avatar_agent] 🧠 Memory enabled for user: {user_name}")
-        except Exception as e:
-            print(f"[avatar_agent] ⚠️ Could not initialize memory service: {e}")
-            memory_service = None
-    else:
-        print(f"[avatar_agent] ⚠️ Memory disabled (MEMORY_ENABLED={MEMORY_ENABLED}, user_name={bool(user_name)})")
-    
-    await ctx.connect()
+    stats = RoomStats(ctx.room)
+    with timeline.phase("room_connect"):
+        await ctx.connect()
     print("[avatar_agent] connected")
+    stats.sync()
 
-    # Retrieve relevant memories for context
-    memory_context = ""
-    if memory_service and user_name:
+    async def log_room_stats():
+        print(f"[avatar_agent] 📊 Room stats: {stats.snapshot()}")
+
+    ctx.add_shutdown_callback(log_room_stats)
+    try:
+        await run_session(
+            ctx.room, language_code=LANGUAGE_CODE, user_name=user_name, memory=memory, timeline=timeline,
+            on_shutdown=ctx.add_shutdown_callback,
+        )
+    finally:
+        # Shutdown callbacks run in order: the transcript is spooled before the spool stops
+        ctx.add_shutdown_callback(stop_memory_spool)
+
+
+async def prepare_memory(
+    user_name: Optional[str],
+    language_code: str,
+    prefetched_memory: Optional[asyncio.Future] = None,
+    timeline: Optional[StartupTimeline] = None,
+) -> Tuple[Optional[object], str]:
+    """
+    Get a session's memory service and memory context.
+
+    Service setup and the wait for the context the server prefetched in
+    /join-room run concurrently; memories are only fetched here if that
+    handoff doesn't arrive in time.
+
+    Args:
+        user_name: User display name for memory
+        language_code: Session language, used to rank memories
+        prefetched_memory: Future for the memory context handed over by the server
+        timeline: Startup timeline the phases are recorded on
+
+    Returns:
+        (memory service or None, memory context or "")
+    """
+    timeline = timeline or StartupTimeline()
+    service_task = asyncio.create_task(timeline.run("memory_service", init_memory_service(user_name)))
+
+    # Use the memory context the server prefetched, if it arrives in time
+    memory_context = None
+    if prefetched_memory is not None and user_name:
         try:
-            # Get recent memories for this user
-            memories = memory_service.get_all_memories(user_name)
-            if memories:
-                # Convert to list if needed and get last 10
-                if isinstance(memories, list):
-                    recent_memories = memories[-10:] if len(memories) > 10 else memories
+            with timeline.phase("memory_handoff"):
+                memory_context = await asyncio.wait_for(asyncio.shield(prefetched_memory), timeout=MEMORY_HANDOFF_TIMEOUT)
+            if memory_context is not None:
+                print(f"[avatar_agent] 📚 Using memory context prefetched by the server ({len(memory_context)} chars)")
+        except asyncio.TimeoutError:
+            print(f"[avatar_agent] ⏱️ Prefetched memory not ready after {MEMORY_HANDOFF_TIMEOUT}s, fetching it here")
+
+    memory_service = await service_task
+
+    # Otherwise retrieve relevant memories for context
+    if memory_context is None:
+        memory_context = ""
+        if memory_service and user_name:
+            try:
+                with timeline.phase("memory_fetch"):
+                    # Search for the memories a study session needs instead of downloading all of them
+                    memories = await memory_service.get_relevant_memories(
+                        user_name, session_query(language_code), limit=MEMORY_CANDIDATES,
+                    )
+                if memories:
+                    # Keep the memories most relevant to the session, recency and
+                    # session language, within the prompt's token budget
+                    selected_memories = rank_memories(list(memories), language=language_code)
+                    
+                    memory_context = memory_service.format_memories_for_context(selected_memories)
+                    print(f"[avatar_agent] 📚 Selected {len(selected_memories)} of {len(memories)} memories for context")
                 else:
-                    # If it's a dict or other type, convert to list
-                    recent_memories = list(memories)[-10:] if len(list(memories)) > 10 else list(memories)
-                
-                memory_context = memory_service.format_memories_for_context(recent_memories)
-                print(f"[avatar_agent] 📚 Loaded {len(memories)} memories for context")
-            else:
-                print("[avatar_agent] 📭 No previous memories found")
-        except Exception as e:
-            print(f"[avatar_agent] ⚠️ Error loading memories: {e}")
-            import traceback
-            print(f"[avatar_agent] Memory error traceback: {traceback.format_exc()}")
-    
+                    print("[avatar_agent] 📭 No previous memories found")
+            except Exception as e:
+                print(f"[avatar_agent] ⚠️ Error loading memories: {e}")
+                import traceback
+                print(f"[avatar_agent] Memory error traceback: {traceback.format_exc()}")
+
+    return memory_service, memory_context
+
+
+async def run_session(
+    room: rtc.Room,
+    language_code: str = LANG_EN,
+    user_name: Optional[str] = None,
+    memory: Optional[asyncio.Task] = None,
+    timeline: Optional[StartupTimeline] = None,
+    on_shutdown: Optional[Callable[[Callable[[], Awaitable[None]]], None]] = None,
+) -> Optional[AgentSession]:
+    """
+    Start the AI agent and Tavus avatar in an already-connected room.
+
+    All per-session state lives in this call, so a worker process can run
+    many sessions concurrently on one event loop.
+
+    Startup overlaps everything that doesn't depend on memory: the Tavus
+    avatar starts and the plugins are built while the memory context loads;
+    only the agent session itself waits for it.
+
+    Args:
+        room: Connected LiveKit room
+        language_code: Language code for the AI assistant
+        user_name: User display name for memory
+        memory: Task from prepare_memory(), ideally started before the room
+            connect; started here if None
+        timeline: Startup timeline the phases are recorded on
+        on_shutdown: Registers a coroutine function the caller awaits before
+            leaving the room (saves the rest of the transcript)
+
+    Returns:
+        The running AgentSession, or None if the session failed to start
+    """
+    room_name = room.name
+    timeline = timeline or StartupTimeline()
+    if memory is None:
+        memory = asyncio.create_task(prepare_memory(user_name, language_code, timeline=timeline))
+
     # Create the AI agent session with memory context
     session = AgentSession()
     print("[avatar_agent] created AI agent session")
+
+    @session.on("agent_state_changed")
+    def on_agent_state_changed(event):
+        # The first time the agent speaks is the end of join-to-greeting
+        if event.new_state == "speaking":
+            timeline.mark("first_words")
     # session = AgentSession(
     #     stt=openai.STT(
     #         api_key=OPENAI_API_KEY,
@@ -332,6 +336,7 @@ async def entrypoint(ctx: agents.JobContext):
     # Create Tavus avatar session for visual representation
     # Use unique identity to avoid stuck session issues
     avatar_identity = f"ai-assistant-{uuid.uuid4().hex[:8]}"
+    tavus = load_plugin(PIPELINE_PLUGINS["avatar"])
     avatar = tavus.AvatarSession(
         api_key=TAVUS_API_KEY,
         replica_id=TAVUS_REPLICA_ID,
@@ -341,12 +346,23 @@ async def entrypoint(ctx: agents.JobContext):
     print("[avatar_agent] created Tavus avatar session")
     print(f"[avatar_agent] Tavus config: replica_id={TAVUS_REPLICA_ID}, persona_id={TAVUS_PERSONA_ID}")
 
-    # Start both avatar and session in parallel for faster initialization
-    print(f"[avatar_agent] starting Tavus avatar and AI session in parallel for room: {room_name}")
+    # Transcript capture from the session's own events: every committed user
+    # and assistant turn, nothing on the logging path
+    transcript_buffer = TranscriptBuffer(max_turns=TRANSCRIPT_BUFFER_TURNS, flush_chars=TRANSCRIPT_FLUSH_CHARS)
+
+    @session.on("conversation_item_added")
+    def on_conversation_item_added(event):
+        item = event.item
+        if item.role in ("user", "assistant") and item.text_content:
+            transcript_buffer.add(item.role, item.text_content)
+
+    # Start the avatar right away; it doesn't need memory or the agent
+    print(f"[avatar_agent] starting Tavus avatar while the AI session is prepared for room: {room_name}")
     
     async def start_tavus_avatar():
         try:
-            await avatar.start(session, room=ctx.room)
+            with timeline.phase("tavus_start"):
+                await avatar.start(session, room=room)
             print("[avatar_agent] ✅ Tavus avatar started successfully")
             return True
         except Exception as e:
@@ -355,11 +371,12 @@ async def entrypoint(ctx: agents.JobContext):
             print(f"[avatar_agent] Tavus error traceback: {traceback.format_exc()}")
             return False
 
-    # Clear global transcript history for this session
-    global _global_transcript_history, _global_last_transcript
-    _global_transcript_history.clear()
-    _global_last_transcript[0] = None
-    print(f"[avatar_agent] 🐵 Using monkey-patched logger for transcript capture")
+    tavus_task = asyncio.create_task(start_tavus_avatar())
+
+    # Build the plugins while memory loads, then wait for the memory context
+    with timeline.phase("plugins"):
+        plugins = build_plugins(language_code)
+    memory_service, memory_context = await memory
     
     async def start_ai_session():
         try:
@@ -368,18 +385,23 @@ async def entrypoint(ctx: agents.JobContext):
                 memory_context=memory_context,
                 memory_service=memory_service,
                 user_name=user_name,
-                language=LANGUAGE_CODE  # Pass the language from environment
+                language=language_code,
+                plugins=plugins,
             )
+            timeline.note(prompt=agent.prompt_stats)
+            print(f"[avatar_agent] 📝 Prompt: ~{agent.prompt_stats['prompt_tokens']} tokens "
+                  f"({agent.prompt_stats['memory_tokens']} memory{', truncated' if agent.prompt_stats['memory_truncated'] else ''})")
             
-            await session.start(
+            with timeline.phase("session_start"):
+                await session.start(
                 agent=agent,
-                room=ctx.room,
-                room_input_options=RoomInputOptions(
-                    video_enabled=True,
-                ),
-            )
+                    room=room,
+                    room_input_options=RoomInputOptions(
+                        video_enabled=True,
+                    ),
+                )
             
-            print("[avatar_agent] ✅ AI agent session started with monkey-patched transcript capture")
+            print("[avatar_agent] ✅ AI agent session started with transcript capture")
             return True
         except Exception as e:
             print(f"[avatar_agent] ❌ Error starting AI agent session: {e}")
@@ -387,16 +409,14 @@ async def entrypoint(ctx: agents.JobContext):
             print(f"[avatar_agent] Session error traceback: {traceback.format_exc()}")
             return False
 
-    # Run both initialization processes in parallel
-    tavus_task = asyncio.create_task(start_tavus_avatar())
-    session_task = asyncio.create_task(start_ai_session())
-    
-    # Wait for both to complete
-    tavus_success, session_success = await asyncio.gather(tavus_task, session_task)
+    session_success = await start_ai_session()
+    # The greeting waits for the avatar too, so its first words are seen and heard
+    tavus_success = await tavus_task
     
     if not session_success:
         print("[avatar_agent] ❌ AI session failed to start, exiting")
-        return  # Exit early if session fails to start
+        print(f"[avatar_agent] ⏱️ Startup timeline (trace={timeline.trace_id}): {timeline.summary()}")
+        return None  # Exit early if session fails to start
 
     # Generate initial greeting with comprehensive error handling
     print("[avatar_agent] generating initial greeting...")
@@ -407,9 +427,10 @@ async def entrypoint(ctx: agents.JobContext):
             greeting_instruction += "Remember, you've studied with this user before - acknowledge that naturally! "
         greeting_instruction += "Keep it brief (1-2 sentences). Then wait for their response to detect their language."
         
-        await session.generate_reply(
-            instructions=greeting_instruction
-        )
+        with timeline.phase("greeting"):
+            await session.generate_reply(
+                instructions=greeting_instruction
+            )
         print("[avatar_agent] ✅ Initial greeting sent successfully")
         # Mark that conversation session has started (for memory)
         session_had_conversation = True
@@ -422,7 +443,8 @@ async def entrypoint(ctx: agents.JobContext):
         # Try a simpler approach
         try:
             print("[avatar_agent] Attempting fallback greeting...")
-            await session.say("Hello! I'm your AI assistant. How can I help you today?")
+            with timeline.phase("greeting_fallback"):
+                await session.say("Hello! I'm your AI assistant. How can I help you today?")
             print("[avatar_agent] ✅ Fallback greeting sent")
             # Mark that conversation session has started (for memory)
             session_had_conversation = True
@@ -431,114 +453,335 @@ async def entrypoint(ctx: agents.JobContext):
             print(f"[avatar_agent] Fallback error type: {type(e2).__name__}")
             print(f"[avatar_agent] Fallback traceback: {traceback.format_exc()}")
 
-    # Track if conversation happened (for session summary)
-    # Note: Gemini Live API is audio-to-audio, so we can't get real-time transcripts
-    # We'll just assume conversation happened if the user stayed beyond the greeting
-    
-    # Monitor for audio events
-    async def monitor_audio():
-        while True:
-            await asyncio.sleep(10)  # Check every 10 seconds
-            participants = list(ctx.room.remote_participants.values())
-            print(f"[avatar_agent] Room has {len(participants)} participants:")
-            for p in participants:
-                # RemoteParticipant tracks instead of direct mic/cam attributes
-                audio_tracks = [t for t in p.track_publications.values() if t.kind == "audio"]
-                video_tracks = [t for t in p.track_publications.values() if t.kind == "video"]
-                print(f"  - {p.identity} ({p.name}): audio_tracks={len(audio_tracks)}, video_tracks={len(video_tracks)}")
-    
-    # Start monitoring in background
-    asyncio.create_task(monitor_audio())
-    
-    # Monitor for audio events
-    @ctx.room.on("track_subscribed")
-    def on_track_subscribed(track, publication, participant):
-        print(f"[avatar_agent] Track subscribed: {track.kind} from {participant.identity}")
-        if track.kind == "audio":
-            print(f"[avatar_agent] Audio track received from {participant.identity}")
-            print(f"[avatar_agent] Audio track details: source={track.source}, sid={track.sid}")
-    
-    @ctx.room.on("track_published")
-    def on_track_published(publication, participant):
-        print(f"[avatar_agent] Track published: {publication.kind} from {participant.identity}")
-        if publication.kind == "audio":
-            print(f"[avatar_agent] Audio track published from {participant.identity}")
-            print(f"[avatar_agent] Audio track details: source={publication.source}, sid={publication.sid}")
-    
-    @ctx.room.on("track_unsubscribed")
-    def on_track_unsubscribed(track, publication, participant):
-        print(f"[avatar_agent] Track unsubscribed: {track.kind} from {participant.identity}")
-    
-    # Collect transcripts on disconnect
+    print(f"[avatar_agent] ⏱️ Startup timeline (trace={timeline.trace_id}): {timeline.summary()}")
+
+    # Save the transcript to memory in chunks during the session, and the tail on disconnect.
+    # Chunks go to the on-disk spool, whose drainer sends them to memory in the background.
     if memory_service and user_name:
-        @ctx.room.on("participant_disconnected")
+        spool = get_memory_spool(memory_service)
+
+        async def write_chunk(text: str) -> bool:
+            await spool.enqueue(user_name, text)  # mem0 only interprets user messages
+            return True
+
+        streamer = TranscriptStreamer(
+            transcript_buffer,
+            write_chunk,
+            title=f"Study session on {datetime.now().strftime('%Y-%m-%d %H:%M')}",
+            interval=TRANSCRIPT_FLUSH_SECONDS,
+            compactor=TranscriptCompactor(token_budget=TRANSCRIPT_TOKEN_BUDGET),
+        )
+        flush_task = asyncio.create_task(streamer.run())
+        saving: Optional[asyncio.Task] = None
+
+        def save_rest() -> asyncio.Task:
+            """Stop the periodic flushes and save what's left, once per session."""
+            nonlocal saving
+            if saving is None:
+                flush_task.cancel()
+                print(f"[avatar_agent] 🔄 Saving the last {len(transcript_buffer)} of {transcript_buffer.turns} transcript segments")
+                saving = asyncio.create_task(save_transcript())
+            return saving
+
+        async def save_transcript():
+            if transcript_buffer.turns > 0:
+                await streamer.flush()
+                print(f"[avatar_agent] 💾 Transcript spooled in {streamer.chunks} parts ({streamer.saved_chars} chars, {transcript_buffer.dropped} turns dropped)")
+                print(f"[avatar_agent] 🗜️ Transcript compaction: {streamer.compactor.stats()}")
+            else:
+                # Fallback: nothing was transcribed, so save a session marker
+                try:
+                    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    session_note = f"Study session at {timestamp}. Had an interactive educational conversation about general study topics."
+                    await spool.enqueue(user_name, session_note)  # Put all info in user_message for mem0 to interpret
+                    print(f"[avatar_agent] 💾 Spooled session marker: '{session_note[:80]}...'")
+                except Exception as e:
+                    print(f"[avatar_agent] ⚠️ Error saving session marker: {e}")
+
+        @room.on("participant_disconnected")
         def on_user_left(participant):
-            """When user disconnects, summarize conversation and save to memory"""
-            if participant.identity != avatar_identity and not participant.identity.startswith("tavus-"):
-                print(f"[avatar_agent] 🔄 User left - processing transcript history...")
-                print(f"[avatar_agent] 📊 Transcript buffer has {len(_global_transcript_history)} segments")
-                
-                async def save_transcript():
-                    if len(_global_transcript_history) > 0:
-                        try:
-                            # Combine all transcripts - send raw to mem0 for extraction
-                            full_conversation = "\n".join(_global_transcript_history)
-                            print(f"[avatar_agent] 📝 Captured {len(_global_transcript_history)} transcript segments")
-                            
-                            # Save raw transcript to memory (mem0 will do the extraction)
-                            import datetime
-                            timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M')
-                            
-                            memory_service.add_conversation_turn(
-                                user_id=user_name,
-                                user_message=f"Study session on {timestamp}:\n\n{full_conversation}",
-                                assistant_message=""  # Empty as mem0 only interprets user messages
-                            )
-                            print(f"[avatar_agent] 💾 Saved raw transcript to memory ({len(full_conversation)} chars)")
-                            
-                        except Exception as e:
-                            print(f"[avatar_agent] ⚠️ Error saving transcript: {e}")
-                            import traceback
-                            print(traceback.format_exc())
-                    else:
-                        # Fallback: If no transcripts captured via summarization, save session with last known info
-                        try:
-                            import datetime
-                            import random
-                            timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                            
-                            # Make memory unique by including timestamp and random element
-                            session_id = f"session_{int(datetime.datetime.now().timestamp())}"
-                            
-                            # Build session note with available information
-                            if _global_last_transcript[0]:
-                                # Use last thing user said
-                                session_note = f"Study session at {timestamp}. User asked about: {_global_last_transcript[0][:150]}. Had an interactive educational conversation."
-                            else:
-                                session_note = f"Study session at {timestamp}. Had an interactive educational conversation about general study topics."
-                            
-                            memory_service.add_conversation_turn(
-                                user_id=user_name,
-                                user_message=session_note,  # Put all info in user_message for mem0 to interpret
-                                assistant_message=""  # Empty as mem0 only interprets user messages
-                            )
-                            print(f"[avatar_agent] 💾 Saved session marker: '{session_note[:80]}...'")
-                        except Exception as e:
-                            print(f"[avatar_agent] ⚠️ Error saving session marker: {e}")
-                
-                # Run async task
-                asyncio.create_task(save_transcript())
-        
+            """When the last user disconnects, save the rest of the transcript to memory"""
+            users_left = any(not is_agent_identity(p.identity) for p in room.remote_participants.values())
+            if not is_agent_identity(participant.identity) and not users_left:
+                save_rest()  # Only a local disk append; the drainer sends it to memory
+
+        async def finish_transcript():
+            # The room can also end without the user leaving first (stop_room,
+            # release, join timeout, shutdown); the tail is saved either way
+            await asyncio.shield(save_rest())
+
+        if on_shutdown:
+            on_shutdown(finish_transcript)
     
     print("[avatar_agent] ✅ Session active - LiveKit will handle lifecycle")
     print(f"[avatar_agent] Memory capture hooks registered for user: {user_name or 'none'}")
+    return session
+
+
+# ============= Worker mode =============
+# `python avatar_agent.py worker --ipc HOST:PORT --worker-id ID`
+# A long-lived process that hosts many rooms on one event loop. The server's
+# AvatarWorkerPool hands rooms to it over a JSON-lines socket (see avatar_pool.py).
+
+def mint_agent_token(room_name: str, identity: str) -> str:
+    """Mint a LiveKit token for the agent participant in worker mode."""
+    grants = api.VideoGrants(
+        room_join=True,
+        room=room_name,
+        agent=True,
+    )
+    return (
+        api.AccessToken(LIVEKIT_API_KEY, LIVEKIT_API_SECRET)
+        .with_identity(identity)
+        .with_name("AI Assistant")
+        .with_grants(grants)
+        .to_jwt()
+    )
+
+
+async def host_room(
+    room_name: str,
+    language_code: str,
+    user_name: Optional[str],
+    on_running=None,
+    prefetched_memory: Optional[asyncio.Future] = None,
+    trace_id: Optional[str] = None,
+    room_stats: Optional[Dict[str, RoomStats]] = None,
+) -> str:
+    """
+    Join a room, run the agent session and wait until the user has left.
+
+    Args:
+        room_name: LiveKit room to join
+        language_code: Language code for the AI assistant
+        user_name: User display name for memory
+        on_running: Optional coroutine function awaited with the startup
+            timeline (a dict) once the session is live
+        prefetched_memory: Future for the memory context handed over by the server
+        trace_id: Trace started by the server's /join-room
+        room_stats: Registry the room's RoomStats is added to while it is hosted
+
+    Returns:
+        Reason the room ended
+    """
+    room = rtc.Room()
+    stats = RoomStats(room)
+    if room_stats is not None:
+        room_stats[room_name] = stats
+    finished = asyncio.Event()
+    seen_user = asyncio.Event()
+    session = None
+    shutdown_hooks: List[Callable[[], Awaitable[None]]] = []
+
+    def remaining_users() -> int:
+        return sum(1 for p in room.remote_participants.values() if not is_agent_identity(p.identity))
+
+    @room.on("participant_connected")
+    def on_participant_connected(participant):
+        if not is_agent_identity(participant.identity):
+            seen_user.set()
+
+    @room.on("participant_disconnected")
+    def on_participant_disconnected(participant):
+        if not is_agent_identity(participant.identity) and remaining_users() == 0:
+            finished.set()
+
+    @room.on("disconnected")
+    def on_disconnected(*_):
+        finished.set()
+
+    # Memory loads while the room connects
+    timeline = StartupTimeline(trace_id)
+    memory = asyncio.create_task(prepare_memory(user_name, language_code, prefetched_memory, timeline))
+
+    try:
+        with timeline.phase("room_connect"):
+            await room.connect(LIVEKIT_URL, mint_agent_token(room_name, f"agent-{uuid.uuid4().hex[:8]}"))
+        print(f"[avatar_agent] connected to room={room_name}")
+        stats.sync()
+        if remaining_users() > 0:
+            seen_user.set()
+
+        session = await run_session(
+            room,
+            language_code=language_code,
+            user_name=user_name,
+            memory=memory,
+            timeline=timeline,
+            on_shutdown=shutdown_hooks.append,
+        )
+        if session is None:
+            return "session_failed"
+        if on_running:
+            await on_running(timeline.to_dict())
+
+        try:
+            await asyncio.wait_for(seen_user.wait(), timeout=AVATAR_JOIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            return "join_timeout"
+
+        await finished.wait()
+        return "user_left"
+    finally:
+        if not memory.done():
+            memory.cancel()
+        if session is not None:
+            try:
+                await session.aclose()
+            except Exception as e:
+                print(f"[avatar_agent] ⚠️ Error closing session for room {room_name}: {e}")
+        # Save the transcript tail however the room ended (user left, stop_room, timeout, shutdown)
+        for hook in shutdown_hooks:
+            try:
+                await hook()
+            except Exception as e:
+                print(f"[avatar_agent] ⚠️ Error finishing room {room_name}: {e}")
+        await room.disconnect()
+        if room_stats is not None:
+            room_stats.pop(room_name, None)
+        print(f"[avatar_agent] left room={room_name}; room stats: {stats.snapshot()}")
+
+
+async def run_worker(ipc_address: str, worker_id: str) -> None:
+    """Connect to the server's avatar pool and host the rooms it hands us."""
+    host, port = ipc_address.rsplit(":", 1)
+    reader, writer = await asyncio.open_connection(host, int(port))
+    sessions: Dict[str, asyncio.Task] = {}
+    memory_handoffs: Dict[str, asyncio.Future] = {}  # {room: memory context prefetched by the server}
+    room_stats: Dict[str, RoomStats] = {}
+    send_lock = asyncio.Lock()
+
+    async def send(message: Dict) -> None:
+        async with send_lock:
+            writer.write(json.dumps(message).encode() + b"\n")
+            await writer.drain()
+
+    async def run_room(
+        room_name: str, assignment_id: str, language_code: str, user_name: Optional[str], trace_id: Optional[str],
+    ) -> None:
+        try:
+            reason = await host_room(
+                room_name, language_code, user_name,
+                on_running=lambda timeline: send({
+                    "event": "room_running", "room": room_name, "assignment_id": assignment_id, "timeline": timeline,
+                }),
+                prefetched_memory=memory_handoffs.get(room_name),
+                trace_id=trace_id,
+                room_stats=room_stats,
+            )
+        except asyncio.CancelledError:
+            reason = "stopped"
+        except Exception as e:
+            print(f"[avatar_agent] ❌ Room {room_name} crashed: {e}")
+            import traceback
+            print(traceback.format_exc())
+            reason = f"error: {e}"
+        finally:
+            sessions.pop(room_name, None)
+            memory_handoffs.pop(room_name, None)
+        try:
+            await send({"event": "room_ended", "room": room_name, "assignment_id": assignment_id, "reason": reason})
+        except Exception as e:
+            print(f"[avatar_agent] ⚠️ Could not report end of room {room_name}: {e}")
+
+    async def send_room_stats(request_id, stats: RoomStats) -> None:
+        try:
+            snapshot = stats.snapshot()
+            snapshot["bitrate_kbps"] = await stats.bitrates()
+            await send({"id": request_id, "ok": True, "stats": snapshot})
+        except Exception as e:
+            print(f"[avatar_agent] ⚠️ Could not send room stats: {e}")
+
+    await send({
+        "worker_id": worker_id,
+        "pid": os.getpid(),
+        "secret": os.getenv("AVATAR_IPC_SECRET", ""),
+    })
+    print(f"[avatar_agent] 👷 Worker {worker_id} ready (pid={os.getpid()})")
+
+    # Start the memory spool's drainer now, so writes left by an exited worker go out promptly
+    if MEMORY_ENABLED:
+        try:
+            get_memory_spool(await get_async_memory_service())
+        except Exception as e:
+            print(f"[avatar_agent] ⚠️ Memory spool not started: {e}")
+
+    while True:
+        line = await reader.readline()
+        if not line:
+            break  # Server went away
+
+        message = json.loads(line)
+        op = message.get("op")
+        reply = {"id": message.get("id"), "ok": True}
+
+        if op == "start_room":
+            room_name = message["room"]
+            if room_name not in sessions:
+                language_code = message.get("language") or LANG_EN
+                user_name = message.get("display_name") or None
+                trace_id = message.get("trace_id")
+                print(f"[avatar_agent] starting for room={room_name}, language={language_code}, user={user_name or 'None'}, trace={trace_id}")
+                # The server may send the memory context now, later (room_memory), or not at all
+                if "memory_context" in message or message.get("memory_pending"):
+                    handoff = asyncio.get_running_loop().create_future()
+                    if "memory_context" in message:
+                        handoff.set_result(message["memory_context"])
+                    memory_handoffs[room_name] = handoff
+                sessions[room_name] = asyncio.create_task(
+                    run_room(room_name, message.get("assignment_id"), language_code, user_name, trace_id)
+                )
+        elif op == "room_memory":
+            handoff = memory_handoffs.get(message.get("room"))
+            if handoff and not handoff.done():
+                handoff.set_result(message.get("memory_context"))
+        elif op == "stop_room":
+            task = sessions.get(message.get("room"))
+            if task:
+                task.cancel()
+        elif op == "room_stats":
+            stats = room_stats.get(message.get("room"))
+            if stats is None:
+                reply = {"id": message.get("id"), "ok": False, "error": "room not hosted here"}
+            else:
+                # Sampling bitrate awaits WebRTC stats; reply from a task so other ops aren't held up
+                asyncio.create_task(send_room_stats(message.get("id"), stats))
+                continue
+        elif op == "ping":
+            reply["rooms"] = list(sessions)
+        else:
+            reply = {"id": message.get("id"), "ok": False, "error": f"unknown op: {op}"}
+
+        await send(reply)
+
+    print(f"[avatar_agent] Worker {worker_id} lost server connection, shutting down {len(sessions)} room(s)")
+    for task in list(sessions.values()):
+        task.cancel()
+    await asyncio.gather(*sessions.values(), return_exceptions=True)
+    await stop_memory_spool()
+
 
 # 👇 THIS is what enables:  `python avatar_agent.py dev|start|connect --room demo`
+#    plus `python avatar_agent.py worker --ipc HOST:PORT` for the server's worker pool
 if __name__ == "__main__":
-    agents.cli.run_app(agents.WorkerOptions(entrypoint_fnc=entrypoint))
+    if len(sys.argv) > 1 and sys.argv[1] == "worker":
+        parser = argparse.ArgumentParser(prog="avatar_agent.py worker")
+        parser.add_argument("--ipc", required=True, help="HOST:PORT of the server's avatar pool")
+        parser.add_argument("--worker-id", default="w0")
+        args = parser.parse_args(sys.argv[2:])
+
+        if not OPENAI_API_KEY:
+            print("[avatar_agent] WARNING: OPENAI_API_KEY not found in environment variables!")
+        load_pipeline_plugins()
+        asyncio.run(run_worker(args.ipc, args.worker_id))
+    else:
+        agents.cli.run_app(agents.WorkerOptions(
+            entrypoint_fnc=entrypoint,
+            prewarm_fnc=lambda proc: load_pipeline_plugins(),  # job processes load plugins once, at start
+        ))
 
 # you physically run this command: python avatar_agent.py connect --room room-metyln77-lu5x8d
 # However, when we try to "automate it", we need to call this file from server.py, meaning it will look for - if __name__ == "__main__":
 # parses the room name from the command line and passes it to the entrypoint function.
 
-# python avatar_agent.py connect --room test_room - testing in the terminal
\ No newline at end of file
+# python avatar_agent.py connect --room test_room - testing in the terminal
@@ -0,0 +1,599 @@
+"""
+Avatar worker pool for the StudyMate server.
+
+Instead of spawning one `avatar_agent.py connect` process per room, the server
+keeps a small pool of long-lived `avatar_agent.py worker` processes. Each worker
+hosts many rooms concurrently on its own event loop and receives rooms from the
+server over a local JSON-lines socket.
+
+Room lifecycle records are mirrored into the shared state backend, so any
+server worker can answer questions about rooms hosted by another worker's pool.
+"""
+import asyncio
+import json
+import os
+import secrets
+import socket
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from metrics import AVATAR_SPAWN_SECONDS, AVATAR_WORKER_SPAWNS
+from state_backend import StateBackend
+from tracing import Tracer
+
+# Room lifecycle: spawning -> ready -> running -> exited/crashed
+ROOM_SPAWNING = "spawning"  # handed to a worker, waiting for its reply
+ROOM_READY = "ready"        # worker accepted the room and is joining it
+ROOM_RUNNING = "running"    # agent session is live in the room
+ROOM_EXITED = "exited"      # session ended normally or was released
+ROOM_CRASHED = "crashed"    # session failed or its worker died
+
+ACTIVE_ROOM_STATES = (ROOM_SPAWNING, ROOM_READY, ROOM_RUNNING)
+
+# Respawn policy: a worker that dies sooner than this after starting is a
+# "fast failure" (bad env, import error...). Fast failures back off
+# exponentially, and respawning stops after MAX_FAST_FAILURES in a row.
+WORKER_HEALTHY_AFTER = 30  # seconds
+RESPAWN_BASE_DELAY = 1  # seconds
+RESPAWN_MAX_DELAY = 60  # seconds
+MAX_FAST_FAILURES = 5
+
+# Shared room records. Active records carry a long TTL so a server process
+# that dies without cleaning up cannot block its rooms forever.
+ACTIVE_ROOM_TTL = 12 * 3600  # seconds
+FINISHED_ROOM_TTL = 3600  # seconds
+_ACTIVE_ROOMS = "avatar:rooms:active"
+_RECENT_ROOMS = "avatar:rooms:recent"  # {room_name: finish time}
+
+
+def _room_key(room_name: str) -> str:
+    return f"avatar:room:{room_name}"
+
+
+def _claim_key(room_name: str) -> str:
+    # Held by the server process hosting the room, from assignment until the room finishes
+    return f"avatar:claim:{room_name}"
+
+
+class AvatarWorker:
+    """
+    Handle for one long-lived avatar worker process and its IPC connection.
+    """
+
+    def __init__(self, worker_id: str, process: asyncio.subprocess.Process):
+        self.worker_id = worker_id
+        self.process = process
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.connected = asyncio.Event()
+        self.disconnected = False  # IPC connection was lost after the handshake
+        self.rooms = set()
+        self.started_at = datetime.now().isoformat()
+        self.started_monotonic = time.monotonic()
+        self._send_lock = asyncio.Lock()
+        self._next_request_id = 0
+        self._pending: Dict[int, asyncio.Future] = {}
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self.process.returncode
+
+    def is_alive(self) -> bool:
+        return self.process.returncode is None
+
+    async def request(self, op: str, timeout: float, **payload) -> Dict:
+        """
+        Send a request to the worker and wait for its reply.
+
+        Args:
+            op: Operation name understood by the worker
+            timeout: Seconds to wait for the reply
+            **payload: Extra fields for the request
+
+        Returns:
+            Reply dictionary from the worker
+        """
+        await asyncio.wait_for(self.connected.wait(), timeout=timeout)
+
+        self._next_request_id += 1
+        request_id = self._next_request_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+
+        try:
+            message = {"id": request_id, "op": op, **payload}
+            async with self._send_lock:
+                self.writer.write(json.dumps(message).encode() + b"\n")
+                await self.writer.drain()
+            return await asyncio.wait_for(future, timeout=timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    def resolve(self, message: Dict) -> None:
+        """Complete the pending request matching a reply from the worker."""
+        future = self._pending.get(message.get("id"))
+        if future and not future.done():
+            future.set_result(message)
+
+    def fail_pending(self, error: Exception) -> None:
+        """Fail every in-flight request, e.g. when the connection drops."""
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+
+
+class AvatarRoom:
+    """
+    Lifecycle record for one room hosted by the pool.
+    """
+
+    def __init__(self, room_name: str, worker: AvatarWorker, owner: str, trace_id: Optional[str] = None):
+        self.room_name = room_name
+        self.trace_id = trace_id  # /join-room trace this assignment belongs to
+        self.worker = worker
+        self.owner = owner  # server process hosting the pool
+        self.assignment_id = secrets.token_hex(4)
+        self.state = ROOM_SPAWNING
+        self.exit_code: Optional[int] = None  # worker process exit code; only set if the worker died
+        self.reason: Optional[str] = None
+        self.timestamps: Dict[str, str] = {ROOM_SPAWNING: datetime.now().isoformat()}
+        self.assigned_monotonic = time.monotonic()
+        self.startup: Optional[Dict] = None  # agent's startup phase timeline, once running
+
+    def set_state(self, state: str) -> None:
+        self.state = state
+        self.timestamps[state] = datetime.now().isoformat()
+
+    def is_active(self) -> bool:
+        return self.state in ACTIVE_ROOM_STATES
+
+    def to_dict(self) -> Dict:
+        return {
+            "state": self.state,
+            "pid": self.worker.pid,
+            "worker_id": self.worker.worker_id,
+            "owner": self.owner,
+            "is_running": self.is_active(),
+            "worker_exit_code": self.exit_code,  # None unless the hosting worker process died
+            "reason": self.reason,
+            "timestamps": self.timestamps,
+            "trace_id": self.trace_id,
+            "startup": self.startup,
+        }
+
+
+class AvatarWorkerPool:
+    """
+    Pool of avatar worker processes that rooms are assigned to.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        env: Dict[str, str],
+        cwd: str,
+        state: StateBackend,
+        max_rooms_per_worker: int = 8,
+        request_timeout: float = 10,
+        history_size: int = 200,
+        tracer: Optional[Tracer] = None,
+    ):
+        """
+        Args:
+            size: Number of worker processes to keep running
+            env: Environment for the worker processes
+            cwd: Directory containing avatar_agent.py
+            state: Backend the room records are published to
+            max_rooms_per_worker: Rooms a single worker may host at once
+            request_timeout: Seconds to wait for a worker to answer a request
+            history_size: Finished rooms to keep lifecycle records for
+            tracer: Receives the agents' startup timelines for their traces
+        """
+        self.size = max(1, size)
+        self.env = env
+        self.cwd = cwd
+        self.max_rooms_per_worker = max_rooms_per_worker
+        self.request_timeout = request_timeout
+        self.state = state
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+        self.workers: Dict[str, AvatarWorker] = {}
+        self.rooms: Dict[str, AvatarRoom] = {}  # {room_name: active room hosted by this pool}
+        self.history_size = history_size
+        self.tracer = tracer
+        self._stopping = False
+
+        self._secret = secrets.token_hex(16)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._address: Optional[str] = None
+        self._spawned = 0
+        self._fast_failures = 0
+
+    async def start(self) -> None:
+        """Open the IPC listener and spawn the initial workers."""
+        self._server = await asyncio.start_server(self._handle_connection, "127.0.0.1", 0)
+        port = self._server.sockets[0].getsockname()[1]
+        self._address = f"127.0.0.1:{port}"
+        print(f"[avatar_pool] IPC listening on {self._address}")
+
+        for _ in range(self.size):
+            await self._spawn_worker()
+
+    async def stop(self) -> None:
+        """Terminate all workers and close the IPC listener."""
+        self._stopping = True
+        for worker in list(self.workers.values()):
+            if worker.is_alive():
+                worker.process.terminate()
+        for worker in list(self.workers.values()):
+            try:
+                await asyncio.wait_for(worker.process.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                print(f"[avatar_pool] Force killing worker {worker.worker_id}")
+                worker.process.kill()
+        self.workers.clear()
+
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _spawn_worker(self) -> AvatarWorker:
+        worker_id = f"w{self._spawned}"
+        self._spawned += 1
+
+        env = dict(self.env)
+        env["AVATAR_IPC_SECRET"] = self._secret
+
+        cmd = [
+            sys.executable,
+            "avatar_agent.py", "worker",
+            "--ipc", self._address,
+            "--worker-id", worker_id,
+        ]
+        print(f"[avatar_pool] Starting avatar worker with command: {' '.join(cmd)}")
+
+        # Don't capture output - let it print directly to console
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            env=env,
+            cwd=self.cwd,
+            stdout=None,
+            stderr=None,
+        )
+        worker = AvatarWorker(worker_id, process)
+        self.workers[worker_id] = worker
+        AVATAR_WORKER_SPAWNS.inc()
+        asyncio.create_task(self._watch_worker(worker))
+        print(f"[avatar_pool] ✅ Worker {worker_id} spawned (pid={process.pid})")
+        return worker
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve one worker connection: handshake, then replies and events."""
+        worker = None
+        try:
+            hello = json.loads(await reader.readline() or b"{}")
+            if hello.get("secret") != self._secret or hello.get("worker_id") not in self.workers:
+                print("[avatar_pool] ⚠️ Rejected unknown IPC connection")
+                return
+
+            worker = self.workers[hello["worker_id"]]
+            worker.reader = reader
+            worker.writer = writer
+            worker.connected.set()
+            print(f"[avatar_pool] 🔌 Worker {worker.worker_id} connected (pid={hello.get('pid')})")
+
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if "event" in message:
+                    await self._handle_event(worker, message)
+                else:
+                    worker.resolve(message)
+
+        except Exception as e:
+            print(f"[avatar_pool] ❌ IPC error: {e}")
+        finally:
+            if worker is not None:
+                worker.connected.clear()
+                worker.disconnected = True
+                worker.fail_pending(ConnectionError(f"worker {worker.worker_id} disconnected"))
+                # A live worker we can no longer talk to is useless; terminate it so
+                # _watch_worker crashes its rooms and spawns a replacement
+                if worker.is_alive() and not self._stopping:
+                    print(f"[avatar_pool] ⚠️ Lost IPC to worker {worker.worker_id}, terminating it")
+                    worker.process.terminate()
+            writer.close()
+
+    async def _handle_event(self, worker: AvatarWorker, message: Dict) -> None:
+        event = message.get("event")
+        room = self.rooms.get(message.get("room"))
+        if room is None or room.assignment_id != message.get("assignment_id"):
+            return  # Stale event for a room that was released or reassigned
+
+        if event == "room_running":
+            AVATAR_SPAWN_SECONDS.observe(time.monotonic() - room.assigned_monotonic, outcome="running")
+            room.startup = message.get("timeline")
+            room.set_state(ROOM_RUNNING)
+            if self.tracer:
+                self.tracer.record_agent_startup(room.trace_id, room.startup)
+            await self._publish(room)
+            print(f"[avatar_pool] Room {room.room_name} running on worker {worker.worker_id}")
+        elif event == "room_ended":
+            reason = message.get("reason") or "ended"
+            failed = reason.startswith("error") or reason == "session_failed"
+            # The worker process is still running, so there is no exit code here
+            await self._finish_room(room, ROOM_CRASHED if failed else ROOM_EXITED, exit_code=None, reason=reason)
+            print(f"[avatar_pool] Room {room.room_name} ended on worker {worker.worker_id}: {reason}")
+
+    async def _finish_room(self, room: AvatarRoom, state: str, exit_code: Optional[int], reason: str) -> None:
+        """Move a room to a terminal state and into the bounded history."""
+        if ROOM_RUNNING not in room.timestamps:
+            # Ended before its session went live: a failed (or abandoned) spawn
+            AVATAR_SPAWN_SECONDS.observe(time.monotonic() - room.assigned_monotonic, outcome=state)
+        room.exit_code = exit_code
+        room.reason = reason
+        room.set_state(state)
+
+        room.worker.rooms.discard(room.room_name)
+        if self.rooms.get(room.room_name) is room:
+            del self.rooms[room.room_name]
+        await self._publish(room)
+        try:
+            await self.state.release_claim(_claim_key(room.room_name), self.owner)
+        except Exception as e:
+            print(f"[avatar_pool] ⚠️ Could not release claim on room {room.room_name}: {e}")
+
+    async def _publish(self, room: AvatarRoom) -> None:
+        """Write a room's lifecycle record to the shared state."""
+        try:
+            if room.is_active():
+                await self.state.set(_room_key(room.room_name), room.to_dict(), ttl=ACTIVE_ROOM_TTL)
+                await self.state.sadd(_ACTIVE_ROOMS, room.room_name)
+                return
+
+            await self.state.set(_room_key(room.room_name), room.to_dict(), ttl=FINISHED_ROOM_TTL)
+            await self.state.srem(_ACTIVE_ROOMS, room.room_name)
+            await self.state.zadd(_RECENT_ROOMS, room.room_name, time.time())
+            overflow = await self.state.zcard(_RECENT_ROOMS) - self.history_size
+            if overflow > 0:
+                await self.state.zrem(_RECENT_ROOMS, *await self.state.zrange(_RECENT_ROOMS, 0, overflow - 1))
+        except Exception as e:
+            print(f"[avatar_pool] ⚠️ Could not publish room {room.room_name}: {e}")
+
+    async def _watch_worker(self, worker: AvatarWorker) -> None:
+        """Wait for a worker to exit, then crash its rooms and replace it."""
+        returncode = await worker.process.wait()
+        print(f"[avatar_pool] Worker {worker.worker_id} exited with code {returncode}")
+
+        for room in [r for r in self.rooms.values() if r.worker is worker]:
+            await self._finish_room(room, ROOM_CRASHED, exit_code=returncode, reason="worker_exited")
+            print(f"[server] Cleaned up dead avatar process for room: {room.room_name}")
+        self.workers.pop(worker.worker_id, None)
+
+        if self._stopping or len(self.workers) >= self.size:
+            return
+
+        if time.monotonic() - worker.started_monotonic < WORKER_HEALTHY_AFTER:
+            self._fast_failures += 1
+        else:
+            self._fast_failures = 0
+
+        if self._fast_failures >= MAX_FAST_FAILURES:
+            print(
+                f"[avatar_pool] ❌ Workers failed {self._fast_failures} times in a row within "
+                f"{WORKER_HEALTHY_AFTER}s of starting; not respawning. Check avatar_agent.py logs and env."
+            )
+            return
+
+        if self._fast_failures:
+            delay = min(RESPAWN_BASE_DELAY * 2 ** (self._fast_failures - 1), RESPAWN_MAX_DELAY)
+            print(f"[avatar_pool] Respawning worker in {delay}s (fast failure {self._fast_failures}/{MAX_FAST_FAILURES})")
+            await asyncio.sleep(delay)
+            if self._stopping:
+                return
+
+        await self._spawn_worker()
+
+    def _pick_worker(self) -> Optional[AvatarWorker]:
+        candidates = [
+            w for w in self.workers.values()
+            if w.is_alive() and not w.disconnected and len(w.rooms) < self.max_rooms_per_worker
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda w: len(w.rooms))
+
+    async def assign_room(
+        self,
+        room_name: str,
+        language: str = "en-US",
+        display_name: Optional[str] = None,
+        memory_context: Optional["asyncio.Future[Optional[str]]"] = None,
+        trace_id: Optional[str] = None,
+    ) -> bool:
+        """
+        Hand a room to the least-loaded worker.
+
+        Args:
+            room_name: LiveKit room to join
+            language: Language code for the AI assistant
+            display_name: User display name for memory
+            memory_context: Task prefetching the session's memory context; sent
+                with start_room if already done, otherwise as a room_memory
+                message once it finishes
+            trace_id: Trace the worker tags the session's startup timeline with
+
+        Returns:
+            True if a worker accepted the room, False otherwise
+        """
+        if room_name in self.rooms:
+            return True
+
+        # Atomic across every server worker sharing the state backend: only
+        # one of several concurrent joins gets to put an avatar in the room
+        if not await self.state.claim(_claim_key(room_name), self.owner, ttl=ACTIVE_ROOM_TTL):
+            print(f"Avatar already running for room: {room_name}")
+            return True
+
+        worker = self._pick_worker()
+        if worker is None:
+            await self.state.release_claim(_claim_key(room_name), self.owner)
+            print(f"[avatar_pool] ❌ No avatar worker has capacity for room: {room_name}")
+            AVATAR_SPAWN_SECONDS.observe(0, outcome="no_capacity")
+            return False
+
+        # Reserve the slot before awaiting so concurrent joins spread out
+        room = AvatarRoom(room_name, worker, self.owner, trace_id)
+        worker.rooms.add(room_name)
+        self.rooms[room_name] = room
+        await self._publish(room)
+        handoff = {}
+        if memory_context is not None:
+            if memory_context.done() and not memory_context.cancelled() and memory_context.exception() is None:
+                handoff["memory_context"] = memory_context.result()
+            else:
+                handoff["memory_pending"] = True
+        try:
+            reply = await worker.request(
+                "start_room",
+                timeout=self.request_timeout,
+                room=room_name,
+                assignment_id=room.assignment_id,
+                language=language,
+                display_name=display_name or "",
+                trace_id=trace_id,
+                **handoff,
+            )
+        except Exception as e:
+            reply = {"ok": False, "error": str(e)}
+            # The worker may have started the session before the request failed;
+            # ask it to leave so no untracked agent stays in the room
+            asyncio.create_task(self._stop_room_quietly(worker, room_name))
+
+        if not reply.get("ok"):
+            if room.is_active():
+                await self._finish_room(room, ROOM_CRASHED, exit_code=None, reason=f"refused: {reply.get('error')}")
+            print(f"[avatar_pool] ❌ Worker {worker.worker_id} refused room {room_name}: {reply.get('error')}")
+            return False
+
+        # The worker may already have reported the session running or ended
+        if room.state == ROOM_SPAWNING:
+            room.set_state(ROOM_READY)
+            await self._publish(room)
+        print(f"[avatar_pool] ✅ Room {room_name} assigned to worker {worker.worker_id}")
+
+        if handoff.get("memory_pending"):
+            asyncio.create_task(self._hand_off_memory(room, memory_context))
+        return True
+
+    async def _hand_off_memory(self, room: AvatarRoom, memory_context: asyncio.Future) -> None:
+        """Send a prefetched memory context to the worker once it is ready."""
+        try:
+            context = await memory_context
+        except Exception as e:
+            print(f"[avatar_pool] ⚠️ Memory prefetch for room {room.room_name} failed: {e}")
+            context = None  # the agent fetches memories itself
+
+        if not room.is_active() or not room.worker.is_alive():
+            return
+        try:
+            await room.worker.request(
+                "room_memory",
+                timeout=self.request_timeout,
+                room=room.room_name,
+                memory_context=context,
+            )
+        except Exception as e:
+            print(f"[avatar_pool] ⚠️ Could not hand memory to room {room.room_name}: {e}")
+
+    async def _stop_room_quietly(self, worker: AvatarWorker, room_name: str) -> None:
+        """Best-effort stop_room; errors are logged, not raised."""
+        if not worker.is_alive():
+            return
+        try:
+            await worker.request("stop_room", timeout=self.request_timeout, room=room_name)
+        except Exception as e:
+            print(f"[avatar_pool] ⚠️ Best-effort stop of room {room_name} failed: {e}")
+
+    async def release_room(self, room_name: str) -> bool:
+        """
+        Ask the hosting worker to leave a room.
+
+        Only rooms hosted by this process's pool can be released; the shared
+        record of a room hosted elsewhere names its owner.
+
+        Returns:
+            True if the room was hosted by this pool, False otherwise
+        """
+        room = self.rooms.get(room_name)
+        if room is None:
+            return False
+
+        worker = room.worker
+        await self._finish_room(room, ROOM_EXITED, exit_code=None, reason="released")
+        if worker.is_alive():
+            try:
+                await worker.request("stop_room", timeout=self.request_timeout, room=room_name)
+            except Exception as e:
+                print(f"[avatar_pool] ⚠️ Error stopping room {room_name}: {e}")
+        return True
+
+    async def is_room_running(self, room_name: str) -> bool:
+        """True if any server worker's pool is hosting the room."""
+        room = self.rooms.get(room_name)
+        if room is not None:
+            return room.is_active()
+        record = await self.state.get(_room_key(room_name))
+        return record is not None and record["is_running"]
+
+    async def get_room(self, room_name: str) -> Optional[Dict]:
+        """Current or most recent lifecycle record for a room, from any worker."""
+        room = self.rooms.get(room_name)
+        if room is not None:
+            return room.to_dict()
+        return await self.state.get(_room_key(room_name))
+
+    async def room_stats(self, room_name: str) -> Optional[Dict]:
+        """
+        Live participant, track and bitrate stats from the worker hosting a room.
+
+        Returns:
+            The worker's stats, or None if the room isn't hosted by this pool
+        """
+        room = self.rooms.get(room_name)
+        if room is None or not room.is_active() or not room.worker.is_alive():
+            return None
+        reply = await room.worker.request("room_stats", timeout=self.request_timeout, room=room_name)
+        return reply.get("stats") if reply.get("ok") else None
+
+    async def snapshot(self) -> Dict:
+        """Describe the rooms currently hosted across all server workers."""
+        room_names = sorted(await self.state.smembers(_ACTIVE_ROOMS))
+        records = await self.state.mget([_room_key(name) for name in room_names])
+        snapshot = {}
+        for room_name, record in zip(room_names, records):
+            if record is None or not record["is_running"]:
+                # Owner died without cleaning up and the record expired
+                await self.state.srem(_ACTIVE_ROOMS, room_name)
+                continue
+            snapshot[room_name] = record
+        return snapshot
+
+    async def recent(self) -> Dict:
+        """Describe recently finished rooms, newest last."""
+        room_names = await self.state.zrange(_RECENT_ROOMS, 0, -1)
+        records = await self.state.mget([_room_key(name) for name in room_names])
+        return {
+            room_name: record
+            for room_name, record in zip(room_names, records)
+            if record is not None and not record["is_running"]
+        }
@@ -0,0 +1,128 @@
+"""
+Import-time budget check for the agent and server modules.
+
+Every avatar worker process imports avatar_agent before it can host a room,
+so its cold-start import cost is paid on each spawn. For each module listed
+in import_budget.json this runs `python -X importtime -c "import <module>"`
+in fresh interpreters and fails if
+
+- the median cumulative import time exceeds the module's recorded budget, or
+- the import pulls in a module listed as forbidden (e.g. LiveKit plugins,
+  which avatar_agent loads only when a process is about to run sessions)
+
+Usage:
+  python bench_import_time.py               # check against import_budget.json
+  python bench_import_time.py --record      # measure and write new budgets
+  python bench_import_time.py --top 15      # also show the slowest imports
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+BUDGET_FILE = os.path.join(SERVER_DIR, "import_budget.json")
+
+# server.py refuses to import without LiveKit credentials
+DUMMY_ENV = {
+    "LIVEKIT_API_KEY": "bench-key",
+    "LIVEKIT_API_SECRET": "bench-secret-bench-secret-bench-secret",
+}
+
+
+def measure(module: str) -> Tuple[float, Dict[str, float]]:
+    """
+    Import a module in a fresh interpreter with -X importtime.
+
+    Returns:
+        (cumulative ms for the module, {imported module: self ms})
+
+    Raises:
+        RuntimeError: If the import fails
+    """
+    env = {**DUMMY_ENV, **os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SERVER_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        last_line = (result.stderr.strip().splitlines() or ["unknown error"])[-1]
+        raise RuntimeError(f"import {module} failed: {last_line}")
+
+    cumulative = 0.0
+    self_times: Dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        name = name.strip()
+        self_times[name] = int(self_us) / 1000
+        if name == module:
+            cumulative = int(cumulative_us) / 1000
+    return cumulative, self_times
+
+
+def is_forbidden(name: str, forbidden: List[str]) -> bool:
+    return any(name == f or name.startswith(f + ".") for f in forbidden)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per module (median is used)")
+    parser.add_argument("--record", action="store_true", help="write measured budgets to import_budget.json")
+    parser.add_argument("--top", type=int, default=0, help="show the N slowest imports per module")
+    args = parser.parse_args()
+
+    with open(BUDGET_FILE) as f:
+        config = json.load(f)
+    headroom = config.get("headroom", 0.25)
+
+    failures = []
+    for module, budget in config["modules"].items():
+        try:
+            runs = [measure(module) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"  {module:<14} ERROR  {e}")
+            failures.append(module)
+            continue
+
+        median_ms = statistics.median(cumulative for cumulative, _ in runs)
+        self_times = runs[-1][1]
+        forbidden = sorted(name for name in self_times if is_forbidden(name, budget.get("forbidden", [])))
+        budget_ms = budget.get("budget_ms")
+
+        if args.record:
+            budget["budget_ms"] = round(median_ms * (1 + headroom))
+            status = f"recorded budget {budget['budget_ms']} ms"
+        elif budget_ms is None:
+            status = "no budget recorded (run with --record)"
+        elif median_ms > budget_ms:
+            status = f"OVER budget {budget_ms} ms"
+            failures.append(module)
+        else:
+            status = f"ok (budget {budget_ms} ms)"
+        print(f"  {module:<14} {median_ms:>8.1f} ms   {status}")
+
+        if forbidden:
+            print(f"  {'':<14} imports forbidden modules: {', '.join(forbidden)}")
+            failures.append(module)
+        for name, ms in sorted(self_times.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"  {'':<14} {ms:>8.1f} ms   {name}")
+
+    if args.record:
+        with open(BUDGET_FILE, "w") as f:
+            json.dump(config, f, indent=2)
+            f.write("\n")
+        print(f"Wrote {BUDGET_FILE}")
+
+    if failures:
+        print(f"Import-time check failed: {', '.join(sorted(set(failures)))}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Expiring store for active calls.
+
+Each call carries a status and a TTL. Calls live in the shared state backend
+(see state_backend.py) so every server worker sees them. Expiry deadlines are
+kept in a sorted index, so evicting stale calls only touches the calls that
+actually expired instead of scanning the whole store. A hard cap keeps the
+store bounded even under a burst of calls.
+"""
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from state_backend import StateBackend
+
+CALL_STATUS_INITIATED = "initiated"
+CALL_STATUS_ANSWERED = "answered"
+CALL_STATUS_ENDED = "ended"
+CALL_STATUSES = (CALL_STATUS_INITIATED, CALL_STATUS_ANSWERED, CALL_STATUS_ENDED)
+
+_EXPIRY_INDEX = "calls:expiry"  # {call_id: wall-clock deadline}
+_CREATED_INDEX = "calls:created"  # {call_id: creation time}
+
+
+def _call_key(call_id: str) -> str:
+    return f"call:{call_id}"
+
+
+class CallStore:
+    """
+    Active calls keyed by call_id, evicted when their TTL runs out.
+    """
+
+    def __init__(
+        self,
+        state: StateBackend,
+        ttl_seconds: float = 120,
+        answered_ttl_seconds: float = 4 * 3600,
+        ended_ttl_seconds: float = 30,
+        max_calls: int = 10000,
+    ):
+        """
+        Args:
+            state: Backend holding the calls
+            ttl_seconds: Lifetime of a call that is still ringing
+            answered_ttl_seconds: Lifetime of a call once answered
+            ended_ttl_seconds: How long an ended call stays visible
+            max_calls: Hard cap on stored calls; the soonest to expire go first
+        """
+        self.state = state
+        self.ttls = {
+            CALL_STATUS_INITIATED: ttl_seconds,
+            CALL_STATUS_ANSWERED: answered_ttl_seconds,
+            CALL_STATUS_ENDED: ended_ttl_seconds,
+        }
+        self.max_calls = max_calls
+        self.evicted = 0  # evictions performed by this process
+
+    async def count(self) -> int:
+        await self.evict_expired()
+        return await self.state.zcard(_EXPIRY_INDEX)
+
+    async def add(self, call_id: str, call: Dict, ttl: Optional[float] = None) -> Dict:
+        """
+        Store a call with a TTL based on its status.
+
+        Args:
+            call_id: Unique call ID
+            call: Call record with a "status" field
+            ttl: Override lifetime in seconds
+
+        Returns:
+            The stored call, with "expires_at" filled in
+        """
+        await self.evict_expired()
+        await self.state.zadd(_CREATED_INDEX, call_id, time.time())
+        call = await self._schedule(call_id, dict(call), ttl)
+
+        overflow = await self.state.zcard(_EXPIRY_INDEX) - self.max_calls
+        if overflow > 0:
+            for stale_id in await self.state.zrange(_EXPIRY_INDEX, 0, overflow - 1):
+                await self._remove(stale_id)
+                self.evicted += 1
+
+        return call
+
+    async def get(self, call_id: str) -> Optional[Dict]:
+        await self.evict_expired()
+        return await self.state.get(_call_key(call_id))
+
+    async def set_status(self, call_id: str, status: str, ttl: Optional[float] = None) -> Optional[Dict]:
+        """
+        Update a call's status and restart its TTL for the new status.
+
+        Returns:
+            The updated call, or None if it is unknown or already expired
+        """
+        call = await self.get(call_id)
+        if call is None:
+            return None
+        call["status"] = status
+        return await self._schedule(call_id, call, ttl)
+
+    async def page(self, offset: int = 0, limit: int = 50) -> List[Dict]:
+        """Calls in creation order, sliced for pagination."""
+        await self.evict_expired()
+        call_ids = await self.state.zrange(_CREATED_INDEX, offset, offset + limit - 1)
+        calls = await self.state.mget([_call_key(call_id) for call_id in call_ids])
+        return [call for call in calls if call is not None]
+
+    async def evict_expired(self) -> int:
+        """
+        Drop every call whose deadline has passed.
+
+        Returns:
+            Number of calls evicted
+        """
+        expired = await self.state.zrangebyscore(_EXPIRY_INDEX, float("-inf"), time.time())
+        for call_id in expired:
+            await self._remove(call_id)
+        self.evicted += len(expired)
+        return len(expired)
+
+    async def _schedule(self, call_id: str, call: Dict, ttl: Optional[float]) -> Dict:
+        if ttl is None:
+            ttl = self.ttls.get(call.get("status"), self.ttls[CALL_STATUS_INITIATED])
+        deadline = time.time() + ttl
+        call["expires_at"] = datetime.fromtimestamp(deadline).isoformat()
+
+        # The backend TTL is only a safety net if the index entry is lost
+        await self.state.set(_call_key(call_id), call, ttl=ttl + 60)
+        await self.state.zadd(_EXPIRY_INDEX, call_id, deadline)
+        return call
+
+    async def _remove(self, call_id: str) -> None:
+        await self.state.delete(_call_key(call_id))
+        await self.state.zrem(_EXPIRY_INDEX, call_id)
+        await self.state.zrem(_CREATED_INDEX, call_id)
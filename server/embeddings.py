@@ -0,0 +1,35 @@
+"""
+Offline text embeddings shared by the local memory backend and the memory ranker.
+
+Dependency-free apart from NumPy, so importing it never pulls in mem0.
+"""
+import hashlib
+import re
+from typing import Callable
+
+import numpy as np
+
+DEFAULT_DIMENSIONS = 384
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def hashing_embedder(dimensions: int = DEFAULT_DIMENSIONS) -> Callable[[str], np.ndarray]:
+    """
+    Build an offline text embedder using the hashing trick.
+
+    Words and character n-grams are hashed into a signed, L2-normalised
+    vector. N-grams keep word variants comparable: trigrams for alphabetic
+    words, bigrams for CJK runs (which have no spaces between words).
+    """
+    def embed(text: str) -> np.ndarray:
+        vector = np.zeros(dimensions, dtype=np.float32)
+        for token in _TOKEN_RE.findall(text.lower()):
+            n = 2 if any(ord(c) >= 0x2E80 for c in token) else 3
+            features = [token] + [token[i:i + n] for i in range(max(1, len(token) - n + 1))]
+            for feature in features:
+                digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                vector[value % dimensions] += 1.0 if value >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    return embed
@@ -0,0 +1,117 @@
+"""
+Server-side snapshot of mem0 users for /api/users.
+
+The user list is loaded from mem0's entities endpoint page by page and kept
+sorted in memory, so a request is a binary search plus a slice instead of a
+full download and sort. Once the snapshot is older than its refresh interval,
+the next request triggers a background reload and keeps being served from the
+current snapshot. Users seen between reloads are inserted in place.
+"""
+import asyncio
+import base64
+import bisect
+import time
+from typing import List, Optional, Set, Tuple
+
+
+def encode_cursor(display_name: str) -> str:
+    return base64.urlsafe_b64encode(display_name.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> str:
+    """
+    Raises:
+        ValueError: If the cursor is not one we issued
+    """
+    try:
+        return base64.urlsafe_b64decode(cursor.encode()).decode()
+    except Exception as e:
+        raise ValueError(f"invalid cursor: {cursor}") from e
+
+
+class EntitySnapshot:
+    """
+    Sorted mem0 user names with cursor pagination and background refresh.
+    """
+
+    def __init__(self, refresh_interval: float = 300):
+        """
+        Args:
+            refresh_interval: Seconds before the snapshot is reloaded from mem0
+        """
+        self.refresh_interval = refresh_interval
+        self.users: List[str] = []  # sorted display names
+        self._user_set: Set[str] = set()
+        self._added: Set[str] = set()  # add_user() calls since the current reload started
+        self.refreshed_at: Optional[float] = None  # monotonic time of the last full load
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    def __contains__(self, display_name: object) -> bool:
+        return display_name in self._user_set
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.refreshed_at is not None
+
+    async def ensure_fresh(self, memory_service) -> None:
+        """
+        Load the snapshot on first use; afterwards reload in the background
+        once it is older than refresh_interval.
+
+        Args:
+            memory_service: AsyncMemoryService to page entities from
+        """
+        if not self.is_loaded:
+            await asyncio.shield(self._start_refresh(memory_service))
+        elif time.monotonic() - self.refreshed_at > self.refresh_interval:
+            self._start_refresh(memory_service)
+
+    def _start_refresh(self, memory_service) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh(memory_service))
+            self._refresh_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return self._refresh_task
+
+    async def _refresh(self, memory_service) -> None:
+        started = time.monotonic()
+        self._added = set()
+        names: Set[str] = set()
+        async for page in memory_service.iter_entity_pages():
+            names.update(entity["name"] for entity in page if entity.get("type") == "user" and entity.get("name"))
+            await asyncio.sleep(0)  # let requests run between pages
+
+        # Users added while the reload was running are kept
+        names.update(self._added)
+        self.users = sorted(names)
+        self._user_set = names
+        self.refreshed_at = time.monotonic()
+        print(f"[entities] 👥 Snapshot refreshed: {len(self.users)} users in {self.refreshed_at - started:.2f}s")
+
+    def add_user(self, display_name: str) -> None:
+        """Insert a user seen between reloads (e.g. one that just got memories)."""
+        if display_name and display_name not in self._user_set:
+            bisect.insort(self.users, display_name)
+            self._user_set.add(display_name)
+            self._added.add(display_name)
+
+    def page(self, cursor: Optional[str] = None, limit: int = 50) -> Tuple[List[str], Optional[str]]:
+        """
+        One page of users after a cursor.
+
+        Args:
+            cursor: Cursor from the previous page, or None for the first page
+            limit: Users per page
+
+        Returns:
+            (display names, next cursor or None on the last page)
+
+        Raises:
+            ValueError: If the cursor is invalid
+        """
+        start = bisect.bisect_right(self.users, decode_cursor(cursor)) if cursor else 0
+        users = self.users[start:start + limit]
+        more = start + limit < len(self.users)
+        return users, encode_cursor(users[-1]) if more and users else None
@@ -0,0 +1,111 @@
+"""
+Local stand-in for Expo's push API, for exercising PushDispatcher offline.
+
+Accepts the same multi-message batches as https://exp.host/--/api/v2/push/send
+and answers with one push ticket per message. Tokens containing
+"DeviceNotRegistered" get an error ticket, and --rate-limit N answers the
+first N requests with HTTP 429.
+
+Usage:
+  python expo_standin.py [--port 8765] [--rate-limit 0]
+      Serve the stand-in; then run the server with
+      EXPO_PUSH_URL=http://127.0.0.1:8765/--/api/v2/push/send
+  python expo_standin.py --selftest
+      Start the stand-in and send a broadcast through PushDispatcher
+"""
+import argparse
+import asyncio
+import os
+import sys
+import uuid
+
+from aiohttp import web
+
+# Add server directory to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+PUSH_PATH = "/--/api/v2/push/send"
+EXPO_MAX_BATCH_SIZE = 100
+
+
+def create_app(rate_limit: int = 0) -> web.Application:
+    """Build the stand-in app; `app["state"]["requests"]` records each batch size."""
+    app = web.Application()
+    state = {"requests": [], "rate_limit": rate_limit}
+    app["state"] = state
+
+    async def push_send(request: web.Request) -> web.Response:
+        if state["rate_limit"] > 0:
+            state["rate_limit"] -= 1
+            return web.json_response({"errors": [{"code": "TOO_MANY_REQUESTS", "message": "slow down"}]}, status=429)
+
+        body = await request.json()
+        messages = body if isinstance(body, list) else [body]
+        state["requests"].append(len(messages))
+
+        if len(messages) > EXPO_MAX_BATCH_SIZE:
+            return web.json_response(
+                {"errors": [{"code": "PUSH_TOO_MANY_NOTIFICATIONS", "message": f"more than {EXPO_MAX_BATCH_SIZE} messages"}]},
+                status=400,
+            )
+
+        tickets = []
+        for message in messages:
+            if "DeviceNotRegistered" in str(message.get("to")):
+                tickets.append({
+                    "status": "error",
+                    "message": f"{message.get('to')} is not a registered push notification recipient",
+                    "details": {"error": "DeviceNotRegistered"},
+                })
+            else:
+                tickets.append({"status": "ok", "id": str(uuid.uuid4())})
+
+        return web.json_response({"data": tickets if isinstance(body, list) else tickets[0]})
+
+    app.router.add_post(PUSH_PATH, push_send)
+    return app
+
+
+async def selftest(port: int) -> None:
+    from push_dispatcher import PushDispatcher
+
+    app = create_app(rate_limit=1)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+
+    dispatcher = PushDispatcher(url=f"http://127.0.0.1:{port}{PUSH_PATH}")
+    try:
+        messages = [{"to": f"ExponentPushToken[{i}]", "title": "test", "body": "test"} for i in range(250)]
+        messages[7]["to"] = "ExponentPushToken[DeviceNotRegistered]"
+        results = await dispatcher.send(messages)
+    finally:
+        await dispatcher.close()
+        await runner.cleanup()
+
+    failed = [r for r in results if not r["ok"]]
+    batches = app["state"]["requests"]
+    print(f"Batches received: {batches}")
+    print(f"Results: {len(results) - len(failed)} ok, {len(failed)} failed: {failed}")
+    assert sorted(batches) == [50, 100, 100], batches
+    assert len(results) == 250 and len(failed) == 1
+    assert failed[0]["error"] == "DeviceNotRegistered"
+    print("✅ Self-test passed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rate-limit", type=int, default=0, help="answer the first N requests with HTTP 429")
+    parser.add_argument("--selftest", action="store_true")
+    args = parser.parse_args()
+
+    if args.selftest:
+        asyncio.run(selftest(args.port))
+    else:
+        print(f"Expo stand-in listening on http://127.0.0.1:{args.port}{PUSH_PATH}")
+        web.run_app(create_app(args.rate_limit), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""
+Embedded local memory backend for MemoryService.
+
+Select it with MEMORY_BACKEND=local. Memories never leave the host:
+
+- embeddings live in a float32 NumPy array persisted as a memory-mapped file
+  (vectors.f32), one normalised row per memory
+- memory text and deletions go to an append-only JSON-lines log
+  (metadata.jsonl) that is replayed on open
+- search is one vectorised dot product over the user's rows (cosine
+  similarity, since rows are normalised)
+
+Several processes (server workers, avatar workers) may share one directory:
+writes take an exclusive file lock, and every call first replays log lines
+appended by other processes.
+
+Embeddings come from a local feature-hashing embedder, so the backend works
+fully offline. Unlike mem0 there is no LLM fact extraction; each added
+message is stored as one memory.
+"""
+import asyncio
+import contextlib
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from embeddings import DEFAULT_DIMENSIONS, hashing_embedder
+from memory_service import _MemoryFormatting
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+
+class LocalMemoryStore:
+    """
+    Memory-mapped embedding matrix plus an append-only metadata log.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        dimensions: int = DEFAULT_DIMENSIONS,
+        embed: Optional[Callable[[str], np.ndarray]] = None,
+    ):
+        """
+        Args:
+            path: Directory holding vectors.f32, metadata.jsonl and the lock file
+            dimensions: Embedding size (fixed once the store has data)
+            embed: Text -> normalised float32 vector (defaults to hashing_embedder)
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dimensions = dimensions
+        self.embed = embed or hashing_embedder(dimensions)
+
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._log_path = os.path.join(path, "metadata.jsonl")
+        self._lock_path = os.path.join(path, ".lock")
+        self._thread_lock = threading.RLock()
+
+        self._vectors: Optional[np.memmap] = None
+        self._capacity = 0  # rows the vectors file can hold
+        self._count = 0  # rows in use
+        self._log_offset = 0  # bytes of metadata.jsonl replayed so far
+        self._memories: Dict[int, Dict] = {}  # {row: memory}
+        self._rows_by_user: Dict[str, List[int]] = {}  # {user_id: [row]}, oldest first
+
+        with self._thread_lock:
+            self._sync()
+
+    # ----- persistence -----
+
+    @contextlib.contextmanager
+    def _write_lock(self):
+        """Serialise writers across threads and processes sharing the directory."""
+        with self._thread_lock, open(self._lock_path, "a+") as handle:
+            if fcntl:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _map_vectors(self) -> None:
+        size = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+        capacity = size // (4 * self.dimensions)
+        if capacity != self._capacity or self._vectors is None:
+            self._capacity = capacity
+            self._vectors = (
+                np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dimensions))
+                if capacity else None
+            )
+
+    def _sync(self) -> None:
+        """Replay log lines appended since the last call (by any process)."""
+        if not os.path.exists(self._log_path):
+            self._map_vectors()
+            return
+        if os.path.getsize(self._log_path) == self._log_offset:
+            return
+
+        with open(self._log_path, "rb") as log:
+            log.seek(self._log_offset)
+            for line in log:
+                if not line.endswith(b"\n"):
+                    break  # partially written line; picked up next time
+                self._log_offset += len(line)
+                self._apply(json.loads(line))
+        self._map_vectors()
+
+    def _apply(self, entry: Dict) -> None:
+        op = entry.get("op")
+        if op == "add":
+            row = entry["row"]
+            self._memories[row] = entry["memory"]
+            self._rows_by_user.setdefault(entry["memory"]["user_id"], []).append(row)
+            self._count = max(self._count, row + 1)
+        elif op == "delete_user":
+            for row in self._rows_by_user.pop(entry["user_id"], []):
+                self._memories.pop(row, None)
+
+    def _append_log(self, entry: Dict) -> None:
+        with open(self._log_path, "ab") as log:
+            log.write(json.dumps(entry, ensure_ascii=False).encode() + b"\n")
+            log.flush()
+            os.fsync(log.fileno())
+
+    def _ensure_capacity(self, rows: int) -> None:
+        if rows <= self._capacity:
+            return
+        capacity = max(1024, self._capacity)
+        while capacity < rows:
+            capacity *= 2
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(capacity * 4 * self.dimensions)
+        self._vectors = None
+        self._map_vectors()
+
+    # ----- operations -----
+
+    def add(self, user_id: str, text: str, metadata: Optional[Dict] = None) -> Dict:
+        """
+        Store one memory and its embedding.
+
+        Returns:
+            The stored memory dict (mem0-shaped: id, memory, user_id, ...)
+        """
+        vector = self.embed(text)
+        now = datetime.now().isoformat()
+        memory = {
+            "id": uuid.uuid4().hex,
+            "memory": text,
+            "user_id": user_id,
+            "metadata": metadata or {},
+            "created_at": now,
+            "updated_at": now,
+        }
+
+        with self._write_lock():
+            self._sync()
+            row = self._count
+            self._ensure_capacity(row + 1)
+            # Vector first, so a reader that sees the log line also sees the vector
+            self._vectors[row] = vector
+            self._vectors.flush()
+            self._append_log({"op": "add", "row": row, "memory": memory})
+            self._sync()  # applies our own line, like lines from other processes
+        return memory
+
+    def delete_user(self, user_id: str) -> None:
+        with self._write_lock():
+            self._sync()
+            self._append_log({"op": "delete_user", "user_id": user_id})
+            self._sync()
+
+    def all(self, user_id: str) -> List[Dict]:
+        """A user's memories, oldest first."""
+        with self._thread_lock:
+            self._sync()
+            return [dict(self._memories[row]) for row in self._rows_by_user.get(user_id, [])]
+
+    def search(self, user_id: str, query: str, limit: int = 5) -> List[Dict]:
+        """
+        A user's memories most similar to the query, best first, with "score".
+        """
+        with self._thread_lock:
+            self._sync()
+            rows = self._rows_by_user.get(user_id)
+            if not rows or self._vectors is None or limit <= 0:
+                return []
+
+            row_index = np.asarray(rows)
+            scores = self._vectors[row_index] @ self.embed(query)
+            top = min(limit, len(rows))
+            best = np.argpartition(-scores, top - 1)[:top]
+            best = best[np.argsort(-scores[best])]
+            return [{**self._memories[rows[i]], "score": float(scores[i])} for i in best]
+
+    def users(self) -> List[str]:
+        with self._thread_lock:
+            self._sync()
+            return [user_id for user_id, rows in self._rows_by_user.items() if rows]
+
+    def stats(self) -> Dict:
+        with self._thread_lock:
+            self._sync()
+            return {
+                "backend": "local",
+                "path": self.path,
+                "memories": len(self._memories),
+                "users": len(self._rows_by_user),
+                "rows": self._count,
+                "capacity": self._capacity,
+                "dimensions": self.dimensions,
+            }
+
+
+class LocalMemoryService(_MemoryFormatting):
+    """
+    MemoryService interface backed by LocalMemoryStore.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path: Store directory (falls back to LOCAL_MEMORY_DIR env var)
+        """
+        path = path or os.getenv(
+            "LOCAL_MEMORY_DIR",
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "local_memory"),
+        )
+        # No mem0 client or read cache: every lookup is a local array operation
+        self.store = LocalMemoryStore(path, dimensions=int(os.getenv("LOCAL_MEMORY_DIMENSIONS", str(DEFAULT_DIMENSIONS))))
+        print(f"[MemoryService] ✅ Initialized local memory backend at {path}")
+
+    def get_relevant_memories(self, user_id: str, query: str, limit: int = 5) -> List[Dict]:
+        try:
+            return self.store.search(user_id, query, limit)
+        except Exception as e:
+            print(f"[MemoryService] ❌ Error retrieving memories: {e}")
+            return []
+
+    def add_memory(self, user_id: str, message: str, role: str = "user") -> bool:
+        try:
+            self.store.add(user_id, message, {"timestamp": datetime.now().isoformat(), "role": role})
+            print(f"[MemoryService] 💾 Added {role} memory for user: {user_id}")
+            return True
+        except Exception as e:
+            print(f"[MemoryService] ❌ Error adding memory: {e}")
+            return False
+
+    def add_conversation_turn(self, user_id: str, user_message: str, assistant_message: str) -> bool:
+        try:
+            text = user_message if not assistant_message else f"{user_message}\nAssistant: {assistant_message}"
+            self.store.add(user_id, text, {"timestamp": datetime.now().isoformat(), "type": "conversation_turn"})
+            print(f"[MemoryService] 💾 Added conversation turn for user: {user_id}")
+            return True
+        except Exception as e:
+            print(f"[MemoryService] ❌ Error adding conversation turn: {e}")
+            return False
+
+    def get_all_memories(self, user_id: str) -> List[Dict]:
+        try:
+            return self.store.all(user_id)
+        except Exception as e:
+            print(f"[MemoryService] ❌ Error getting all memories: {e}")
+            return []
+
+    def iter_entity_pages(self) -> Iterator[List[Dict]]:
+        yield [{"type": "user", "name": user_id} for user_id in self.store.users()]
+
+    def get_all_users(self) -> Dict:
+        return {"users": self.store.users(), "agents": [], "runs": []}
+
+    def delete_memories(self, user_id: str) -> bool:
+        try:
+            self.store.delete_user(user_id)
+            print(f"[MemoryService] 🗑️ Deleted all memories for user: {user_id}")
+            return True
+        except Exception as e:
+            print(f"[MemoryService] ❌ Error deleting memories: {e}")
+            return False
+
+    def cache_stats(self) -> Dict:
+        return self.store.stats()
+
+
+class AsyncLocalMemoryService(_MemoryFormatting):
+    """
+    AsyncMemoryService interface backed by LocalMemoryStore.
+
+    Writes take a file lock and fsync, and reads may wait on a writer's lock,
+    so every operation runs in a worker thread to keep the event loop free.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self._service = LocalMemoryService(path)
+        self.store = self._service.store
+
+    async def get_relevant_memories(self, user_id: str, query: str, limit: int = 5) -> List[Dict]:
+        return await asyncio.to_thread(self._service.get_relevant_memories, user_id, query, limit)
+
+    async def add_memory(self, user_id: str, message: str, role: str = "user") -> bool:
+        return await asyncio.to_thread(self._service.add_memory, user_id, message, role)
+
+    async def add_conversation_turn(self, user_id: str, user_message: str, assistant_message: str) -> bool:
+        return await asyncio.to_thread(self._service.add_conversation_turn, user_id, user_message, assistant_message)
+
+    async def get_all_memories(self, user_id: str) -> List[Dict]:
+        return await asyncio.to_thread(self._service.get_all_memories, user_id)
+
+    async def iter_entity_pages(self):
+        yield [{"type": "user", "name": user_id} for user_id in await asyncio.to_thread(self.store.users)]
+
+    async def get_all_users(self) -> Dict:
+        return await asyncio.to_thread(self._service.get_all_users)
+
+    async def delete_memories(self, user_id: str) -> bool:
+        return await asyncio.to_thread(self._service.delete_memories, user_id)
+
+    def cache_stats(self) -> Dict:
+        return self.store.stats()
+
+    async def close(self) -> None:
+        pass
@@ -0,0 +1,141 @@
+"""
+Relevance-ranked memory selection for the agent's session context.
+
+Instead of prompting with whatever ten memories came last, every candidate
+memory is scored in one batch of vector operations on three signals:
+
+- relevance: cosine similarity to the session's query; by default a
+  description of what a study session draws on (subjects, goals, deadlines,
+  difficulties) in the session's language
+- recency: exponential decay on the memory's age
+- language: whether the memory is written in the session's language
+
+Near-duplicates of already-chosen memories are skipped, and memories are
+taken best-first until the token budget or the count limit is reached.
+
+Callers fetch candidates with a memory search for the same query
+(MEMORY_CANDIDATES of them) rather than downloading every memory.
+"""
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from embeddings import hashing_embedder
+from prompts import CJK_RE, estimate_tokens
+
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "600"))
+MEMORY_MAX_ITEMS = int(os.getenv("MEMORY_MAX_ITEMS", "10"))
+# Memories fetched by search and then ranked
+MEMORY_CANDIDATES = int(os.getenv("MEMORY_CANDIDATES", "30"))
+
+RELEVANCE_WEIGHT = 0.45
+RECENCY_WEIGHT = 0.35
+LANGUAGE_WEIGHT = 0.20
+RECENCY_HALF_LIFE_DAYS = 14
+DUPLICATE_SIMILARITY = 0.95
+
+# What a study session wants to know about the user, per prompt language
+SESSION_QUERIES = {
+    "en": "subjects and topics the user is studying, learning goals, assignments, exams and deadlines, "
+          "what they find difficult, how they like to learn, progress since last session",
+    "zh": "用户正在学习的科目和主题 学习目标 作业 考试和截止日期 觉得困难的地方 喜欢的学习方式 上次以来的进展",
+}
+
+_embed = hashing_embedder()
+
+
+def is_chinese(language: str) -> bool:
+    return language.startswith("cmn") or language.startswith("zh")
+
+
+def session_query(language: str = "en-US") -> str:
+    """The memory search query for a session in this language."""
+    return SESSION_QUERIES["zh" if is_chinese(language) else "en"]
+
+
+def memory_text(memory) -> str:
+    return memory.get("memory", str(memory)) if isinstance(memory, dict) else str(memory)
+
+
+def _timestamp(memory) -> Optional[float]:
+    if not isinstance(memory, dict):
+        return None
+    value = memory.get("updated_at") or memory.get("created_at")
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.astimezone()  # naive timestamps are local time
+    return parsed.timestamp()
+
+
+def rank_memories(
+    memories: List[Dict],
+    language: str = "en-US",
+    token_budget: int = MEMORY_TOKEN_BUDGET,
+    max_items: int = MEMORY_MAX_ITEMS,
+    now: Optional[float] = None,
+    query: Optional[str] = None,
+) -> List[Dict]:
+    """
+    Pick the memories worth putting in the prompt.
+
+    Args:
+        memories: Candidate memories, oldest first (as mem0 returns them)
+        language: Session language code (cmn-CN favours Chinese memories)
+        token_budget: Estimated prompt tokens the selection may use
+        max_items: Most memories returned
+        now: Reference time for recency (defaults to the current time)
+        query: What the session is about (defaults to session_query(language))
+
+    Returns:
+        Selected memories, best first
+    """
+    texts = [memory_text(m) for m in memories]
+    keep = [i for i, text in enumerate(texts) if text.strip()]
+    if not keep:
+        return []
+    memories = [memories[i] for i in keep]
+    texts = [texts[i] for i in keep]
+    n = len(memories)
+
+    vectors = np.stack([_embed(text) for text in texts])  # (n, d), rows normalised
+
+    # Recency: exponential decay on age; fall back to list position if undated
+    now = now if now is not None else datetime.now(timezone.utc).timestamp()
+    stamps = np.array([_timestamp(m) for m in memories], dtype=float)  # None -> nan
+    if np.isnan(stamps).all():
+        stamps = now - (n - 1 - np.arange(n)) * 86400.0  # one "day" per position
+    else:
+        stamps = np.where(np.isnan(stamps), np.nanmin(stamps), stamps)
+    age_days = np.clip(now - stamps, 0, None) / 86400.0
+    recency = 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+
+    # Relevance: similarity to the session's query (independent of age)
+    relevance = np.clip(vectors @ _embed(query or session_query(language)), 0, 1)
+
+    # Language: share of CJK characters, or its complement for other languages
+    cjk_share = np.array([len(CJK_RE.findall(t)) / max(1, len(t.replace(" ", ""))) for t in texts])
+    language_match = cjk_share if is_chinese(language) else 1 - cjk_share
+
+    scores = RELEVANCE_WEIGHT * relevance + RECENCY_WEIGHT * recency + LANGUAGE_WEIGHT * language_match
+
+    selected: List[int] = []
+    used = 0
+    for i in np.argsort(-scores):
+        if len(selected) >= max_items:
+            break
+        cost = estimate_tokens(texts[i])
+        if used + cost > token_budget:
+            continue  # a shorter memory further down may still fit
+        if selected and (vectors[selected] @ vectors[i]).max() >= DUPLICATE_SIMILARITY:
+            continue
+        selected.append(int(i))
+        used += cost
+
+    return [memories[i] for i in selected]
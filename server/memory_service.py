@@ -1,28 +1,165 @@
 """
 Memory Service using mem0 Platform API for persistent conversation memory.
 User display name-based tracking for StudyMate AI assistant.
+
+MemoryService is the blocking client (scripts, threads); AsyncMemoryService
+has the same methods as coroutines for the FastAPI server and the avatar
+agent, so mem0 calls never block their event loops.
 """
+import asyncio
 import os
-from typing import List, Dict, Optional
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Iterator, List, Dict, Optional, Tuple
 from datetime import datetime
-from mem0 import MemoryClient
+import aiohttp
+from mem0 import AsyncMemoryClient, MemoryClient
+
+from metrics import instrument_client, track_dependency
+
+MEM0_ENTITIES_URL = "https://api.mem0.ai/v1/entities/"
+MEM0_CONNECT_TIMEOUT = 5  # seconds to establish a connection to mem0's REST API
+MEM0_READ_TIMEOUT = 15  # seconds to wait for a response page
+
 
-class MemoryService:
+class MemoryCache:
     """
-    Manages conversation memory using mem0 Platform API with user display name identification.
+    Bounded LRU cache with a TTL, keyed per user so writes can invalidate
+    everything cached for that user. Thread-safe, since the sync service
+    may be called from several threads.
+    
+    Each user has a generation that invalidate_user() bumps. A read takes
+    the generation before it starts and passes it to set(), so a read that
+    was in flight during a write can't put its stale result back.
+    """
+    
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 60):
+        """
+        Args:
+            max_entries: Entries kept before the least recently used is evicted
+            ttl_seconds: Lifetime of an entry
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()  # {key: (deadline, value)}
+        self._generations: Dict[str, int] = {}  # {user_id: invalidations so far}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def get(self, key: Tuple) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                    self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def generation(self, user_id: str) -> int:
+        """The user's current generation; take it before reading from mem0."""
+        with self._lock:
+            return self._generations.get(user_id, 0)
+    
+    def set(self, key: Tuple, value: Any, generation: int) -> None:
+        """Store a read's result unless the user was invalidated since it started."""
+        with self._lock:
+            if self._generations.get(key[0], 0) != generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def invalidate_user(self, user_id: str) -> None:
+        """Drop every entry cached for a user (keys start with the user_id)."""
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            stale = [key for key in self._entries if key[0] == user_id]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+class _MemoryFormatting:
+    """
+    Context formatting shared by every memory service, mem0 or local.
+    """
+    
+    def format_memories_for_context(self, memories: List[Dict]) -> str:
+        """
+        Format memories into a context string for the LLM.
+        
+        Args:
+            memories: List of memory dictionaries
+            
+        Returns:
+            Formatted string for LLM context
+        """
+        if not memories:
+            return ""
+        
+        context_parts = ["# Previous Conversation Memories"]
+        
+        for i, memory in enumerate(memories, 1):
+            # mem0 memories are dicts with 'memory' key
+            if isinstance(memory, dict):
+                content = memory.get('memory', str(memory))
+                context_parts.append(f"{i}. {content}")
+            else:
+                context_parts.append(f"{i}. {str(memory)}")
+        
+        return "\n".join(context_parts)
+
+
+class _MemoryServiceBase(_MemoryFormatting):
+    """
+    Configuration and cache shared by the sync and async mem0 services.
     """
     
-    def __init__(self, api_key: Optional[str] = None):
+    client_class = None  # mem0 client class built in __init__
+    
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        cache_size: Optional[int] = None,
+        cache_ttl: Optional[float] = None,
+    ):
         """
         Initialize Memory Service with mem0 Platform API.
         
         Args:
             api_key: mem0 API key (falls back to MEM0_API_KEY env var)
+            cache_size: Cached lookups kept (falls back to MEMORY_CACHE_SIZE env var, default 512)
+            cache_ttl: Seconds a cached lookup stays fresh (falls back to MEMORY_CACHE_TTL env var, default 60)
         """
         mem0_api_key = api_key or os.getenv("MEM0_API_KEY")
         
         if not mem0_api_key:
             raise ValueError("MEM0_API_KEY is required for mem0 Platform API")
+        self.api_key = mem0_api_key
         
         # Optional: Get organization and project IDs
         org_id = os.getenv("MEM0_ORG_ID")
@@ -40,7 +177,15 @@ class MemoryService:
                 client_params["project_id"] = project_id
                 print(f"[MemoryService] 📁 Using project: {project_id}")
             
-            self.client = MemoryClient(**client_params)
+            # Each client call is timed for /metrics (dependency="mem0")
+            self.client = instrument_client(self.client_class(**client_params), "mem0")
+            
+            # Read-through cache for get_all_memories/get_relevant_memories,
+            # invalidated per user by every write
+            self.cache = MemoryCache(
+                max_entries=cache_size if cache_size is not None else int(os.getenv("MEMORY_CACHE_SIZE", "512")),
+                ttl_seconds=cache_ttl if cache_ttl is not None else float(os.getenv("MEMORY_CACHE_TTL", "60")),
+            )
             
             print(f"[MemoryService] ✅ Initialized with mem0 Platform API")
             print(f"[MemoryService] 🌐 Using managed cloud infrastructure")
@@ -53,6 +198,43 @@ class MemoryService:
             print(f"[MemoryService] Traceback: {traceback.format_exc()}")
             raise
     
+    def cache_stats(self) -> Dict:
+        """
+        Hit/miss/eviction counters of the read-through memory cache.
+        
+        Returns:
+            Dictionary of cache counters
+        """
+        return self.cache.stats()
+    
+    @staticmethod
+    def _entity_page(data) -> Tuple[List[Dict], Optional[str]]:
+        """Results and next-page URL of one entities response (paginated or not)."""
+        if isinstance(data, list):
+            return data, None
+        return data.get("results", []), data.get("next")
+    
+    @staticmethod
+    def _split_entities(results: List[Dict]) -> Dict:
+        """Group entities by type."""
+        return {
+            "users": [entity["name"] for entity in results if entity.get("type") == "user"],
+            "agents": [entity["name"] for entity in results if entity.get("type") == "agent"],
+            "runs": [entity["name"] for entity in results if entity.get("type") == "run"],
+        }
+
+
+class MemoryService(_MemoryServiceBase):
+    """
+    Manages conversation memory using mem0 Platform API with user display name identification.
+    """
+    
+    client_class = MemoryClient
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._http = None  # pooled requests.Session for REST calls the SDK lacks
+    
     def get_relevant_memories(self, user_id: str, query: str, limit: int = 5) -> List[Dict]:
         """
         Retrieve relevant memories for a user based on current query.
@@ -65,6 +247,12 @@ class MemoryService:
         Returns:
             List of relevant memory dictionaries
         """
+        cache_key = (user_id, "search", query, limit)
+        generation = self.cache.generation(user_id)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
+        
         try:
             # Search for relevant memories using Platform API
             results = self.client.search(
@@ -74,7 +262,8 @@ class MemoryService:
             )
             
             print(f"[MemoryService] 🔍 Retrieved {len(results)} memories for user: {user_id}")
-            return results
+            self.cache.set(cache_key, results, generation)
+            return list(results)
             
         except Exception as e:
             print(f"[MemoryService] ❌ Error retrieving memories: {e}")
@@ -106,6 +295,7 @@ class MemoryService:
                 }
             )
             
+            self.cache.invalidate_user(user_id)
             print(f"[MemoryService] 💾 Added {role} memory for user: {user_id}")
             return True
             
@@ -139,6 +329,7 @@ class MemoryService:
                 }
             )
             
+            self.cache.invalidate_user(user_id)
             print(f"[MemoryService] 💾 Added conversation turn for user: {user_id}")
             return True
             
@@ -156,18 +347,23 @@ class MemoryService:
         Returns:
             List of all memories
         """
+        cache_key = (user_id, "all")
+        generation = self.cache.generation(user_id)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
+        
         try:
             # Platform API returns list directly
             results = self.client.get_all(user_id=user_id)
             
             # Handle both list and dict response formats
             if isinstance(results, dict) and 'results' in results:
-                memories = results['results']
-                print(f"[MemoryService] 📚 Retrieved {len(memories)} memories for user: {user_id}")
-                return memories
+                results = results['results']
             
             print(f"[MemoryService] 📚 Retrieved {len(results)} memories for user: {user_id}")
-            return results
+            self.cache.set(cache_key, results, generation)
+            return list(results)
             
         except Exception as e:
             print(f"[MemoryService] ❌ Error getting all memories: {e}")
@@ -175,66 +371,264 @@ class MemoryService:
             print(f"[MemoryService] Traceback: {traceback.format_exc()}")
             return []
     
-    def format_memories_for_context(self, memories: List[Dict]) -> str:
+    def _get_http(self):
+        if self._http is None:
+            import requests
+            
+            self._http = requests.Session()
+            self._http.headers["Authorization"] = f"Token {self.api_key}"
+        return self._http
+    
+    def iter_entity_pages(self) -> Iterator[List[Dict]]:
         """
-        Format memories into a context string for the LLM.
+        Yield pages of users, agents and runs from mem0's entities endpoint,
+        following its pagination links.
+        """
+        url = MEM0_ENTITIES_URL
+        while url:
+            with track_dependency("mem0", "entities"):
+                response = self._get_http().get(url, timeout=(MEM0_CONNECT_TIMEOUT, MEM0_READ_TIMEOUT))
+                response.raise_for_status()
+            results, url = self._entity_page(response.json())
+            yield results
+    
+    def get_all_users(self) -> Dict:
+        """
+        Get all users, agents, and runs that have memories in mem0 Platform.
+        Uses the REST API directly for more reliable results.
+        
+        Returns:
+            Dictionary with 'users', 'agents', and 'runs' lists
+        """
+        try:
+            # Use REST API directly (more reliable than SDK's users() method)
+            entities = self._split_entities([
+                entity for page in self.iter_entity_pages() for entity in page
+            ])
+            
+            print(f"[MemoryService] 👥 Retrieved {len(entities['users'])} users, {len(entities['agents'])} agents, {len(entities['runs'])} runs")
+            return entities
+            
+        except Exception as e:
+            print(f"[MemoryService] ❌ Error getting all users: {e}")
+            import traceback
+            print(f"[MemoryService] Traceback: {traceback.format_exc()}")
+            return {"users": [], "agents": [], "runs": []}
+    
+    def delete_memories(self, user_id: str) -> bool:
+        """
+        Delete all memories for a user (use with caution).
         
         Args:
-            memories: List of memory dictionaries
+            user_id: User display name
             
         Returns:
-            Formatted string for LLM context
+            True if successful, False otherwise
         """
-        if not memories:
-            return ""
+        try:
+            self.client.delete_all(user_id=user_id)
+            self.cache.invalidate_user(user_id)
+            print(f"[MemoryService] 🗑️ Deleted all memories for user: {user_id}")
+            return True
+            
+        except Exception as e:
+            print(f"[MemoryService] ❌ Error deleting memories: {e}")
+            return False
+
+
+class AsyncMemoryService(_MemoryServiceBase):
+    """
+    Async counterpart of MemoryService built on mem0's AsyncMemoryClient.
+    
+    Same methods and return values as MemoryService, as coroutines.
+    """
+    
+    client_class = AsyncMemoryClient
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._http: Optional[aiohttp.ClientSession] = None  # for REST calls the SDK lacks
+    
+    def _get_http(self) -> aiohttp.ClientSession:
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(
+                headers={"Authorization": f"Token {self.api_key}"},
+                timeout=aiohttp.ClientTimeout(
+                    total=MEM0_CONNECT_TIMEOUT + MEM0_READ_TIMEOUT,
+                    connect=MEM0_CONNECT_TIMEOUT,
+                    sock_read=MEM0_READ_TIMEOUT,
+                ),
+            )
+        return self._http
+    
+    async def close(self) -> None:
+        """Close the pooled HTTP session."""
+        if self._http is not None and not self._http.closed:
+            await self._http.close()
+        self._http = None
+    
+    async def get_relevant_memories(self, user_id: str, query: str, limit: int = 5) -> List[Dict]:
+        """
+        Retrieve relevant memories for a user based on current query.
         
-        context_parts = ["# Previous Conversation Memories"]
+        Args:
+            user_id: User display name
+            query: Current conversation context or user message
+            limit: Maximum number of memories to retrieve
+            
+        Returns:
+            List of relevant memory dictionaries
+        """
+        cache_key = (user_id, "search", query, limit)
+        generation = self.cache.generation(user_id)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
         
-        for i, memory in enumerate(memories, 1):
-            # mem0 memories are dicts with 'memory' key
-            if isinstance(memory, dict):
-                content = memory.get('memory', str(memory))
-                context_parts.append(f"{i}. {content}")
-            else:
-                context_parts.append(f"{i}. {str(memory)}")
+        try:
+            results = await self.client.search(
+                query=query,
+                user_id=user_id,
+                limit=limit
+            )
+            
+            print(f"[MemoryService] 🔍 Retrieved {len(results)} memories for user: {user_id}")
+            self.cache.set(cache_key, results, generation)
+            return list(results)
+            
+        except Exception as e:
+            print(f"[MemoryService] ❌ Error retrieving memories: {e}")
+            return []
+    
+    async def add_memory(self, user_id: str, message: str, role: str = "user") -> bool:
+        """
+        Add a new memory from the conversation.
         
-        return "\n".join(context_parts)
+        Args:
+            user_id: User display name
+            message: The message content to remember
+            role: Role of the speaker (user or assistant)
+            
+        Returns:
+            True if successful, False otherwise
+        """
+        try:
+            await self.client.add(
+                messages=[{
+                    "role": role,
+                    "content": message
+                }],
+                user_id=user_id,
+                metadata={
+                    "timestamp": datetime.now().isoformat(),
+                    "role": role
+                }
+            )
+            
+            self.cache.invalidate_user(user_id)
+            print(f"[MemoryService] 💾 Added {role} memory for user: {user_id}")
+            return True
+            
+        except Exception as e:
+            print(f"[MemoryService] ❌ Error adding memory: {e}")
+            return False
     
-    def get_all_users(self) -> Dict:
+    async def add_conversation_turn(self, user_id: str, user_message: str, assistant_message: str) -> bool:
         """
-        Get all users, agents, and runs that have memories in mem0 Platform.
-        Uses the REST API directly for more reliable results.
+        Add a complete conversation turn (user + assistant).
         
+        Args:
+            user_id: User display name
+            user_message: User's message
+            assistant_message: Assistant's response
+            
         Returns:
-            Dictionary with 'users', 'agents', and 'runs' lists
+            True if successful, False otherwise
         """
         try:
-            # Use REST API directly (more reliable than SDK's users() method)
-            import requests
+            await self.client.add(
+                messages=[
+                    {"role": "user", "content": user_message},
+                    {"role": "assistant", "content": assistant_message}
+                ],
+                user_id=user_id,
+                metadata={
+                    "timestamp": datetime.now().isoformat(),
+                    "type": "conversation_turn"
+                }
+            )
             
-            api_key = os.getenv("MEM0_API_KEY")
-            url = "https://api.mem0.ai/v1/entities/"
-            headers = {"Authorization": f"Token {api_key}"}
+            self.cache.invalidate_user(user_id)
+            print(f"[MemoryService] 💾 Added conversation turn for user: {user_id}")
+            return True
             
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
+        except Exception as e:
+            print(f"[MemoryService] ❌ Error adding conversation turn: {e}")
+            return False
+    
+    async def get_all_memories(self, user_id: str) -> List[Dict]:
+        """
+        Get all memories for a specific user.
+        
+        Args:
+            user_id: User display name
             
-            data = response.json()
+        Returns:
+            List of all memories
+        """
+        cache_key = (user_id, "all")
+        generation = self.cache.generation(user_id)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
+        
+        try:
+            results = await self.client.get_all(user_id=user_id)
             
-            # Extract entities by type from results
-            results = data.get("results", [])
+            # Handle both list and dict response formats
+            if isinstance(results, dict) and 'results' in results:
+                results = results['results']
             
-            users = [entity["name"] for entity in results if entity.get("type") == "user"]
-            agents = [entity["name"] for entity in results if entity.get("type") == "agent"]
-            runs = [entity["name"] for entity in results if entity.get("type") == "run"]
+            print(f"[MemoryService] 📚 Retrieved {len(results)} memories for user: {user_id}")
+            self.cache.set(cache_key, results, generation)
+            return list(results)
             
-            print(f"[MemoryService] 👥 Retrieved {len(users)} users, {len(agents)} agents, {len(runs)} runs")
+        except Exception as e:
+            print(f"[MemoryService] ❌ Error getting all memories: {e}")
+            import traceback
+            print(f"[MemoryService] Traceback: {traceback.format_exc()}")
+            return []
+    
+    async def iter_entity_pages(self) -> AsyncIterator[List[Dict]]:
+        """
+        Yield pages of users, agents and runs from mem0's entities endpoint,
+        following its pagination links.
+        """
+        url = MEM0_ENTITIES_URL
+        while url:
+            with track_dependency("mem0", "entities"):
+                async with self._get_http().get(url) as response:
+                    response.raise_for_status()
+                    data = await response.json()
+            results, url = self._entity_page(data)
+            yield results
+    
+    async def get_all_users(self) -> Dict:
+        """
+        Get all users, agents, and runs that have memories in mem0 Platform.
+        Uses the REST API over a pooled HTTP session.
+        
+        Returns:
+            Dictionary with 'users', 'agents', and 'runs' lists
+        """
+        try:
+            results = []
+            async for page in self.iter_entity_pages():
+                results.extend(page)
+            entities = self._split_entities(results)
             
-            return {
-                "users": users,
-                "agents": agents,
-                "runs": runs
-            }
+            print(f"[MemoryService] 👥 Retrieved {len(entities['users'])} users, {len(entities['agents'])} agents, {len(entities['runs'])} runs")
+            return entities
             
         except Exception as e:
             print(f"[MemoryService] ❌ Error getting all users: {e}")
@@ -242,7 +636,7 @@ class MemoryService:
             print(f"[MemoryService] Traceback: {traceback.format_exc()}")
             return {"users": [], "agents": [], "runs": []}
     
-    def delete_memories(self, user_id: str) -> bool:
+    async def delete_memories(self, user_id: str) -> bool:
         """
         Delete all memories for a user (use with caution).
         
@@ -253,7 +647,8 @@ class MemoryService:
             True if successful, False otherwise
         """
         try:
-            self.client.delete_all(user_id=user_id)
+            await self.client.delete_all(user_id=user_id)
+            self.cache.invalidate_user(user_id)
             print(f"[MemoryService] 🗑️ Deleted all memories for user: {user_id}")
             return True
             
@@ -265,10 +660,15 @@ class MemoryService:
 # Singleton instance
 _memory_service_instance = None
 
+# "mem0" (hosted mem0 Platform) or "local" (embedded store, see local_memory.py)
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "mem0").lower()
+
 def get_memory_service() -> MemoryService:
     """
     Get or create the singleton MemoryService instance.
     
+    MEMORY_BACKEND=local returns a LocalMemoryService with the same methods.
+    
     Returns:
         MemoryService instance
     """
@@ -276,7 +676,11 @@ def get_memory_service() -> MemoryService:
     
     if _memory_service_instance is None:
         try:
-            _memory_service_instance = MemoryService()
+            if MEMORY_BACKEND == "local":
+                from local_memory import LocalMemoryService
+                _memory_service_instance = LocalMemoryService()
+            else:
+                _memory_service_instance = MemoryService()
             print("[MemoryService] 🎯 Singleton instance created")
         except Exception as e:
             print(f"[MemoryService] ❌ Failed to create singleton: {e}")
@@ -284,3 +688,44 @@ def get_memory_service() -> MemoryService:
     
     return _memory_service_instance
 
+
+# Async singleton instance
+_async_memory_service_instance = None
+_async_memory_service_lock: Optional[asyncio.Lock] = None
+
+async def get_async_memory_service() -> AsyncMemoryService:
+    """
+    Get or create the singleton AsyncMemoryService instance.
+    
+    The mem0 client validates its API key with a blocking request when it is
+    created, so construction runs in a worker thread. MEMORY_BACKEND=local
+    returns an AsyncLocalMemoryService with the same methods.
+    
+    Returns:
+        AsyncMemoryService instance
+    """
+    global _async_memory_service_instance, _async_memory_service_lock
+    
+    if _async_memory_service_instance is None:
+        if _async_memory_service_lock is None:
+            _async_memory_service_lock = asyncio.Lock()
+        async with _async_memory_service_lock:
+            if _async_memory_service_instance is None:
+                try:
+                    if MEMORY_BACKEND == "local":
+                        from local_memory import AsyncLocalMemoryService
+                        service_class = AsyncLocalMemoryService
+                    else:
+                        service_class = AsyncMemoryService
+                    _async_memory_service_instance = await asyncio.to_thread(service_class)
+                    print("[MemoryService] 🎯 Async singleton instance created")
+                except Exception as e:
+                    print(f"[MemoryService] ❌ Failed to create async singleton: {e}")
+                    raise
+    
+    return _async_memory_service_instance
+
+async def close_async_memory_service() -> None:
+    """Close the async singleton's HTTP session, if it was ever created."""
+    if _async_memory_service_instance is not None:
+        await _async_memory_service_instance.close()
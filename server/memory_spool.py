@@ -0,0 +1,344 @@
+"""
+Durable write-behind queue for memory writes.
+
+A write is appended to a JSON-lines spool file on disk (and fsynced) before
+the caller moves on. A background drainer sends spooled writes to the memory
+service in batches and retries with exponential backoff, so a slow or failing
+mem0 never holds up a session, and a write survives a process exit.
+
+Each process appends to its own spool file and holds an exclusive lock on it
+while it runs. A spool file whose lock is free was left by a process that
+exited; drainers adopt such files, finish them and delete them. Progress is a
+byte offset saved next to each spool file after every batch. Delivery is
+at-least-once: a write is sent again only if a process dies between sending
+it and saving the offset.
+"""
+import asyncio
+import glob
+import json
+import os
+import secrets
+import socket
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no adoption of other processes' spools
+    fcntl = None
+
+DEFAULT_SPOOL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "memory_spool")
+
+
+def _try_lock(handle) -> bool:
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+class MemorySpool:
+    """
+    Append-only on-disk queue of memory writes plus its drainer.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        batch_size: int = 8,
+        max_backoff: float = 300,
+        idle_interval: float = 30,
+    ):
+        """
+        Args:
+            path: Spool directory (falls back to MEMORY_SPOOL_DIR env var)
+            batch_size: Spooled writes sent per batch (concurrently across users)
+            max_backoff: Longest wait in seconds between retries of a failing batch
+            idle_interval: Seconds between checks for spools left by exited processes
+        """
+        self.path = path or os.getenv("MEMORY_SPOOL_DIR", DEFAULT_SPOOL_DIR)
+        os.makedirs(self.path, exist_ok=True)
+        self.batch_size = batch_size
+        self.max_backoff = max_backoff
+        self.idle_interval = idle_interval
+
+        name = f"spool-{socket.gethostname()}-{os.getpid()}-{secrets.token_hex(3)}.jsonl"
+        self.spool_file = os.path.join(self.path, name)
+        self._handle = open(self.spool_file, "ab")
+        _try_lock(self._handle)  # held until close(): marks the file as ours
+
+        self._file_lock = threading.Lock()  # appends run in threads; truncation must not interleave
+        self._delivered: set = set()  # ids sent but not yet covered by a saved offset
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._memory_service = None  # what start() drains to
+        self.enqueued = 0
+        self.sent = 0
+        self.failures = 0
+        self.adopted = 0
+
+    # ----- producer side -----
+
+    async def enqueue(self, user_id: str, message: str) -> str:
+        """
+        Durably queue one memory write, appending and fsyncing in a thread
+        so the event loop (shared by every room a worker hosts) isn't blocked.
+
+        Call from the drainer's event loop.
+
+        Args:
+            user_id: User display name
+            message: Text to remember, sent to memory as one user message
+
+        Returns:
+            The write's id
+        """
+        entry_id = await asyncio.to_thread(self.enqueue_blocking, user_id, message)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return entry_id
+
+    def enqueue_blocking(self, user_id: str, message: str) -> str:
+        """enqueue() for scripts without a running event loop."""
+        entry = {
+            "id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "message": message,
+            "enqueued_at": datetime.now().isoformat(),
+        }
+        with self._file_lock:
+            self._handle.write(json.dumps(entry, ensure_ascii=False).encode() + b"\n")
+            self._handle.flush()
+            os.fsync(self._handle.fileno())
+            self.enqueued += 1
+        return entry["id"]
+
+    # ----- drainer -----
+
+    def start(self, memory_service) -> None:
+        """Start the background drainer on the running event loop."""
+        self._memory_service = memory_service
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run(memory_service))
+
+    async def run(self, memory_service) -> None:
+        """Drain this process's spool (and adopted ones) until cancelled."""
+        self._wakeup = asyncio.Event()
+        backoff = 1.0
+        while True:
+            self._wakeup.clear()
+            if await self.drain(memory_service):
+                backoff = 1.0
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.idle_interval)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                print(f"[memory_spool] ⏳ Memory writes failing; retrying in {backoff:.0f}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    async def flush(self, memory_service, timeout: Optional[float] = None) -> bool:
+        """
+        Drain until nothing is pending, retrying with backoff.
+
+        Returns:
+            True if everything was sent, False if the timeout ran out first
+        """
+        async def until_drained():
+            backoff = 1.0
+            while not await self.drain(memory_service):
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+        try:
+            await asyncio.wait_for(until_drained(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def stop(self, timeout: float = 10) -> None:
+        """Stop the drainer, give pending writes a last chance, then close."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._memory_service is not None and not await self.flush(self._memory_service, timeout=timeout):
+            print(f"[memory_spool] ⚠️ Writes still pending in {self.spool_file}; the next process will send them")
+        self.close()
+
+    def close(self) -> None:
+        """Release the spool file, deleting it if everything in it was sent."""
+        with self._file_lock:
+            if self._handle.closed:
+                return
+            if self._read_offset(self.spool_file) >= os.path.getsize(self.spool_file):
+                self._remove(self.spool_file)
+            self._handle.close()  # releases the lock; leftovers can now be adopted
+
+    async def drain(self, memory_service) -> bool:
+        """
+        One pass over our spool and any abandoned ones.
+
+        Returns:
+            True if nothing is left pending
+        """
+        drained = await self._drain_file(self.spool_file, memory_service)
+        if drained:
+            await asyncio.to_thread(self._reset_if_sent)
+
+        if fcntl is None:
+            return drained  # can't tell whether another spool's owner is alive
+
+        for path in glob.glob(os.path.join(self.path, "spool-*.jsonl")):
+            if path == self.spool_file:
+                continue
+            try:
+                handle = open(path, "rb")
+            except OSError:
+                continue
+            try:
+                if not _try_lock(handle):
+                    continue  # its owner is alive, or another drainer adopted it
+                try:
+                    if os.stat(path).st_ino != os.fstat(handle.fileno()).st_ino:
+                        continue
+                except FileNotFoundError:
+                    continue  # finished and removed by another drainer meanwhile
+                if await self._drain_file(path, memory_service):
+                    print(f"[memory_spool] 📦 Finished spool left by an exited process: {os.path.basename(path)}")
+                    self.adopted += 1
+                    self._remove(path)
+                else:
+                    drained = False
+            finally:
+                handle.close()
+        return drained
+
+    def _reset_if_sent(self) -> None:
+        """Start our spool file over once everything in it was sent, so it doesn't grow for the process lifetime."""
+        with self._file_lock:
+            if self._read_offset(self.spool_file) != os.path.getsize(self.spool_file):
+                return
+            # Offset first: a crash before the truncate only resends what was
+            # sent, whereas a stale offset past the new end would skip new writes
+            self._write_offset(self.spool_file, 0)
+            self._handle.truncate(0)
+
+    async def _drain_file(self, path: str, memory_service) -> bool:
+        offset = self._read_offset(path)
+        while True:
+            entries, end = self._read_batch(path, offset)
+            if not entries:
+                if end != offset:
+                    self._write_offset(path, end)  # skipped corrupt lines
+                return True
+
+            # Writes for one user go in order; different users go concurrently
+            by_user: Dict[str, List[Tuple[int, Dict]]] = {}
+            for end, entry in entries:
+                by_user.setdefault(entry["user_id"], []).append((end, entry))
+            results = await asyncio.gather(*(self._send_in_order(memory_service, items) for items in by_user.values()))
+            failed = set().union(*results)
+
+            # Save progress up to the first write that hasn't gone through
+            for end, entry in entries:
+                if entry["id"] in failed:
+                    break
+                offset = end
+                self._delivered.discard(entry["id"])
+            self._write_offset(path, offset)
+            if failed:
+                return False
+
+    async def _send_in_order(self, memory_service, items: List[Tuple[int, Dict]]) -> set:
+        """Send one user's writes in order; returns the ids not sent."""
+        for i, (_, entry) in enumerate(items):
+            if entry["id"] in self._delivered:
+                continue  # sent on an earlier attempt of this batch
+            if not await self._send(memory_service, entry):
+                return {e["id"] for _, e in items[i:]}
+            self._delivered.add(entry["id"])
+        return set()
+
+    async def _send(self, memory_service, entry: Dict) -> bool:
+        # One user message per write: mem0 extracts memories from what the user
+        # side says, and an empty assistant turn would only add noise
+        method, args = memory_service.add_memory, (entry["user_id"], entry["message"])
+        try:
+            if asyncio.iscoroutinefunction(method):
+                ok = await method(*args)
+            else:
+                ok = await asyncio.to_thread(method, *args)  # sync MemoryService (scripts)
+        except Exception as e:
+            print(f"[memory_spool] ⚠️ Memory write failed: {e}")
+            ok = False
+        if ok:
+            self.sent += 1
+        else:
+            self.failures += 1
+        return ok
+
+    # ----- files -----
+
+    def _read_batch(self, path: str, offset: int) -> Tuple[List[Tuple[int, Dict]], int]:
+        """
+        Up to batch_size complete entries after offset.
+
+        Returns:
+            ([(offset after the entry, entry)], offset after the last line read)
+        """
+        entries = []
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # partially written line; picked up next time
+                offset += len(line)
+                try:
+                    entries.append((offset, json.loads(line)))
+                except ValueError:
+                    print(f"[memory_spool] ⚠️ Skipping corrupt line in {os.path.basename(path)}")
+                    continue
+                if len(entries) >= self.batch_size:
+                    break
+        return entries, offset
+
+    @staticmethod
+    def _read_offset(path: str) -> int:
+        try:
+            with open(path + ".offset") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    @staticmethod
+    def _write_offset(path: str, offset: int) -> None:
+        tmp = f"{path}.offset.tmp"
+        with open(tmp, "w") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path + ".offset")
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        for p in (path, path + ".offset"):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict:
+        return {
+            "spool_file": self.spool_file,
+            "pending_bytes": max(0, os.path.getsize(self.spool_file) - self._read_offset(self.spool_file)),
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "failures": self.failures,
+            "adopted_spools": self.adopted,
+        }
@@ -0,0 +1,241 @@
+"""
+Prometheus metrics for the server, exposed by GET /metrics.
+
+Counters and histograms are plain in-process objects: recording a value is a
+dict lookup, a bisect into the bucket bounds and a few additions, so they can
+sit on the request path. Buckets are cumulated only when /metrics is scraped.
+Like the latency traces (tracing.py), values are kept per server process;
+with several uvicorn workers each scrape reaches one of them, so run one
+worker per scrape target or give each its own port.
+
+Metrics:
+- http_request_duration_seconds{method, route, status}: per route template
+- avatar_spawn_duration_seconds{outcome}: room handed to the pool until its
+  agent session is live ("running"), or until it ended without getting there
+- avatar_worker_spawns_total: avatar worker processes started
+- dependency_request_duration_seconds{dependency, operation, outcome}: calls
+  to mem0, Gemini and Expo push
+- expo_push_messages_total{outcome}: push messages by ticket outcome
+"""
+import asyncio
+import contextlib
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+
+# Seconds; a request or dependency call rarely takes more than a few seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Seconds; an avatar takes several seconds to join and start talking
+SPAWN_BUCKETS = (0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 60, 120)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonic count per label set.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()  # the sync memory client reports from threads
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        name = f"{self.name}_total"
+        lines = [f"# HELP {name} {self.help}", f"# TYPE {name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """
+    Bucketed observations per label set.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, List] = {}  # {label values: [per-bucket counts (+Inf last), sum]}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect_left(self.buckets, value)  # first bucket with bound >= value
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe the enclosed block's duration."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        for key, counts, total in sorted(series, key=lambda s: s[0]):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(float(bound)) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ("method", "route", "status"),
+)
+AVATAR_SPAWN_SECONDS = Histogram(
+    "avatar_spawn_duration_seconds",
+    "Time from handing a room to the avatar pool until its session is live (or the attempt ends)",
+    ("outcome",),
+    buckets=SPAWN_BUCKETS,
+)
+AVATAR_WORKER_SPAWNS = Counter(
+    "avatar_worker_spawns",
+    "Avatar worker processes started",
+)
+DEPENDENCY_SECONDS = Histogram(
+    "dependency_request_duration_seconds",
+    "Latency of calls to external services",
+    ("dependency", "operation", "outcome"),
+)
+EXPO_PUSH_MESSAGES = Counter(
+    "expo_push_messages",
+    "Expo push messages by ticket outcome",
+    ("outcome",),
+)
+
+METRICS = (HTTP_REQUEST_SECONDS, AVATAR_SPAWN_SECONDS, AVATAR_WORKER_SPAWNS, DEPENDENCY_SECONDS, EXPO_PUSH_MESSAGES)
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+@contextlib.contextmanager
+def track_dependency(dependency: str, operation: str):
+    """
+    Time a call to an external service.
+
+    The outcome is "error" if the block raises, otherwise "ok" unless the
+    block sets call["outcome"] on the dict it is given (e.g. for an HTTP
+    error status).
+    """
+    start = time.perf_counter()
+    call = {"outcome": None}
+    outcome = "error"
+    try:
+        yield call
+        outcome = call["outcome"] or "ok"
+    finally:
+        DEPENDENCY_SECONDS.observe(time.perf_counter() - start, dependency=dependency, operation=operation, outcome=outcome)
+
+
+class _TimedClient:
+    """Proxy timing every method call of a service client as a dependency call."""
+
+    def __init__(self, client, dependency: str):
+        self._client = client
+        self._dependency = dependency
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+        dependency = self._dependency
+
+        if asyncio.iscoroutinefunction(attr):
+            async def timed(*args, **kwargs):
+                with track_dependency(dependency, name):
+                    return await attr(*args, **kwargs)
+        else:
+            def timed(*args, **kwargs):
+                with track_dependency(dependency, name):
+                    return attr(*args, **kwargs)
+        return timed
+
+
+def instrument_client(client, dependency: str):
+    """Wrap a client (e.g. mem0's) so each call is recorded under the dependency's name."""
+    return _TimedClient(client, dependency)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording each HTTP request's latency by route template.
+
+    The route is the matched path template ("/room-info/{room_name}"), so
+    room names and ids don't create new series; requests matching no route
+    are recorded as "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status[0]),
+            )
@@ -0,0 +1,199 @@
+"""
+Expo push notification dispatcher.
+
+Batches messages into Expo's multi-message requests and sends them over a
+shared aiohttp connection pool with bounded concurrency, returning a result
+per push token. Point EXPO_PUSH_URL at a local stand-in server (see
+expo_standin.py) to test it.
+"""
+import asyncio
+import os
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from metrics import EXPO_PUSH_MESSAGES, track_dependency
+
+EXPO_PUSH_URL = os.getenv("EXPO_PUSH_URL", "https://exp.host/--/api/v2/push/send")
+EXPO_MAX_BATCH_SIZE = 100  # Expo accepts at most 100 messages per request
+
+
+class PushDispatcher:
+    """
+    Sends Expo push messages in batches over a pooled HTTP session.
+    """
+
+    def __init__(
+        self,
+        url: str = EXPO_PUSH_URL,
+        batch_size: int = EXPO_MAX_BATCH_SIZE,
+        max_concurrency: int = 4,
+        timeout: float = 10,
+        max_retries: int = 2,
+        access_token: Optional[str] = None,
+    ):
+        """
+        Args:
+            url: Expo push endpoint (or a local stand-in)
+            batch_size: Messages per request, capped at Expo's limit
+            max_concurrency: Batch requests allowed in flight at once
+            timeout: Total seconds allowed per batch request
+            max_retries: Retries for a batch that Expo cannot have accepted
+                (connection failures before sending, HTTP 429)
+            access_token: Optional Expo access token (falls back to EXPO_ACCESS_TOKEN env var)
+        """
+        self.url = url
+        self.batch_size = max(1, min(batch_size, EXPO_MAX_BATCH_SIZE))
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.access_token = access_token or os.getenv("EXPO_ACCESS_TOKEN")
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            headers = {
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+                "Accept-Encoding": "gzip, deflate",
+            }
+            if self.access_token:
+                headers["Authorization"] = f"Bearer {self.access_token}"
+
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers=headers,
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def close(self) -> None:
+        """Close the pooled HTTP session."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def send(self, messages: List[Dict]) -> List[Dict]:
+        """
+        Send push messages, batching and parallelising the requests.
+
+        Args:
+            messages: Expo message dicts, one per push token ("to")
+
+        Returns:
+            One result per message, in input order:
+            {"to", "ok", "id", "error"}
+        """
+        if not messages:
+            return []
+
+        session = self._get_session()
+        batches = [
+            messages[i:i + self.batch_size]
+            for i in range(0, len(messages), self.batch_size)
+        ]
+        batch_results = await asyncio.gather(
+            *(self._send_batch(session, batch) for batch in batches)
+        )
+
+        results = [result for batch in batch_results for result in batch]
+        sent = sum(1 for r in results if r["ok"])
+        EXPO_PUSH_MESSAGES.inc(sent, outcome="ok")
+        EXPO_PUSH_MESSAGES.inc(len(results) - sent, outcome="error")
+        print(f"[push] 📨 Sent {sent}/{len(results)} notification(s) in {len(batches)} batch(es)")
+        return results
+
+    async def _send_batch(self, session: aiohttp.ClientSession, batch: List[Dict]) -> List[Dict]:
+        # Only retry when Expo cannot have accepted the batch: the connection
+        # was never established, or Expo rate-limited us (429). Timeouts and
+        # 5xx may come after Expo queued the pushes, and resending would ring
+        # devices twice, so those fail the batch instead.
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+
+            try:
+                async with self._semaphore:
+                    with track_dependency("expo", "push") as call:
+                        async with session.post(self.url, json=batch) as response:
+                            if response.status == 429:
+                                call["outcome"] = "rate_limited"
+                                error = f"HTTP 429: {await response.text()}"
+                                continue
+                            if response.status != 200:
+                                call["outcome"] = f"http_{response.status}"
+                                error = f"HTTP {response.status}: {await response.text()}"
+                                break
+                            payload = await response.json()
+                return self._parse_tickets(batch, payload)
+
+            except aiohttp.ClientConnectorError as e:
+                error = f"{type(e).__name__}: {e}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = f"{type(e).__name__}: {e}"
+                break
+
+        print(f"[push] ❌ Batch of {len(batch)} failed: {error}")
+        return [{"to": m.get("to"), "ok": False, "id": None, "error": error} for m in batch]
+
+    @staticmethod
+    def _parse_tickets(batch: List[Dict], payload: Dict) -> List[Dict]:
+        """Pair Expo's push tickets with the messages that produced them."""
+        tickets = payload.get("data", [])
+        if isinstance(tickets, dict):  # single-message response shape
+            tickets = [tickets]
+
+        results = []
+        for i, message in enumerate(batch):
+            ticket = tickets[i] if i < len(tickets) else {}
+            ok = ticket.get("status") == "ok"
+            error = None
+            if not ok:
+                error = (
+                    (ticket.get("details") or {}).get("error")
+                    or ticket.get("message")
+                    or _errors_to_str(payload.get("errors"))
+                    or "missing push ticket"
+                )
+            results.append({
+                "to": message.get("to"),
+                "ok": ok,
+                "id": ticket.get("id"),
+                "error": error,
+            })
+        return results
+
+
+def _errors_to_str(errors) -> Optional[str]:
+    """Flatten Expo's request-level `errors` list into one message string."""
+    if not errors:
+        return None
+    if isinstance(errors, list):
+        return "; ".join(
+            f"{e.get('code')}: {e.get('message')}" if isinstance(e, dict) else str(e)
+            for e in errors
+        )
+    return str(errors)
+
+
+# Singleton instance
+_push_dispatcher_instance = None
+
+def get_push_dispatcher() -> PushDispatcher:
+    """
+    Get or create the singleton PushDispatcher instance.
+
+    Returns:
+        PushDispatcher instance
+    """
+    global _push_dispatcher_instance
+
+    if _push_dispatcher_instance is None:
+        _push_dispatcher_instance = PushDispatcher()
+        print("[push] 🎯 Singleton dispatcher created")
+
+    return _push_dispatcher_instance
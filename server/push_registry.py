@@ -0,0 +1,167 @@
+"""
+Push token registry with secondary indexes for targeted notifications.
+
+Tokens are indexed by user_id and by group/topic (a class or study group),
+so targeted lookups cost O(devices of that user or group) rather than a
+scan over every registered device. Records and indexes live in the shared
+state backend (see state_backend.py), so every server worker sees the same
+registrations.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from state_backend import StateBackend
+
+_ALL_TOKENS = "push:tokens"
+_ALL_GROUPS = "push:groups"
+
+
+def _token_key(token: str) -> str:
+    return f"push:token:{token}"
+
+
+def _user_key(user_id: str) -> str:
+    return f"push:user:{user_id}"
+
+
+def _group_key(group: str) -> str:
+    return f"push:group:{group}"
+
+
+def _device_key(user_id: str, device_name: str) -> str:
+    return f"push:device:{user_id}\x1f{device_name}"
+
+
+class PushTokenRegistry:
+    """
+    Registered Expo push tokens, indexed by user and by group.
+    """
+
+    def __init__(self, state: StateBackend):
+        """
+        Args:
+            state: Backend holding the records and indexes
+        """
+        self.state = state
+
+    async def count(self) -> int:
+        return await self.state.scard(_ALL_TOKENS)
+
+    async def register(
+        self,
+        token: str,
+        user_id: Optional[str] = None,
+        device_name: Optional[str] = None,
+        groups: Optional[Iterable[str]] = None,
+    ) -> Dict:
+        """
+        Register or refresh a device's push token.
+
+        Re-registering a token updates it in place. A new token for the same
+        user and device replaces the old one, so each device is notified once.
+        Concurrent registrations of one device from several workers resolve
+        as last write wins.
+
+        Args:
+            token: Expo push token
+            user_id: Owner of the device
+            device_name: Device label reported by the app
+            groups: Groups/topics to subscribe to (None keeps existing ones)
+
+        Returns:
+            The stored token record
+        """
+        existing = await self.get(token)
+        previous_groups = existing["groups"] if existing else []
+
+        # Same device came back with a new token: drop the stale one
+        device_key = _device_key(user_id, device_name) if user_id and device_name else None
+        if device_key:
+            stale = await self.state.get(device_key)
+            if stale and stale["token"] != token:
+                stale_record = await self.get(stale["token"])
+                if stale_record and not existing:
+                    previous_groups = stale_record["groups"]
+                await self.unregister(stale["token"])
+
+        groups = sorted(set(previous_groups if groups is None else groups))
+
+        if existing:
+            await self._unindex(token, existing)
+
+        record = {
+            "user_id": user_id,
+            "device_name": device_name,
+            "groups": groups,
+            "registered_at": existing["registered_at"] if existing else datetime.now().isoformat(),
+            "updated_at": datetime.now().isoformat(),
+        }
+        await self.state.set(_token_key(token), record)
+        await self.state.sadd(_ALL_TOKENS, token)
+
+        if user_id:
+            await self.state.sadd(_user_key(user_id), token)
+        for group in groups:
+            await self.state.sadd(_group_key(group), token)
+            await self.state.sadd(_ALL_GROUPS, group)
+        if device_key:
+            await self.state.set(device_key, {"token": token})
+
+        return record
+
+    async def unregister(self, token: str) -> bool:
+        """
+        Remove a push token from the registry.
+
+        Returns:
+            True if the token was registered, False otherwise
+        """
+        record = await self.get(token)
+        if record is None:
+            return False
+        await self.state.delete(_token_key(token))
+        await self.state.srem(_ALL_TOKENS, token)
+        await self._unindex(token, record)
+        return True
+
+    async def _unindex(self, token: str, record: Dict) -> None:
+        user_id = record.get("user_id")
+        if user_id:
+            await self.state.srem(_user_key(user_id), token)
+        for group in record.get("groups", []):
+            await self.state.srem(_group_key(group), token)
+            if not await self.state.scard(_group_key(group)):
+                await self.state.srem(_ALL_GROUPS, group)
+
+        device_name = record.get("device_name")
+        if user_id and device_name:
+            device_key = _device_key(user_id, device_name)
+            current = await self.state.get(device_key)
+            if current and current["token"] == token:
+                await self.state.delete(device_key)
+
+    async def tokens_for_user(self, user_id: str) -> List[str]:
+        """All tokens registered to a user."""
+        return list(await self.state.smembers(_user_key(user_id)))
+
+    async def tokens_for_group(self, group: str) -> List[str]:
+        """All tokens subscribed to a group/topic."""
+        return list(await self.state.smembers(_group_key(group)))
+
+    async def all_tokens(self) -> List[str]:
+        return list(await self.state.smembers(_ALL_TOKENS))
+
+    async def get(self, token: str) -> Optional[Dict]:
+        return await self.state.get(_token_key(token))
+
+    async def items(self) -> List[Tuple[str, Dict]]:
+        tokens = sorted(await self.state.smembers(_ALL_TOKENS))
+        records = await self.state.mget([_token_key(token) for token in tokens])
+        return [(token, record) for token, record in zip(tokens, records) if record is not None]
+
+    async def groups(self) -> Dict[str, int]:
+        """Device count per group."""
+        return {
+            group: await self.state.scard(_group_key(group))
+            for group in sorted(await self.state.smembers(_ALL_GROUPS))
+        }
@@ -0,0 +1,149 @@
+"""
+Live participant and track counters for a room the agent is in.
+
+RoomStats follows the room's participant and track events and keeps its
+counts current as they happen, so nothing has to poll the room or walk its
+participants while a session runs. A snapshot is built only when someone asks
+for one (the worker's room_stats op, or a log line when the room ends), and
+inbound bitrate is sampled from the subscribed tracks' WebRTC stats at that
+point only.
+"""
+import asyncio
+import time
+from typing import Dict, Optional, Set, Tuple
+
+from livekit import rtc
+
+
+def _kind(kind) -> str:
+    if kind == rtc.TrackKind.KIND_AUDIO:
+        return "audio"
+    if kind == rtc.TrackKind.KIND_VIDEO:
+        return "video"
+    return "other"
+
+
+class RoomStats:
+    """
+    Event-driven counters for one room's remote participants and tracks.
+    """
+
+    def __init__(self, room: rtc.Room):
+        """
+        Registers the room event handlers; create it before connecting, and
+        call sync() once connected to count who was already there.
+        """
+        self.room = room
+        self.started = time.monotonic()
+        self.published: Dict[str, Dict[str, str]] = {}  # {identity: {track sid: kind}}
+        self.subscribed: Dict[str, rtc.RemoteTrack] = {}  # {track sid: track}
+        self.joined = 0  # participants seen over the room's lifetime
+        self.left = 0
+        self.events = 0
+        self._bytes: Dict[str, Tuple[int, float]] = {}  # {track sid: (bytes received, when)}
+
+        room.on("participant_connected", self._on_participant_connected)
+        room.on("participant_disconnected", self._on_participant_disconnected)
+        room.on("track_published", self._on_track_published)
+        room.on("track_unpublished", self._on_track_unpublished)
+        room.on("track_subscribed", self._on_track_subscribed)
+        room.on("track_unsubscribed", self._on_track_unsubscribed)
+
+    def sync(self) -> None:
+        """Count participants and tracks that were in the room before we joined."""
+        for participant in self.room.remote_participants.values():
+            if participant.identity not in self.published:
+                self.joined += 1
+            tracks = self.published.setdefault(participant.identity, {})
+            for sid, publication in participant.track_publications.items():
+                tracks[sid] = _kind(publication.kind)
+                if publication.track is not None:
+                    self.subscribed[sid] = publication.track
+
+    # ----- event handlers (counters only) -----
+
+    def _on_participant_connected(self, participant: rtc.RemoteParticipant) -> None:
+        self.events += 1
+        self.joined += 1
+        self.published.setdefault(participant.identity, {})
+
+    def _on_participant_disconnected(self, participant: rtc.RemoteParticipant) -> None:
+        self.events += 1
+        self.left += 1
+        for sid in self.published.pop(participant.identity, {}):
+            self.subscribed.pop(sid, None)
+            self._bytes.pop(sid, None)
+
+    def _on_track_published(self, publication: rtc.RemoteTrackPublication, participant: rtc.RemoteParticipant) -> None:
+        self.events += 1
+        self.published.setdefault(participant.identity, {})[publication.sid] = _kind(publication.kind)
+
+    def _on_track_unpublished(self, publication: rtc.RemoteTrackPublication, participant: rtc.RemoteParticipant) -> None:
+        self.events += 1
+        self.published.get(participant.identity, {}).pop(publication.sid, None)
+        self.subscribed.pop(publication.sid, None)
+        self._bytes.pop(publication.sid, None)
+
+    def _on_track_subscribed(
+        self, track: rtc.RemoteTrack, publication: rtc.RemoteTrackPublication, participant: rtc.RemoteParticipant,
+    ) -> None:
+        self.events += 1
+        self.published.setdefault(participant.identity, {})[publication.sid] = _kind(publication.kind)
+        self.subscribed[publication.sid] = track
+
+    def _on_track_unsubscribed(
+        self, track: rtc.RemoteTrack, publication: rtc.RemoteTrackPublication, participant: rtc.RemoteParticipant,
+    ) -> None:
+        self.events += 1
+        self.subscribed.pop(publication.sid, None)
+        self._bytes.pop(publication.sid, None)
+
+    # ----- snapshots -----
+
+    def snapshot(self) -> Dict:
+        """Current participant and track counts."""
+        participants = {}
+        totals = {"audio": 0, "video": 0, "other": 0}
+        for identity, tracks in self.published.items():
+            counts = {"audio": 0, "video": 0, "other": 0, "subscribed": 0}
+            for sid, kind in tracks.items():
+                counts[kind] += 1
+                totals[kind] += 1
+                if sid in self.subscribed:
+                    counts["subscribed"] += 1
+            participants[identity] = counts
+        return {
+            "participants": len(self.published),
+            "joined": self.joined,
+            "left": self.left,
+            "tracks": {**totals, "published": sum(totals.values()), "subscribed": len(self.subscribed)},
+            "by_participant": participants,
+            "events": self.events,
+            "uptime": round(time.monotonic() - self.started, 1),
+        }
+
+    async def bitrates(self, timeout: float = 2.0) -> Dict[str, Optional[float]]:
+        """
+        Inbound kbps per subscribed track since the previous call.
+
+        A track's first sample has no earlier one to compare with, so its
+        rate is None until the next call.
+        """
+        sids = list(self.subscribed)
+        results = await asyncio.gather(
+            *(asyncio.wait_for(self.subscribed[sid].get_stats(), timeout=timeout) for sid in sids),
+            return_exceptions=True,
+        )
+        now = time.monotonic()
+        rates = {}
+        for sid, stats in zip(sids, results):
+            if isinstance(stats, BaseException):
+                continue
+            received = sum(s.inbound_rtp.inbound.bytes_received for s in stats if s.HasField("inbound_rtp"))
+            previous = self._bytes.get(sid)
+            self._bytes[sid] = (received, now)
+            if previous is None or now <= previous[1]:
+                rates[sid] = None
+            else:
+                rates[sid] = round(max(0, received - previous[0]) * 8 / 1000 / (now - previous[1]), 1)
+        return rates
@@ -1,19 +1,26 @@
 import os
-import subprocess
 import asyncio
-import sys
-import requests
+import importlib.util
 import uuid
 import random
 from datetime import datetime
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from dotenv import load_dotenv
 from pydantic import BaseModel
-from typing import Optional
-
-# LiveKit Python server SDK
-from livekit import api  # pip install livekit-api
+from typing import List, Optional
+
+from avatar_pool import AvatarWorkerPool
+from metrics import MetricsMiddleware, render_metrics, track_dependency
+from push_dispatcher import get_push_dispatcher
+from push_registry import PushTokenRegistry
+from call_store import CallStore, CALL_STATUSES
+from entity_snapshot import EntitySnapshot
+from starters_cache import StartersCache
+from state_backend import create_state_backend
+from token_minter import TokenMinter
+from tracing import Tracer
 
 load_dotenv()
 
@@ -44,6 +51,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route request latency for /metrics (outermost, so it covers CORS handling too)
+app.add_middleware(MetricsMiddleware)
+
 class JoinRoomRequest(BaseModel):
     room_name: str
     participant_name: str
@@ -60,6 +70,7 @@ class InitiateCallRequest(BaseModel):
     room_name: str
     caller_name: str
     target_user_id: Optional[str] = None  # Optional: send to specific user
+    target_group: Optional[str] = None  # Optional: send to a class/study group
 
 class SendNotificationRequest(BaseModel):
     to: str
@@ -77,41 +88,94 @@ class CallResponse(BaseModel):
     status: str
     created_at: str
 
+class BulkTokenParticipant(BaseModel):
+    identity: str = ""
+    name: str = ""
+
+class BulkTokenRequest(BaseModel):
+    room_name: str
+    participants: List[BulkTokenParticipant]
+
+class UpdateCallStatusRequest(BaseModel):
+    status: str  # initiated | answered | ended
+
 class RegisterTokenRequest(BaseModel):
     expo_push_token: str
     user_id: Optional[str] = None
     device_name: Optional[str] = None
+    groups: Optional[List[str]] = None  # Class/study groups to receive calls for (None keeps existing)
 
-# Store running avatar processes
-avatar_processes = {}  # {room_name: process}
+# Connection optimization settings
+CONNECTION_TIMEOUT = 10  # seconds
 
-# Background task to monitor and clean up dead avatar processes
-async def cleanup_dead_processes():
-    """Background task to clean up terminated avatar processes"""
-    while True:
-        await asyncio.sleep(5)  # Check every 5 seconds
-        dead_rooms = []
-        for room_name, process in avatar_processes.items():
-            if process.poll() is not None:  # Process has ended
-                dead_rooms.append(room_name)
-                print(f"[server] Cleaned up dead avatar process for room: {room_name}")
-        
-        for room_name in dead_rooms:
-            del avatar_processes[room_name]
+# Largest page returned by paginated listing endpoints
+MAX_PAGE_SIZE = 200
+
+# Most tokens minted by one /tokens/bulk request
+MAX_BULK_TOKENS = 1000
+
+# Shared state (push tokens, calls, avatar room records); see state_backend.py.
+# Use STATE_BACKEND=sqlite or redis when running more than one uvicorn worker.
+state = create_state_backend()
+
+# Credentials are read once; grant templates are cached per room
+token_minter = TokenMinter(LK_API_KEY, LK_API_SECRET)
+
+# Join-to-greeting latency traces and per-phase percentiles (see tracing.py)
+tracer = Tracer()
+
+# Avatar worker pool: long-lived avatar_agent.py processes that host many rooms each
+AVATAR_WORKER_POOL_SIZE = int(os.getenv("AVATAR_WORKER_POOL_SIZE", "2"))
+AVATAR_MAX_ROOMS_PER_WORKER = int(os.getenv("AVATAR_MAX_ROOMS_PER_WORKER", "8"))
+
+avatar_pool = AvatarWorkerPool(
+    size=AVATAR_WORKER_POOL_SIZE,
+    env={
+        **os.environ,
+        "LIVEKIT_URL": LIVEKIT_URL or "",
+        "LIVEKIT_API_KEY": LK_API_KEY,
+        "LIVEKIT_API_SECRET": LK_API_SECRET,
+        "TAVUS_API_KEY": TAVUS_API_KEY or "",
+        "TAVUS_REPLICA_ID": TAVUS_REPLICA_ID or "",
+        "TAVUS_PERSONA_ID": TAVUS_PERSONA_ID or "",
+    },
+    cwd=os.path.dirname(os.path.abspath(__file__)),  # Use server directory
+    state=state,
+    max_rooms_per_worker=AVATAR_MAX_ROOMS_PER_WORKER,
+    request_timeout=CONNECTION_TIMEOUT,
+    tracer=tracer,
+)
 
-# Start cleanup task on app startup
+# Start the avatar worker pool on app startup.
+# Worker exits are picked up by the pool's child watchers as they happen,
+# so there is no periodic cleanup loop.
 @app.on_event("startup")
 async def startup_event():
-    asyncio.create_task(cleanup_dead_processes())
-    print("[server] Started avatar process cleanup task")
+    if int(os.getenv("WEB_CONCURRENCY", "1")) > 1 and not state.shared:
+        print("[server] ⚠️ Multiple workers with the memory state backend; set STATE_BACKEND=sqlite or redis")
+    if TAVUS_API_KEY and TAVUS_REPLICA_ID and TAVUS_PERSONA_ID:
+        await avatar_pool.start()
+        print(f"[server] Started avatar worker pool ({AVATAR_WORKER_POOL_SIZE} workers)")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await avatar_pool.stop()
+    print("[server] Stopped avatar worker pool")
+    await get_push_dispatcher().close()
+    await state.close()
+    try:
+        from memory_service import close_async_memory_service
+        await close_async_memory_service()
+    except ImportError:
+        pass
 
 # Store push tokens and active calls
-push_tokens = {}  # {expo_push_token: {user_id, device_name, registered_at}}
-active_calls = {}  # {call_id: CallResponse}
-
-# Connection optimization settings
-CONNECTION_TIMEOUT = 10  # seconds
-AVATAR_WARMUP_DELAY = 0.5  # seconds
+push_tokens = PushTokenRegistry(state)  # expo_push_token -> {user_id, device_name, groups, registered_at}, indexed by user and group
+active_calls = CallStore(
+    state,
+    ttl_seconds=float(os.getenv("CALL_TTL_SECONDS", "120")),  # ringing calls expire after this
+    max_calls=int(os.getenv("MAX_ACTIVE_CALLS", "10000")),
+)  # {call_id: call dict}, expiring
 
 # Notification message variations - Student-focused invitations to chat with AI agent
 NOTIFICATION_MESSAGES = [
@@ -122,9 +186,41 @@ NOTIFICATION_MESSAGES = [
     "Your AI mentor is available! Time for a learning session!"
 ]
 
-async def start_avatar_agent(room_name: str, language: str = "en-US", display_name: Optional[str] = None) -> bool:
+async def prefetch_memory_context(display_name: Optional[str], language: str, trace_id: Optional[str] = None) -> Optional[str]:
+    """
+    Fetch, rank and format a user's memories for the agent's prompt.
+    Returns None if memory is unavailable, so the agent fetches memories itself.
+    """
+    if not display_name:
+        return None
+    try:
+        from memory_service import get_async_memory_service
+        from memory_ranker import MEMORY_CANDIDATES, rank_memories, session_query
+        
+        with tracer.span(trace_id, "memory_prefetch"):
+            memory_service = await get_async_memory_service()
+            memories = await memory_service.get_relevant_memories(
+                display_name, session_query(language), limit=MEMORY_CANDIDATES,
+            )
+            if not memories:
+                return ""
+            selected = rank_memories(list(memories), language=language)
+        print(f"[server] 📚 Prefetched {len(selected)} of {len(memories)} memories for {display_name}")
+        return memory_service.format_memories_for_context(selected)
+    except Exception as e:
+        print(f"[server] ⚠️ Memory prefetch failed for {display_name}: {e}")
+        return None
+
+async def start_avatar_agent(
+    room_name: str,
+    language: str = "en-US",
+    display_name: Optional[str] = None,
+    trace_id: Optional[str] = None,
+) -> bool:
     """
-    Start an avatar agent process for the specified room.
+    Hand the specified room to an avatar worker from the pool.
+    The user's memory context is prefetched while the room is being assigned
+    and handed to the worker, so the agent doesn't wait on mem0.
     Returns True if successful, False otherwise.
     """
     try:
@@ -132,66 +228,13 @@ async def start_avatar_agent(room_name: str, language: str = "en-US", display_na
         if not (TAVUS_API_KEY and TAVUS_REPLICA_ID and TAVUS_PERSONA_ID):
             print("Tavus credentials not configured")
             return False
-            
-        # Check if avatar is already running for this room
-        if room_name in avatar_processes:
-            process = avatar_processes[room_name]
-            if process.poll() is None:
-                print(f"Avatar already running for room: {room_name}")
-                return True
-            else:
-                # Process has ended, clean it up
-                print(f"Cleaning up dead avatar process for room: {room_name}")
-                del avatar_processes[room_name]
-            
-        # Set environment variables for the agent process
-        env = os.environ.copy()
-        env.update({
-            "LIVEKIT_URL": LIVEKIT_URL,
-            "LIVEKIT_API_KEY": LK_API_KEY,
-            "LIVEKIT_API_SECRET": LK_API_SECRET,
-            "TAVUS_API_KEY": TAVUS_API_KEY,
-            "TAVUS_REPLICA_ID": TAVUS_REPLICA_ID,
-            "TAVUS_PERSONA_ID": TAVUS_PERSONA_ID,
-            "LANGUAGE": language,
-            "USER_DISPLAY_NAME": display_name or "",  # Pass display name for memory
-        })
-        
-        # Start the avatar agent process with virtual environment
-        if os.name == 'nt':  # Windows
-            # Use the current Python executable (which should be from the virtual environment)
-            cmd = [
-                sys.executable, 
-                "avatar_agent.py", "connect",
-                "--room", room_name
-            ]
-        else:  # Unix/Linux/Mac
-            cmd = [
-                sys.executable, 
-                "avatar_agent.py", "connect",
-                "--room", room_name
-            ]
-        
-        print(f"Starting avatar agent with command: {' '.join(cmd)}")
-        
-        # Don't capture output - let it print directly to console
-        process = subprocess.Popen(
-            cmd,
-            env=env,
-            cwd=os.path.dirname(os.path.abspath(__file__)),  # Use server directory
-            stdout=None,  # Print directly to console
-            stderr=None,  # Print directly to console
-            text=True
-        )
-        
-        # Store the process
-        avatar_processes[room_name] = process
-        
-        # Optimized startup delay for faster connection
-        await asyncio.sleep(AVATAR_WARMUP_DELAY)
-        
-        # Check if process is still running
-        if process.poll() is None:
+
+        memory_context = asyncio.create_task(prefetch_memory_context(display_name, language, trace_id))
+        with tracer.span(trace_id, "avatar_assign"):
+            assigned = await avatar_pool.assign_room(
+                room_name, language, display_name, memory_context=memory_context, trace_id=trace_id,
+            )
+        if assigned:
             print(f"✅ Avatar agent started successfully for room: {room_name}")
             print(f"   Avatar agent logs will appear below...")
             return True
@@ -203,49 +246,22 @@ async def start_avatar_agent(room_name: str, language: str = "en-US", display_na
         print(f"Error starting avatar agent: {str(e)}")
         return False
 
-async def send_notification(notification_request: SendNotificationRequest) -> bool:
+def build_push_message(notification_request: SendNotificationRequest) -> dict:
     """
-    Send push notification via Expo Push API
+    Build an Expo push message from a notification request
     """
-    try:
-        message = {
-            "to": notification_request.to,
-            "title": notification_request.title,
-            "body": notification_request.body,
-            "data": notification_request.data,
-            "sound": notification_request.sound,
-            "priority": notification_request.priority
-        }
-        
-        if notification_request.categoryId:
-            message["categoryId"] = notification_request.categoryId
-        
-        response = requests.post(
-            "https://exp.host/--/api/v2/push/send",
-            json=message,
-            headers={
-                "Content-Type": "application/json",
-                "Accept": "application/json",
-                "Accept-Encoding": "gzip, deflate"
-            },
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result.get("data", {}).get("status") == "ok":
-                print(f"✅ Notification sent successfully to {notification_request.to}")
-                return True
-            else:
-                print(f"❌ Notification failed: {result}")
-                return False
-        else:
-            print(f"❌ HTTP error {response.status_code}: {response.text}")
-            return False
-            
-    except Exception as e:
-        print(f"❌ Error sending notification: {str(e)}")
-        return False
+    message = {
+        "to": notification_request.to,
+        "title": notification_request.title,
+        "body": notification_request.body,
+        "data": notification_request.data,
+        "sound": notification_request.sound,
+        "priority": notification_request.priority
+    }
+    
+    if notification_request.categoryId:
+        message["categoryId"] = notification_request.categoryId
+    return message
 
 @app.get("/")
 def health():
@@ -257,21 +273,24 @@ async def register_push_token(request: RegisterTokenRequest):
     Register a device's Expo push token for receiving notifications
     """
     try:
-        push_tokens[request.expo_push_token] = {
-            "user_id": request.user_id,
-            "device_name": request.device_name,
-            "registered_at": datetime.now().isoformat()
-        }
+        record = await push_tokens.register(
+            request.expo_push_token,
+            user_id=request.user_id,
+            device_name=request.device_name,
+            groups=request.groups,
+        )
         
         print(f"📱 Registered push token: {request.expo_push_token[:20]}...")
         print(f"   User ID: {request.user_id}")
         print(f"   Device: {request.device_name}")
+        print(f"   Groups: {record['groups']}")
         
         return {
             "status": "success",
             "message": "Push token registered successfully",
             "token_preview": f"{request.expo_push_token[:20]}...",
-            "total_tokens": len(push_tokens)
+            "groups": record["groups"],
+            "total_tokens": await push_tokens.count()
         }
         
     except Exception as e:
@@ -288,30 +307,44 @@ def token(roomName: str = "demo", identity: str = "", name: str = ""):
         identity = (identity or "").strip() or f"user-{os.urandom(3).hex()}"
         name = (name or identity).strip()
 
-        # Grants: allow this identity to join the given room
-        grants = api.VideoGrants(
-            room_join=True,
-            room=roomName,
-        )
-
-        # Build token with fluent API (current SDK style)
-        token = (
-            api.AccessToken(os.getenv("LIVEKIT_API_KEY"), os.getenv("LIVEKIT_API_SECRET"))
-            .with_identity(identity)   # participant identity (unique per room)
-            .with_name(name)           # display name shown in UIs
-            .with_grants(grants)
-        )
+        # Token from the cached grant template for this room
+        token = token_minter.mint(roomName, identity, name)
 
         return {
-            "token": token.to_jwt(),
+            "token": token,
             "roomName": roomName,
             "identity": identity,
             "name": name,
-            "livekitUrl": os.getenv("LIVEKIT_URL"),
+            "livekitUrl": LIVEKIT_URL,
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"TOKEN_MINT_FAILED: {e}")
 
+@app.post("/tokens/bulk")
+def bulk_tokens(request: BulkTokenRequest):
+    """
+    Mint join tokens for many participants of one room in a single call,
+    e.g. when a whole class joins at once.
+    """
+    if len(request.participants) > MAX_BULK_TOKENS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_TOKENS} participants per request")
+
+    try:
+        participants = [
+            ((p.identity or "").strip() or f"user-{os.urandom(3).hex()}", (p.name or "").strip() or None)
+            for p in request.participants
+        ]
+        return {
+            "roomName": request.room_name,
+            "livekitUrl": LIVEKIT_URL,
+            "tokens": token_minter.mint_many(request.room_name, participants),
+        }
+    except ValueError as e:
+        # Repeated identities would kick each other out of the room
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"TOKEN_MINT_FAILED: {e}")
+
 @app.post("/join-room")
 async def join_room(request: JoinRoomRequest):
     """
@@ -319,44 +352,41 @@ async def join_room(request: JoinRoomRequest):
     This endpoint handles room creation and token generation in one call.
     Optionally starts a Tavus avatar agent for the room.
     """
+    # The trace follows this join through the avatar worker to the first greeting
+    trace_id = tracer.start_trace(room=request.room_name, invite_avatar=request.invite_avatar)
     try:
-        # Generate a unique identity for the participant
-        identity = f"{request.participant_name}-{os.urandom(4).hex()}"
-        
-        # Create video grant for the room
-        grant = api.VideoGrants(
-            room_join=True,
-            room=request.room_name,
-        )
-        
-        # Create access token
-        at = api.AccessToken(LK_API_KEY, LK_API_SECRET)
-        at.with_identity(identity)
-        at.with_grants(grant)
-        
-        # Note: LiveKit rooms are created automatically when the first participant joins
-        # So we don't need to explicitly create the room here
-        
-        response_data = {
-            "token": at.to_jwt(),
-            "room_name": request.room_name,
-            "identity": identity,
-            "livekit_url": LIVEKIT_URL,
-            "participant_name": request.participant_name,
-            "mic_enabled": request.mic_enabled,
-            "camera_enabled": request.camera_enabled
-        }
+        with tracer.span(trace_id, "join_room"):
+            # Generate a unique identity for the participant
+            identity = f"{request.participant_name}-{os.urandom(4).hex()}"
+            
+            # Create access token from the cached grant template for the room
+            with tracer.span(trace_id, "livekit_token"):
+                token = token_minter.mint(request.room_name, identity)
+            
+            # Note: LiveKit rooms are created automatically when the first participant joins
+            # So we don't need to explicitly create the room here
+            
+            response_data = {
+                "token": token,
+                "room_name": request.room_name,
+                "identity": identity,
+                "livekit_url": LIVEKIT_URL,
+                "participant_name": request.participant_name,
+                "mic_enabled": request.mic_enabled,
+                "camera_enabled": request.camera_enabled,
+                "trace_id": trace_id,
+            }
 
-        # Start avatar agent in parallel with token generation for faster connection
-        if request.invite_avatar:
-            print(f"[server] Starting avatar with language: {request.language}, user: {request.participant_name}")
-            # Start avatar agent asynchronously without waiting
-            asyncio.create_task(start_avatar_agent(request.room_name, request.language, request.participant_name))
-            response_data["avatar_invited"] = True  # Assume it will start
-            response_data["avatar_name"] = "AI Assistant"
-            response_data["avatar_status"] = "Starting..."
-        else:
-            response_data["avatar_invited"] = False
+            # Start avatar agent in parallel with token generation for faster connection
+            if request.invite_avatar:
+                print(f"[server] Starting avatar with language: {request.language}, user: {request.participant_name}")
+                # Start avatar agent asynchronously without waiting
+                asyncio.create_task(start_avatar_agent(request.room_name, request.language, request.participant_name, trace_id))
+                response_data["avatar_invited"] = True  # Assume it will start
+                response_data["avatar_name"] = "AI Assistant"
+                response_data["avatar_status"] = "Starting..."
+            else:
+                response_data["avatar_invited"] = False
         
         return response_data
         
@@ -367,7 +397,7 @@ async def join_room(request: JoinRoomRequest):
 async def invite_avatar_to_room(request: InviteAvatarRequest):
     """
     Start a Tavus avatar agent for a room.
-    This will spawn a separate process running the avatar agent.
+    The room is handed to a running avatar worker from the pool.
     """
     try:
         if not (TAVUS_API_KEY and TAVUS_REPLICA_ID and TAVUS_PERSONA_ID):
@@ -376,7 +406,8 @@ async def invite_avatar_to_room(request: InviteAvatarRequest):
                 detail="Tavus credentials not configured. Please set TAVUS_API_KEY, TAVUS_REPLICA_ID, and TAVUS_PERSONA_ID in your .env file"
             )
 
-        avatar_started = await start_avatar_agent(request.room_name)
+        trace_id = tracer.start_trace(room=request.room_name, invite_avatar=True)
+        avatar_started = await start_avatar_agent(request.room_name, trace_id=trace_id)
         
         if avatar_started:
             return {
@@ -405,49 +436,60 @@ async def get_room_info(room_name: str):
     """
     try:
         # Check if avatar is running for this room
-        avatar_running = False
-        if room_name in avatar_processes:
-            process = avatar_processes[room_name]
-            avatar_running = process.poll() is None  # None means still running
+        avatar_running = await avatar_pool.is_room_running(room_name)
+        avatar_room = await avatar_pool.get_room(room_name)
         
         return {
             "room_name": room_name,
             "livekit_url": LIVEKIT_URL,
             "status": "available",
-            "avatar_running": avatar_running
+            "avatar_running": avatar_running,
+            "avatar": avatar_room
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get room info: {str(e)}")
 
+@app.get("/room-stats/{room_name}")
+async def get_room_stats(room_name: str):
+    """
+    Get live participant, track and bitrate stats for a room from its avatar worker.
+    """
+    try:
+        stats = await avatar_pool.room_stats(room_name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get room stats: {str(e)}")
+    if stats is None:
+        avatar_room = await avatar_pool.get_room(room_name)
+        if avatar_room and avatar_room["is_running"]:
+            # Hosted by another server worker's pool; only its owner can ask the avatar worker
+            raise HTTPException(status_code=409, detail=f"Room {room_name} is hosted by server worker {avatar_room['owner']}")
+        raise HTTPException(status_code=404, detail=f"No avatar running for room: {room_name}")
+    return {"room_name": room_name, "stats": stats}
+
 @app.post("/cleanup-avatar/{room_name}")
 async def cleanup_avatar_process(room_name: str):
     """
     Manually clean up a stuck avatar process for a room.
     """
     try:
-        if room_name in avatar_processes:
-            process = avatar_processes[room_name]
-            if process.poll() is None:
-                # Process is still running, terminate it
-                print(f"[server] Terminating avatar process for room: {room_name}")
-                process.terminate()
-                try:
-                    process.wait(timeout=5)
-                    print(f"[server] Avatar process terminated gracefully")
-                except subprocess.TimeoutExpired:
-                    print(f"[server] Force killing avatar process")
-                    process.kill()
-                    process.wait()
-            del avatar_processes[room_name]
+        if await avatar_pool.release_room(room_name):
+            print(f"[server] Released avatar for room: {room_name}")
             return {
                 "success": True,
                 "message": f"Cleaned up avatar process for room: {room_name}"
             }
-        else:
+        avatar_room = await avatar_pool.get_room(room_name)
+        if avatar_room and avatar_room["is_running"]:
+            # Hosted by another server worker's pool; only its owner can stop it
             return {
-                "success": True,
-                "message": f"No avatar process found for room: {room_name}"
+                "success": False,
+                "error": f"Avatar for room {room_name} is hosted by server worker {avatar_room['owner']}",
+                "avatar": avatar_room
             }
+        return {
+            "success": True,
+            "message": f"No avatar process found for room: {room_name}"
+        }
     except Exception as e:
         print(f"[server] Error cleaning up avatar: {str(e)}")
         return {
@@ -460,16 +502,11 @@ async def get_active_avatars():
     """
     Get list of active avatar processes for debugging.
     """
-    active = {}
-    for room_name, process in avatar_processes.items():
-        active[room_name] = {
-            "pid": process.pid,
-            "is_running": process.poll() is None,
-            "returncode": process.returncode
-        }
+    active = await avatar_pool.snapshot()
     return {
         "active_avatars": active,
-        "total_count": len(avatar_processes)
+        "total_count": len(active),
+        "recently_ended": await avatar_pool.recent()
     }
 
 @app.get("/test-tavus")
@@ -489,11 +526,15 @@ async def test_tavus_credentials():
                 }
             }
         
-        # Test basic imports
+        # Check the agent's packages are installed without importing them into
+        # the server process (they only run in the avatar workers)
         try:
-            from livekit import agents
-            from livekit.plugins import tavus
-            imports_ok = True
+            missing = [
+                name for name in ("livekit.agents", "livekit.plugins.tavus")
+                if importlib.util.find_spec(name) is None
+            ]
+            imports_ok = not missing
+            import_error = f"not installed: {', '.join(missing)}" if missing else None
         except ImportError as e:
             imports_ok = False
             import_error = str(e)
@@ -537,18 +578,20 @@ async def initiate_call(request: InitiateCallRequest):
         )
         
         # Store the call
-        active_calls[call_id] = call
-        
-        # Send notification to all registered devices (or specific user)
-        target_tokens = []
-        if request.target_user_id:
-            # Send to specific user's tokens
-            for token, data in push_tokens.items():
-                if data.get("user_id") == request.target_user_id:
-                    target_tokens.append(token)
+        await active_calls.add(call_id, call.model_dump())
+        
+        # Send notification to all registered devices (or specific user/group)
+        if request.target_user_id or request.target_group:
+            # Send to the targeted user's and/or group's tokens via the registry indexes
+            target_tokens = set()
+            if request.target_user_id:
+                target_tokens.update(await push_tokens.tokens_for_user(request.target_user_id))
+            if request.target_group:
+                target_tokens.update(await push_tokens.tokens_for_group(request.target_group))
+            target_tokens = list(target_tokens)
         else:
             # Send to all registered tokens
-            target_tokens = list(push_tokens.keys())
+            target_tokens = await push_tokens.all_tokens()
         
         if not target_tokens:
             return {
@@ -557,34 +600,34 @@ async def initiate_call(request: InitiateCallRequest):
                 "call_id": call_id
             }
         
-        # Send notifications
-        sent_count = 0
+        # Send notifications in batches over the shared dispatcher
+        messages = []
         for token in target_tokens:
-            try:
-                # Select a random message variation for student-focused AI agent invitation
-                random_message = random.choice(NOTIFICATION_MESSAGES)
-                
-                notification_request = SendNotificationRequest(
-                    to=token,
-                    title=f"{request.caller_name} wants to connect with you",
-                    body=random_message,
-                    data={
-                        "type": "incoming_call",
-                        "call_id": call_id,
-                        "room_name": request.room_name,
-                        "caller_name": request.caller_name,
-                        "action": "answer_call"
-                    },
-                    categoryId="incoming-call",
-                    sound="default",
-                    priority="high"
-                )
-                
-                await send_notification(notification_request)
-                sent_count += 1
-                
-            except Exception as e:
-                print(f"Failed to send call notification to token {token}: {str(e)}")
+            # Select a random message variation for student-focused AI agent invitation
+            random_message = random.choice(NOTIFICATION_MESSAGES)
+            
+            notification_request = SendNotificationRequest(
+                to=token,
+                title=f"{request.caller_name} wants to connect with you",
+                body=random_message,
+                data={
+                    "type": "incoming_call",
+                    "call_id": call_id,
+                    "room_name": request.room_name,
+                    "caller_name": request.caller_name,
+                    "action": "answer_call"
+                },
+                categoryId="incoming-call",
+                sound="default",
+                priority="high"
+            )
+            messages.append(build_push_message(notification_request))
+        
+        results = await get_push_dispatcher().send(messages)
+        sent_count = sum(1 for result in results if result["ok"])
+        for result in results:
+            if not result["ok"]:
+                print(f"Failed to send call notification to token {result['to'][:20]}...: {result['error']}")
         
         print(f"📞 Call initiated: {request.caller_name} -> {request.room_name} (ID: {call_id})")
         print(f"📱 Notifications sent to {sent_count} device(s)")
@@ -595,7 +638,8 @@ async def initiate_call(request: InitiateCallRequest):
             "call_id": call_id,
             "room_name": request.room_name,
             "caller_name": request.caller_name,
-            "notifications_sent": sent_count
+            "notifications_sent": sent_count,
+            "notifications_failed": len(results) - sent_count
         }
         
     except Exception as e:
@@ -603,13 +647,35 @@ async def initiate_call(request: InitiateCallRequest):
         raise HTTPException(status_code=500, detail=f"Failed to initiate call: {str(e)}")
 
 @app.get("/active-calls")
-async def get_active_calls():
-    """Get all active calls"""
+async def get_active_calls(offset: int = 0, limit: int = 50):
+    """Get active (unexpired) calls, oldest first, one page at a time"""
+    offset = max(offset, 0)
+    limit = min(max(limit, 1), MAX_PAGE_SIZE)
+    calls = await active_calls.page(offset, limit)
+    total = await active_calls.count()
+    next_offset = offset + len(calls)
+    
     return {
-        "active_calls": list(active_calls.values()),
-        "total_calls": len(active_calls)
+        "active_calls": calls,
+        "total_calls": total,
+        "offset": offset,
+        "limit": limit,
+        "next_offset": next_offset if next_offset < total else None
     }
 
+@app.post("/calls/{call_id}/status")
+async def update_call_status(call_id: str, request: UpdateCallStatusRequest):
+    """Update a call's status (answered/ended); its TTL restarts for the new status"""
+    if request.status not in CALL_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Invalid status. Use one of: {', '.join(CALL_STATUSES)}")
+    
+    call = await active_calls.set_status(call_id, request.status)
+    if call is None:
+        raise HTTPException(status_code=404, detail=f"Call not found or expired: {call_id}")
+    
+    print(f"📞 Call {call_id} -> {request.status}")
+    return call
+
 @app.get("/registered-tokens")
 async def get_registered_tokens():
     """Get all registered push tokens (for debugging)"""
@@ -619,30 +685,48 @@ async def get_registered_tokens():
                 "token_preview": f"{token[:20]}...",
                 "user_id": data.get("user_id"),
                 "device_name": data.get("device_name"),
+                "groups": data.get("groups", []),
                 "registered_at": data.get("registered_at")
             }
-            for token, data in push_tokens.items()
+            for token, data in await push_tokens.items()
         ],
-        "total_tokens": len(push_tokens)
+        "total_tokens": await push_tokens.count(),
+        "groups": await push_tokens.groups()
     }
 
 # ============= Conversation Spark API =============
 
+# mem0 users, kept sorted server-side and reloaded in the background
+user_snapshot = EntitySnapshot(refresh_interval=float(os.getenv("USER_SNAPSHOT_REFRESH_SECONDS", "300")))
+
 @app.get("/api/users")
-async def get_all_users():
-    """Get all unique users from mem0 Platform who have memories stored"""
+async def get_all_users(cursor: Optional[str] = None, limit: Optional[int] = None, exclude: Optional[str] = None):
+    """
+    Get users from mem0 Platform who have memories stored.
+
+    Without limit or cursor the full list is returned, as older app builds
+    expect; passing either pages through it (cursor pagination). exclude
+    (the caller's own display name) is left out of the users and the total.
+    """
+    paginated = limit is not None or cursor is not None
+    if paginated:
+        limit = min(max(limit or MAX_PAGE_SIZE, 1), MAX_PAGE_SIZE)
     try:
-        from memory_service import get_memory_service
+        from memory_service import get_async_memory_service
         
-        memory_service = get_memory_service()
+        memory_service = await get_async_memory_service()
         
-        # Use mem0 Platform's native users() API via memory service
-        # Returns all users, agents, and runs with memories
-        mem0_response = memory_service.get_all_users()
+        # First call loads the snapshot from mem0's entities endpoint;
+        # later calls are served from it while it reloads in the background
+        await user_snapshot.ensure_fresh(memory_service)
         
-        # Extract user_ids from response
-        # Response format: {"users": [...], "agents": [...], "runs": [...]}
-        user_ids = mem0_response.get("users", [])
+        if paginated:
+            try:
+                user_ids, next_cursor = user_snapshot.page(cursor, limit)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        else:
+            user_ids, next_cursor = list(user_snapshot.users), None
         
         # Create user objects with display names
         users = [
@@ -650,52 +734,115 @@ async def get_all_users():
                 "id": user_id,
                 "display_name": user_id
             }
-            for user_id in sorted(user_ids) if user_id  # Filter out empty strings
+            for user_id in user_ids
+            if user_id != exclude
         ]
         
-        print(f"[server] 📊 Found {len(users)} users with memories")
-        return {"users": users, "total": len(users)}
+        return {
+            "users": users,
+            "total": len(user_snapshot) - (exclude in user_snapshot),
+            "limit": limit,
+            "next_cursor": next_cursor
+        }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[server] ❌ Error fetching users from mem0 Platform: {e}")
         import traceback
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Failed to fetch users: {str(e)}")
 
+@app.get("/api/memory-cache")
+async def get_memory_cache_stats():
+    """Memory and conversation-starter cache counters (hits, misses, evictions) for this worker"""
+    try:
+        from memory_service import get_async_memory_service
+        
+        return {
+            **(await get_async_memory_service()).cache_stats(),
+            "conversation_starters": starters_cache.stats()
+        }
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get memory cache stats: {str(e)}")
+
+@app.get("/api/latency")
+async def get_latency_histograms():
+    """p50/p95/p99 per startup phase (server spans and agent phases) over recent joins on this worker"""
+    return {"phases": tracer.histograms()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Request, avatar spawn and dependency latency metrics in Prometheus text format"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/latency/traces/{trace_id}")
+async def get_latency_trace(trace_id: str):
+    """Spans of one /join-room trace, from the join to the agent's first words"""
+    trace = tracer.get_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"Unknown trace: {trace_id}")
+    return trace
+
 class ConversationStartersRequest(BaseModel):
     display_name: str
 
-@app.post("/api/conversation-starters")
-async def generate_conversation_starters(request: ConversationStartersRequest):
-    """Generate conversation starter questions based on a user's memories"""
+DEFAULT_CONVERSATION_STARTERS = [
+    "Hey! How's your studying going?",
+    "What subjects are you focusing on these days?",
+    "Need any study tips or motivation?"
+]
+
+FALLBACK_CONVERSATION_STARTERS = [
+    "Hey! How's your studying going?",
+    "What subjects are you working on?",
+    "Need any study help or tips?",
+    "How are you feeling about your exams?",
+    "Want to be study buddies?"
+]
+
+# Gemini client for conversation starters, created once at startup
+GEMINI_STARTERS_MODEL = os.getenv("GEMINI_STARTERS_MODEL", "gemini-2.0-flash-exp")
+STARTERS_DEADLINE_SECONDS = float(os.getenv("STARTERS_DEADLINE_SECONDS", "3"))  # then serve fallback starters
+GEMINI_REQUEST_TIMEOUT = float(os.getenv("GEMINI_REQUEST_TIMEOUT", "30"))  # background generation gives up after this
+gemini_model = None
+
+def create_gemini_model():
+    """Configure the Gemini SDK and build the starters model once"""
+    import google.generativeai as genai
+    
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        print("[server] ⚠️ GOOGLE_API_KEY not set; conversation starters will use fallbacks")
+        return None
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(
+        GEMINI_STARTERS_MODEL,
+        generation_config={"response_mime_type": "application/json"},
+    )
+
+@app.on_event("startup")
+async def startup_gemini():
+    global gemini_model
     try:
-        from memory_service import get_memory_service
-        import google.generativeai as genai
-        
-        memory_service = get_memory_service()
-        display_name = request.display_name
-        
-        # Get all memories for this user (using display_name as user_id)
-        memories = memory_service.get_all_memories(display_name)
-        
-        if not memories:
-            return {
-                "starters": [
-                    "Hey! How's your studying going?",
-                    "What subjects are you focusing on these days?",
-                    "Need any study tips or motivation?"
-                ],
-                "user_info": f"{display_name} (no memory data yet)"
-            }
-        
-        # Format memories into a context string
-        memory_context = memory_service.format_memories_for_context(memories)
-        
-        # Use Gemini to generate conversation starters
-        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        
-        prompt = f"""Based on this user's study session history, generate 5 specific, friendly conversation starter questions that another student could ask them to break the ice and build a study friendship.
+        gemini_model = create_gemini_model()
+    except Exception as e:
+        print(f"[server] ⚠️ Could not create Gemini client: {e}")
+
+async def generate_starters_with_gemini(memories: List[dict]) -> List[str]:
+    """Ask Gemini for conversation starters based on a user's memories"""
+    from memory_service import get_async_memory_service
+    import json
+    import re
+    
+    if gemini_model is None:
+        raise RuntimeError("Gemini client not configured")
+    
+    # Format memories into a context string
+    memory_context = (await get_async_memory_service()).format_memories_for_context(memories)
+    
+    prompt = f"""Based on this user's study session history, generate 5 specific, friendly conversation starter questions that another student could ask them to break the ice and build a study friendship.
 
 User's Study History:
 {memory_context}
@@ -710,24 +857,60 @@ Requirements:
 Format: Return ONLY a JSON array of 5 strings, nothing else.
 Example: ["How's your photosynthesis revision going?", "Need help with that algebra concept?", ...]"""
 
-        response = model.generate_content(prompt)
+    with track_dependency("gemini", "generate_content"):
+        response = await gemini_model.generate_content_async(
+            prompt,
+            request_options={"timeout": GEMINI_REQUEST_TIMEOUT},
+        )
+    
+    # Extract JSON from response
+    text = response.text.strip()
+    # Remove markdown code blocks if present
+    text = re.sub(r'```json\s*', '', text)
+    text = re.sub(r'```\s*', '', text)
+    
+    return json.loads(text)
+
+# Starters per user, reused until that user's memories change
+starters_cache = StartersCache(generate_starters_with_gemini, deadline=STARTERS_DEADLINE_SECONDS)
+
+@app.post("/api/conversation-starters")
+async def generate_conversation_starters(request: ConversationStartersRequest):
+    """Generate conversation starter questions based on a user's memories"""
+    display_name = request.display_name
+    try:
+        from memory_service import get_async_memory_service
         
-        # Parse the JSON response
-        import json
-        import re
+        memory_service = await get_async_memory_service()
         
-        # Extract JSON from response
-        text = response.text.strip()
-        # Remove markdown code blocks if present
-        text = re.sub(r'```json\s*', '', text)
-        text = re.sub(r'```\s*', '', text)
+        # Get all memories for this user (using display_name as user_id)
+        memories = await memory_service.get_all_memories(display_name)
         
-        starters = json.loads(text)
+        if memories:
+            user_snapshot.add_user(display_name)
+        else:
+            return {
+                "starters": DEFAULT_CONVERSATION_STARTERS,
+                "user_info": f"{display_name} (no memory data yet)"
+            }
+        
+        # Cached while the memory set is unchanged; stale results are served
+        # while a background refresh runs
+        result = await starters_cache.get(display_name, memories)
+        if result is None:
+            # Gemini missed the deadline; its answer will be cached for next time
+            return {
+                "starters": FALLBACK_CONVERSATION_STARTERS,
+                "user_info": display_name,
+                "memory_count": len(memories),
+                "cache": "pending"
+            }
         
         return {
-            "starters": starters,
+            "starters": result["starters"],
             "user_info": display_name,
-            "memory_count": len(memories)
+            "memory_count": len(memories),
+            "cache": result["cache"]
         }
         
     except Exception as e:
@@ -737,13 +920,7 @@ Example: ["How's your photosynthesis revision going?", "Need help with that alge
         
         # Return fallback starters
         return {
-            "starters": [
-                "Hey! How's your studying going?",
-                "What subjects are you working on?",
-                "Need any study help or tips?",
-                "How are you feeling about your exams?",
-                "Want to be study buddies?"
-            ],
+            "starters": FALLBACK_CONVERSATION_STARTERS,
             "user_info": display_name,
             "error": "Using fallback questions"
         }
@@ -752,11 +929,13 @@ if __name__ == "__main__":
     import uvicorn
     # Use production settings when deployed
     is_production = os.getenv("RENDER") == "true" or os.getenv("ENVIRONMENT") == "production"
+    # More than one worker needs STATE_BACKEND=sqlite (one host) or redis (many hosts)
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
     
     uvicorn.run(
         "server:app",
         host=os.getenv("HOST", "127.0.0.1"),
         port=int(os.getenv("PORT", "3001")),
-        reload=not is_production,  # Disable reload in production
-        workers=1 if is_production else 1,  # Single worker for now
+        reload=not is_production and workers == 1,  # Disable reload in production (uvicorn can't reload multiple workers)
+        workers=workers,
     )
@@ -0,0 +1,154 @@
+"""
+Conversation-starter cache for /api/conversation-starters.
+
+Starters are cached per display_name together with a fingerprint of the
+memories they were generated from. While the fingerprint matches, requests
+are served from the cache. When new memories land, the stale starters are
+served immediately while a single background task regenerates them.
+A first request that outlives the deadline gets no starters (the caller
+serves its fallback) while generation finishes in the background and fills
+the cache for the next request.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+
+def memory_fingerprint(memories: List[Dict]) -> str:
+    """Stable hash of a user's memory set, independent of ordering."""
+    parts = sorted(
+        json.dumps(
+            [m.get("id"), m.get("updated_at"), m.get("memory")] if isinstance(m, dict) else str(m),
+            sort_keys=True,
+            default=str,
+        )
+        for m in memories
+    )
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+class StartersCache:
+    """
+    Per-user starters, keyed by memory fingerprint, with stale-while-refresh.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[[List[Dict]], Awaitable[List[str]]],
+        max_users: int = 1024,
+        deadline: Optional[float] = None,
+    ):
+        """
+        Args:
+            generate: Coroutine turning a user's memories into starters
+            max_users: Users whose starters are kept (least recently used go first)
+            deadline: Seconds a cache miss may wait for generation (None waits forever)
+        """
+        self.generate = generate
+        self.max_users = max_users
+        self.deadline = deadline
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()  # {display_name: entry}
+        self._refreshing: Dict[str, asyncio.Task] = {}  # {display_name: generation task}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.deadline_misses = 0
+
+    async def get(self, display_name: str, memories: List[Dict]) -> Optional[Dict]:
+        """
+        Starters for a user's current memories.
+
+        Args:
+            display_name: User the starters are for
+            memories: The user's current memories
+
+        Returns:
+            {"starters", "memory_count", "generated_at", "cache"} where cache is
+            "hit", "stale" (refresh running in the background) or "miss";
+            None if a miss ran past the deadline (generation continues)
+        """
+        fingerprint = memory_fingerprint(memories)
+        entry = self._entries.get(display_name)
+
+        if entry is not None:
+            self._entries.move_to_end(display_name)
+            if entry["fingerprint"] == fingerprint:
+                self.hits += 1
+                return self._result(entry, "hit")
+
+            self.stale_hits += 1
+            self._refresh(display_name, fingerprint, memories)
+            return self._result(entry, "stale")
+
+        self.misses += 1
+        task = self._refresh(display_name, fingerprint, memories)
+        try:
+            # Shielded so a deadline or client disconnect doesn't cancel generation
+            entry = await asyncio.wait_for(asyncio.shield(task), timeout=self.deadline)
+        except asyncio.TimeoutError:
+            self.deadline_misses += 1
+            print(f"[starters] ⏱️ Starters for {display_name} missed the {self.deadline}s deadline; finishing in background")
+            return None
+        return self._result(entry, "miss")
+
+    def _refresh(self, display_name: str, fingerprint: str, memories: List[Dict]) -> asyncio.Task:
+        """Start (or join) the single generation task for a user."""
+        task = self._refreshing.get(display_name)
+        if task is None or task.done():
+            task = asyncio.create_task(self._generate(display_name, fingerprint, memories))
+            # Background refreshes have no awaiter; mark their errors as handled
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._refreshing[display_name] = task
+        return task
+
+    async def _generate(self, display_name: str, fingerprint: str, memories: List[Dict]) -> Dict:
+        try:
+            starters = await self.generate(memories)
+            entry = {
+                "fingerprint": fingerprint,
+                "starters": starters,
+                "memory_count": len(memories),
+                "generated_at": time.time(),
+            }
+            self._entries[display_name] = entry
+            self._entries.move_to_end(display_name)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+            print(f"[starters] ✨ Generated starters for {display_name} ({len(memories)} memories)")
+            return entry
+        except Exception as e:
+            # Stale starters, if any, keep being served until a refresh succeeds
+            print(f"[starters] ❌ Failed to generate starters for {display_name}: {e}")
+            raise
+        finally:
+            self._refreshing.pop(display_name, None)
+
+    def invalidate(self, display_name: Optional[str] = None) -> None:
+        """Forget cached starters for one user, or for everyone."""
+        if display_name is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(display_name, None)
+
+    @staticmethod
+    def _result(entry: Dict, cache: str) -> Dict:
+        return {
+            "starters": entry["starters"],
+            "memory_count": entry["memory_count"],
+            "generated_at": entry["generated_at"],
+            "cache": cache,
+        }
+
+    def stats(self) -> Dict:
+        return {
+            "users": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "deadline_misses": self.deadline_misses,
+            "deadline_seconds": self.deadline,
+            "refreshing": len(self._refreshing),
+        }
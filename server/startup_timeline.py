@@ -0,0 +1,81 @@
+"""
+Per-session startup timeline for the avatar agent.
+
+An agent session starts as a small dependency graph: the room connect,
+memory service setup, memory retrieval, plugin construction and the Tavus
+start run concurrently wherever they don't depend on each other. Each phase
+records when it started and ended relative to the start of the session, so
+the overlap (and the phase that gates the greeting) is visible per session.
+The timeline carries the session's trace id and wall-clock start, so the
+server can add its phases to the /join-room trace (see tracing.py).
+"""
+import contextlib
+import time
+from typing import Awaitable, Dict, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class StartupTimeline:
+    """
+    Start/end offsets of a session's startup phases.
+    """
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id
+        self.started = time.monotonic()
+        self.started_at = time.time()  # wall clock, to line up with server spans
+        self.phases: Dict[str, Dict] = {}  # {name: {"start", "end", "duration", "ok"}}
+        self.details: Dict = {}  # facts about the session's startup, e.g. prompt size
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Time the enclosed block as one phase (failed phases are kept, with ok=False)."""
+        start = time.monotonic()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            end = time.monotonic()
+            self.phases[name] = {
+                "start": round(start - self.started, 3),
+                "end": round(end - self.started, 3),
+                "duration": round(end - start, 3),
+                "ok": ok,
+            }
+
+    def note(self, **details) -> None:
+        self.details.update(details)
+
+    def mark(self, name: str) -> None:
+        """Record an instant (e.g. first_words) as a zero-length phase."""
+        if name not in self.phases:
+            with self.phase(name):
+                pass
+
+    async def run(self, name: str, awaitable: Awaitable[T]) -> T:
+        """Await something as one phase."""
+        with self.phase(name):
+            return await awaitable
+
+    def to_dict(self) -> Dict:
+        ordered: List[Dict] = sorted(
+            ({"phase": name, **timing} for name, timing in self.phases.items()),
+            key=lambda p: p["start"],
+        )
+        total = max((p["end"] for p in ordered), default=0.0)
+        return {
+            "trace_id": self.trace_id,
+            "started_at": self.started_at,
+            "total": total,
+            "phases": ordered,
+            "details": self.details,
+        }
+
+    def summary(self) -> str:
+        """One-line rendering for logs, e.g. 'room_connect 0.00-0.41s, ...'."""
+        return ", ".join(
+            f"{p['phase']} {p['start']:.2f}-{p['end']:.2f}s{'' if p['ok'] else ' (failed)'}"
+            for p in self.to_dict()["phases"]
+        )
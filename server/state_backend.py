@@ -0,0 +1,478 @@
+"""
+Pluggable shared state for the StudyMate server.
+
+The push token registry, call store and avatar room records keep their data
+in a StateBackend instead of module-level dicts, so several uvicorn workers
+(or hosts) can answer the same requests. Three backends are available:
+
+- memory: per-process dicts (default; single uvicorn worker only)
+- sqlite: an embedded SQLite database in WAL mode (multiple workers, one host)
+- redis:  any Redis-protocol server (multiple hosts)
+
+Select one with STATE_BACKEND=memory|sqlite|redis, plus STATE_SQLITE_PATH or
+REDIS_URL. Values are JSON-serialisable dicts; sets and sorted sets are used
+for secondary indexes, and claim() gives one owner a key atomically (e.g. so
+only one server worker puts an avatar in a room).
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set
+
+
+class StateBackend:
+    """
+    Interface every state backend implements.
+
+    All methods are coroutines so network backends don't block the event loop.
+    """
+
+    name = "base"
+    shared = False  # True if other processes see the same data
+
+    async def get(self, key: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def mget(self, keys: List[str]) -> List[Optional[Dict]]:
+        return [await self.get(key) for key in keys]
+
+    async def set(self, key: str, value: Dict, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    async def delete(self, *keys: str) -> None:
+        raise NotImplementedError
+
+    async def sadd(self, key: str, *members: str) -> None:
+        raise NotImplementedError
+
+    async def srem(self, key: str, *members: str) -> None:
+        raise NotImplementedError
+
+    async def smembers(self, key: str) -> Set[str]:
+        raise NotImplementedError
+
+    async def scard(self, key: str) -> int:
+        return len(await self.smembers(key))
+
+    async def zadd(self, key: str, member: str, score: float) -> None:
+        raise NotImplementedError
+
+    async def zrem(self, key: str, *members: str) -> None:
+        raise NotImplementedError
+
+    async def zrange(self, key: str, start: int, stop: int) -> List[str]:
+        """Members by rank, lowest score first; `stop` is inclusive, -1 for the end."""
+        raise NotImplementedError
+
+    async def zrangebyscore(self, key: str, min_score: float, max_score: float, limit: Optional[int] = None) -> List[str]:
+        raise NotImplementedError
+
+    async def zcard(self, key: str) -> int:
+        raise NotImplementedError
+
+    async def claim(self, key: str, owner: str, ttl: float) -> bool:
+        """
+        Atomically take a key if no one holds it (or the holder's claim expired).
+
+        A held claim is refused even to its own owner, so two concurrent
+        claims from one process can't both succeed either.
+
+        Returns:
+            True if `owner` now holds the claim, False if it was already held
+        """
+        raise NotImplementedError
+
+    async def release_claim(self, key: str, owner: str) -> None:
+        """Give up a claim, only if `owner` still holds it."""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryStateBackend(StateBackend):
+    """
+    Per-process dicts. Only correct with a single uvicorn worker.
+    """
+
+    name = "memory"
+    shared = False
+
+    def __init__(self):
+        self._kv: Dict[str, Dict] = {}
+        self._expires: Dict[str, float] = {}
+        self._sets: Dict[str, Set[str]] = {}
+        self._zsets: Dict[str, Dict[str, float]] = {}
+        self._claims: Dict[str, tuple] = {}  # {key: (owner, expires at)}
+        self._claims_lock = threading.Lock()
+
+    async def get(self, key: str) -> Optional[Dict]:
+        deadline = self._expires.get(key)
+        if deadline is not None and deadline <= time.time():
+            self._kv.pop(key, None)
+            self._expires.pop(key, None)
+            return None
+        return self._kv.get(key)
+
+    async def set(self, key: str, value: Dict, ttl: Optional[float] = None) -> None:
+        self._kv[key] = value
+        if ttl is None:
+            self._expires.pop(key, None)
+        else:
+            self._expires[key] = time.time() + ttl
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._kv.pop(key, None)
+            self._expires.pop(key, None)
+            self._sets.pop(key, None)
+            self._zsets.pop(key, None)
+
+    async def sadd(self, key: str, *members: str) -> None:
+        self._sets.setdefault(key, set()).update(members)
+
+    async def srem(self, key: str, *members: str) -> None:
+        members_set = self._sets.get(key)
+        if members_set is None:
+            return
+        members_set.difference_update(members)
+        if not members_set:
+            del self._sets[key]
+
+    async def smembers(self, key: str) -> Set[str]:
+        return set(self._sets.get(key, ()))
+
+    async def scard(self, key: str) -> int:
+        return len(self._sets.get(key, ()))
+
+    async def zadd(self, key: str, member: str, score: float) -> None:
+        self._zsets.setdefault(key, {})[member] = score
+
+    async def zrem(self, key: str, *members: str) -> None:
+        zset = self._zsets.get(key)
+        if zset is None:
+            return
+        for member in members:
+            zset.pop(member, None)
+        if not zset:
+            del self._zsets[key]
+
+    def _sorted(self, key: str) -> List[str]:
+        zset = self._zsets.get(key, {})
+        return sorted(zset, key=lambda m: (zset[m], m))
+
+    async def zrange(self, key: str, start: int, stop: int) -> List[str]:
+        members = self._sorted(key)
+        return members[start:] if stop == -1 else members[start:stop + 1]
+
+    async def zrangebyscore(self, key: str, min_score: float, max_score: float, limit: Optional[int] = None) -> List[str]:
+        zset = self._zsets.get(key, {})
+        members = [m for m in self._sorted(key) if min_score <= zset[m] <= max_score]
+        return members if limit is None else members[:limit]
+
+    async def zcard(self, key: str) -> int:
+        return len(self._zsets.get(key, ()))
+
+    async def claim(self, key: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._claims_lock:
+            holder = self._claims.get(key)
+            if holder is not None and holder[1] > now:
+                return False
+            self._claims[key] = (owner, now + ttl)
+            return True
+
+    async def release_claim(self, key: str, owner: str) -> None:
+        with self._claims_lock:
+            holder = self._claims.get(key)
+            if holder is not None and holder[0] == owner:
+                del self._claims[key]
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    Embedded SQLite database in WAL mode, shared by every worker on one host.
+    """
+
+    name = "sqlite"
+    shared = True
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Database file; every worker must point at the same file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_pid: Optional[int] = None
+        self._writes = 0
+
+    def _db(self) -> sqlite3.Connection:
+        # Connections must not cross a fork, so open one per process
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS kv (
+                    key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL
+                );
+                CREATE TABLE IF NOT EXISTS sets (
+                    key TEXT NOT NULL, member TEXT NOT NULL, PRIMARY KEY (key, member)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS zsets (
+                    key TEXT NOT NULL, member TEXT NOT NULL, score REAL NOT NULL, PRIMARY KEY (key, member)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS zsets_by_score ON zsets (key, score, member);
+            """)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _run(self, fn, *args):
+        # sqlite3 blocks (up to the 5s busy timeout under write contention), so
+        # statements run on a dedicated thread rather than the event loop
+        if self._pool is None or self._pool_pid != os.getpid():
+            self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-sqlite")
+            self._pool_pid = os.getpid()
+        return asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+
+    def _execute_sync(self, sql: str, params: tuple) -> List[tuple]:
+        with self._lock:
+            return self._db().execute(sql, params).fetchall()
+
+    def _executemany_sync(self, sql: str, rows: List[tuple]) -> None:
+        with self._lock:
+            self._db().executemany(sql, rows)
+
+    def _rowcount_sync(self, sql: str, params: tuple) -> int:
+        with self._lock:
+            return self._db().execute(sql, params).rowcount
+
+    async def _execute(self, sql: str, params: Iterable = ()) -> List[tuple]:
+        return await self._run(self._execute_sync, sql, tuple(params))
+
+    async def _executemany(self, sql: str, rows: List[tuple]) -> None:
+        await self._run(self._executemany_sync, sql, rows)
+
+    async def get(self, key: str) -> Optional[Dict]:
+        rows = await self._execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    async def mget(self, keys: List[str]) -> List[Optional[Dict]]:
+        if not keys:
+            return []
+        found = {}
+        # Stay under SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = await self._execute(
+                f"SELECT key, value FROM kv WHERE key IN ({','.join('?' * len(chunk))}) "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (*chunk, time.time()),
+            )
+            found.update((k, json.loads(v)) for k, v in rows)
+        return [found.get(key) for key in keys]
+
+    async def set(self, key: str, value: Dict, ttl: Optional[float] = None) -> None:
+        await self._execute(
+            "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (key, json.dumps(value), time.time() + ttl if ttl is not None else None),
+        )
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            await self._execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            await self._execute("DELETE FROM kv WHERE key = ?", (key,))
+            await self._execute("DELETE FROM sets WHERE key = ?", (key,))
+            await self._execute("DELETE FROM zsets WHERE key = ?", (key,))
+
+    async def sadd(self, key: str, *members: str) -> None:
+        await self._executemany("INSERT OR IGNORE INTO sets (key, member) VALUES (?, ?)", [(key, m) for m in members])
+
+    async def srem(self, key: str, *members: str) -> None:
+        await self._executemany("DELETE FROM sets WHERE key = ? AND member = ?", [(key, m) for m in members])
+
+    async def smembers(self, key: str) -> Set[str]:
+        return {row[0] for row in await self._execute("SELECT member FROM sets WHERE key = ?", (key,))}
+
+    async def scard(self, key: str) -> int:
+        return (await self._execute("SELECT COUNT(*) FROM sets WHERE key = ?", (key,)))[0][0]
+
+    async def zadd(self, key: str, member: str, score: float) -> None:
+        await self._execute(
+            "INSERT INTO zsets (key, member, score) VALUES (?, ?, ?) "
+            "ON CONFLICT(key, member) DO UPDATE SET score = excluded.score",
+            (key, member, score),
+        )
+
+    async def zrem(self, key: str, *members: str) -> None:
+        await self._executemany("DELETE FROM zsets WHERE key = ? AND member = ?", [(key, m) for m in members])
+
+    async def zrange(self, key: str, start: int, stop: int) -> List[str]:
+        limit = -1 if stop == -1 else max(0, stop - start + 1)
+        rows = await self._execute(
+            "SELECT member FROM zsets WHERE key = ? ORDER BY score, member LIMIT ? OFFSET ?",
+            (key, limit, start),
+        )
+        return [row[0] for row in rows]
+
+    async def zrangebyscore(self, key: str, min_score: float, max_score: float, limit: Optional[int] = None) -> List[str]:
+        rows = await self._execute(
+            "SELECT member FROM zsets WHERE key = ? AND score >= ? AND score <= ? ORDER BY score, member LIMIT ?",
+            (key, min_score, max_score, -1 if limit is None else limit),
+        )
+        return [row[0] for row in rows]
+
+    async def zcard(self, key: str) -> int:
+        return (await self._execute("SELECT COUNT(*) FROM zsets WHERE key = ?", (key,)))[0][0]
+
+    async def claim(self, key: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        # Inserts, or takes over an expired claim; a live one is left alone (0 rows changed)
+        changed = await self._run(
+            self._rowcount_sync,
+            "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+            "WHERE kv.expires_at IS NOT NULL AND kv.expires_at <= ?",
+            (key, json.dumps({"owner": owner}), now + ttl, now),
+        )
+        return changed == 1
+
+    async def release_claim(self, key: str, owner: str) -> None:
+        await self._execute("DELETE FROM kv WHERE key = ? AND value = ?", (key, json.dumps({"owner": owner})))
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+
+class RedisStateBackend(StateBackend):
+    """
+    Any Redis-protocol server (Redis, Valkey, KeyDB...), shared across hosts.
+    """
+
+    name = "redis"
+    shared = True
+
+    def __init__(self, url: str, prefix: str = "studymate:"):
+        """
+        Args:
+            url: Redis URL, e.g. redis://localhost:6379/0
+            prefix: Namespace prepended to every key
+        """
+        try:
+            import redis.asyncio as redis_asyncio  # pip install redis
+        except ImportError as e:
+            raise RuntimeError("STATE_BACKEND=redis requires the 'redis' package (pip install redis)") from e
+
+        self.prefix = prefix
+        self._redis = redis_asyncio.from_url(url, decode_responses=True)
+
+    def _k(self, key: str) -> str:
+        return self.prefix + key
+
+    async def get(self, key: str) -> Optional[Dict]:
+        value = await self._redis.get(self._k(key))
+        return json.loads(value) if value is not None else None
+
+    async def mget(self, keys: List[str]) -> List[Optional[Dict]]:
+        if not keys:
+            return []
+        values = await self._redis.mget([self._k(k) for k in keys])
+        return [json.loads(v) if v is not None else None for v in values]
+
+    async def set(self, key: str, value: Dict, ttl: Optional[float] = None) -> None:
+        await self._redis.set(self._k(key), json.dumps(value), px=int(ttl * 1000) if ttl is not None else None)
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self._redis.delete(*(self._k(k) for k in keys))
+
+    async def sadd(self, key: str, *members: str) -> None:
+        if members:
+            await self._redis.sadd(self._k(key), *members)
+
+    async def srem(self, key: str, *members: str) -> None:
+        if members:
+            await self._redis.srem(self._k(key), *members)
+
+    async def smembers(self, key: str) -> Set[str]:
+        return set(await self._redis.smembers(self._k(key)))
+
+    async def scard(self, key: str) -> int:
+        return await self._redis.scard(self._k(key))
+
+    async def zadd(self, key: str, member: str, score: float) -> None:
+        await self._redis.zadd(self._k(key), {member: score})
+
+    async def zrem(self, key: str, *members: str) -> None:
+        if members:
+            await self._redis.zrem(self._k(key), *members)
+
+    async def zrange(self, key: str, start: int, stop: int) -> List[str]:
+        return await self._redis.zrange(self._k(key), start, stop)
+
+    async def zrangebyscore(self, key: str, min_score: float, max_score: float, limit: Optional[int] = None) -> List[str]:
+        if limit is None:
+            return await self._redis.zrangebyscore(self._k(key), min_score, max_score)
+        return await self._redis.zrangebyscore(self._k(key), min_score, max_score, start=0, num=limit)
+
+    async def zcard(self, key: str) -> int:
+        return await self._redis.zcard(self._k(key))
+
+    async def claim(self, key: str, owner: str, ttl: float) -> bool:
+        return bool(await self._redis.set(self._k(key), json.dumps({"owner": owner}), nx=True, px=int(ttl * 1000)))
+
+    async def release_claim(self, key: str, owner: str) -> None:
+        # Compare-and-delete in one step so a claim taken over after expiry isn't dropped
+        await self._redis.eval(
+            "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0",
+            1, self._k(key), json.dumps({"owner": owner}),
+        )
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+def create_state_backend(kind: Optional[str] = None) -> StateBackend:
+    """
+    Build the state backend selected by configuration.
+
+    Args:
+        kind: memory, sqlite or redis (falls back to STATE_BACKEND env var)
+
+    Returns:
+        StateBackend instance
+    """
+    kind = (kind or os.getenv("STATE_BACKEND", "memory")).lower()
+
+    if kind == "memory":
+        backend = MemoryStateBackend()
+    elif kind == "sqlite":
+        path = os.getenv("STATE_SQLITE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "state.db"))
+        backend = SQLiteStateBackend(path)
+    elif kind == "redis":
+        backend = RedisStateBackend(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    else:
+        raise ValueError(f"Unknown STATE_BACKEND: {kind} (use memory, sqlite or redis)")
+
+    print(f"[state] 🗄️ Using {backend.name} state backend")
+    return backend
@@ -0,0 +1,144 @@
+"""
+LiveKit access token minting for /token, /join-room and bulk joins.
+
+Credentials are read once. For each room, a claim template is built once
+through the LiveKit SDK and cached, so minting a token only stamps
+identity, name and validity onto a copy of the template and signs it.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import jwt  # PyJWT
+from livekit import api
+
+DEFAULT_TOKEN_TTL = timedelta(hours=6)
+
+
+class TokenMinter:
+    """
+    Mints LiveKit join tokens from cached per-room grant templates.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        api_secret: Optional[str] = None,
+        ttl: timedelta = DEFAULT_TOKEN_TTL,
+        max_templates: int = 1024,
+    ):
+        """
+        Args:
+            api_key: LiveKit API key (falls back to LIVEKIT_API_KEY env var)
+            api_secret: LiveKit API secret (falls back to LIVEKIT_API_SECRET env var)
+            ttl: Lifetime of minted tokens
+            max_templates: Rooms whose grant templates are kept cached
+        """
+        self.api_key = api_key or os.getenv("LIVEKIT_API_KEY")
+        self.api_secret = api_secret or os.getenv("LIVEKIT_API_SECRET")
+        if not (self.api_key and self.api_secret):
+            raise ValueError("LIVEKIT_API_KEY and LIVEKIT_API_SECRET are required to mint tokens")
+
+        self.ttl_seconds = int(ttl.total_seconds())
+        self.max_templates = max_templates
+        self._templates: "OrderedDict[str, Dict]" = OrderedDict()
+        # /token and /tokens/bulk are sync endpoints, so they mint from the threadpool
+        self._templates_lock = threading.Lock()
+
+    def _template(self, room_name: str) -> Dict:
+        """Claims for joining a room, built once through the SDK and cached."""
+        with self._templates_lock:
+            template = self._templates.get(room_name)
+            if template is not None:
+                self._templates.move_to_end(room_name)
+                return template
+
+        grants = api.VideoGrants(
+            room_join=True,
+            room=room_name,
+        )
+        sdk_token = (
+            api.AccessToken(self.api_key, self.api_secret)
+            .with_identity("template")
+            .with_grants(grants)
+            .to_jwt()
+        )
+        template = jwt.decode(sdk_token, self.api_secret, algorithms=["HS256"], options={"verify_aud": False})
+        for claim in ("sub", "name", "nbf", "exp", "iat", "jti"):
+            template.pop(claim, None)
+
+        with self._templates_lock:
+            self._templates[room_name] = template
+            if len(self._templates) > self.max_templates:
+                self._templates.popitem(last=False)
+        return template
+
+    def mint(self, room_name: str, identity: str, name: Optional[str] = None) -> str:
+        """
+        Mint a join token for one participant.
+
+        Args:
+            room_name: Room the token grants access to
+            identity: Participant identity (unique per room)
+            name: Display name shown in UIs
+
+        Returns:
+            Signed JWT
+        """
+        if not identity:
+            raise ValueError("identity must be set when joining a room")
+
+        now = int(time.time())
+        claims = dict(self._template(room_name))
+        claims["sub"] = identity
+        claims["nbf"] = now
+        claims["exp"] = now + self.ttl_seconds
+        if name:
+            claims["name"] = name
+        return jwt.encode(claims, self.api_secret, algorithm="HS256")
+
+    def mint_many(self, room_name: str, participants: Iterable[Tuple[str, Optional[str]]]) -> List[Dict]:
+        """
+        Mint join tokens for many participants of the same room.
+
+        The room template and validity window are resolved once for the whole
+        batch; only the per-participant claims change between signatures.
+
+        Args:
+            room_name: Room the tokens grant access to
+            participants: (identity, name) pairs with unique identities
+
+        Returns:
+            List of {"identity", "name", "token"} in input order
+
+        Raises:
+            ValueError: If an identity is empty or repeated
+        """
+        participants = list(participants)
+        identities = [identity for identity, _ in participants]
+        if not all(identities):
+            raise ValueError("identity must be set when joining a room")
+        if len(set(identities)) != len(identities):
+            seen = set()
+            duplicates = sorted({i for i in identities if i in seen or seen.add(i)})
+            raise ValueError(f"duplicate identities: {', '.join(duplicates)}")
+
+        now = int(time.time())
+        base = dict(self._template(room_name))
+        base["nbf"] = now
+        base["exp"] = now + self.ttl_seconds
+
+        tokens = []
+        for identity, name in participants:
+            claims = dict(base)
+            claims["sub"] = identity
+            claims["name"] = name or identity
+            tokens.append({
+                "identity": identity,
+                "name": name or identity,
+                "token": jwt.encode(claims, self.api_secret, algorithm="HS256"),
+            })
+        return tokens
@@ -0,0 +1,144 @@
+"""
+Join-to-greeting latency tracing.
+
+/join-room starts a trace and the trace id travels with the room to the
+avatar worker (the start_room message, or TRACE_ID in the environment of a
+standalone `avatar_agent.py connect` run), where it tags the agent's startup
+timeline. Server steps are recorded as spans directly. Agent phases arrive
+with the room_running event and are placed on the same trace using the
+timeline's wall-clock start (server and workers share a host clock).
+
+Every span also feeds a bounded window of recent durations per phase, which
+GET /api/latency reports as p50/p95/p99. Traces and samples are kept per
+server process.
+"""
+import contextlib
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def percentile(sorted_samples: List[float], q: float) -> float:
+    """Nearest-rank percentile of already sorted samples (q in 0..100)."""
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, -(-len(sorted_samples) * q // 100))  # ceil
+    return sorted_samples[int(rank) - 1]
+
+
+class Tracer:
+    """
+    Recent traces with their spans, plus per-phase latency samples.
+    """
+
+    def __init__(self, max_traces: int = 500, samples_per_phase: int = 1000):
+        """
+        Args:
+            max_traces: Traces kept for lookup (oldest are dropped first)
+            samples_per_phase: Most recent durations kept per phase for percentiles
+        """
+        self.max_traces = max_traces
+        self.samples_per_phase = samples_per_phase
+        self._traces: "OrderedDict[str, Dict]" = OrderedDict()  # {trace_id: trace}
+        self._samples: Dict[str, Deque[float]] = {}  # {phase: recent durations}
+
+    def start_trace(self, trace_id: Optional[str] = None, **attributes) -> str:
+        """Open a trace starting now and return its id."""
+        trace_id = trace_id or new_trace_id()
+        self._traces[trace_id] = {
+            "trace_id": trace_id,
+            "started_at": time.time(),
+            "attributes": attributes,
+            "spans": [],
+        }
+        while len(self._traces) > self.max_traces:
+            self._traces.popitem(last=False)
+        return trace_id
+
+    def record(self, trace_id: Optional[str], name: str, start: float, end: float, ok: bool = True) -> None:
+        """
+        Add a finished span.
+
+        Args:
+            trace_id: Trace the span belongs to (None: only feed the histogram)
+            name: Phase name
+            start: Wall-clock start (time.time())
+            end: Wall-clock end
+            ok: False if the phase failed
+        """
+        duration = max(0.0, end - start)
+        samples = self._samples.get(name)
+        if samples is None:
+            samples = self._samples[name] = deque(maxlen=self.samples_per_phase)
+        samples.append(duration)
+
+        trace = self._traces.get(trace_id) if trace_id else None
+        if trace is not None:
+            trace["spans"].append({
+                "name": name,
+                "start": round(start - trace["started_at"], 3),
+                "duration": round(duration, 3),
+                "ok": ok,
+            })
+
+    @contextlib.contextmanager
+    def span(self, trace_id: Optional[str], name: str):
+        """Record the enclosed block as a span (kept with ok=False if it raises)."""
+        start = time.time()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.record(trace_id, name, start, time.time(), ok)
+
+    def record_agent_startup(self, trace_id: Optional[str], timeline: Optional[Dict]) -> None:
+        """
+        Add an agent's startup timeline to its trace once the session is running.
+
+        Each agent phase becomes an "agent.<phase>" span, except the
+        first_words instant, which becomes join_to_first_words. The trace
+        also gets join_to_running (now), and the timeline's details (such as
+        prompt size) are added to its attributes.
+        """
+        trace = self._traces.get(trace_id) if trace_id else None
+        if timeline:
+            if trace is not None:
+                trace["attributes"].update(timeline.get("details") or {})
+            started_at = timeline.get("started_at")
+            for phase in timeline.get("phases", []) if started_at is not None else []:
+                if phase["phase"] == "first_words":
+                    if trace is not None:
+                        self.record(trace_id, "join_to_first_words", trace["started_at"], started_at + phase["start"])
+                    continue
+                self.record(
+                    trace_id, f"agent.{phase['phase']}",
+                    started_at + phase["start"], started_at + phase["end"], phase.get("ok", True),
+                )
+        if trace is not None:
+            self.record(trace_id, "join_to_running", trace["started_at"], time.time())
+
+    def get_trace(self, trace_id: str) -> Optional[Dict]:
+        trace = self._traces.get(trace_id)
+        if trace is None:
+            return None
+        return {**trace, "spans": sorted(trace["spans"], key=lambda s: s["start"])}
+
+    def histograms(self) -> Dict[str, Dict]:
+        """{phase: {"count", "p50", "p95", "p99", "max"}} over recent samples, in seconds."""
+        result = {}
+        for name, samples in sorted(self._samples.items()):
+            ordered = sorted(samples)
+            result[name] = {
+                "count": len(ordered),
+                "p50": round(percentile(ordered, 50), 3),
+                "p95": round(percentile(ordered, 95), 3),
+                "p99": round(percentile(ordered, 99), 3),
+                "max": round(ordered[-1], 3),
+            }
+        return result
@@ -0,0 +1,253 @@
+"""
+Session transcripts for the avatar agent.
+
+A session's turns collect in a bounded TranscriptBuffer, and a
+TranscriptStreamer writes them to memory in chunks while the session runs:
+whenever the unsaved text reaches a size limit, and at least every flush
+interval. Agent memory stays flat however long a study session lasts, and
+when the user leaves only the tail since the last chunk is left to save.
+
+Before a chunk is written a TranscriptCompactor trims it: disfluencies and
+backchannel-only turns ("um", "okay", "嗯") are dropped, repeated utterances
+(STT re-commits, the avatar repeating itself) are kept once, and optionally
+the chunk is shrunk to a token budget, keeping the user's turns over the
+assistant's. mem0 then extracts from a smaller payload.
+"""
+import asyncio
+import re
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from prompts import cap_memory_context, estimate_tokens
+
+# Hesitation sounds, removed wherever they appear in a turn
+DISFLUENCY_RE = re.compile(r"[,，]?\s*(?:(?<![\w'])(?:u+m+|u+h+|e+r+m+|h+m+|m{2,})(?![\w'])|[嗯呃]+)[,，.。…]*\s*", re.IGNORECASE)
+# Turns that say nothing beyond acknowledging the other side
+BACKCHANNELS = {
+    "ok", "okay", "mhm", "mm hmm", "uh huh", "i see", "got it", "hello", "hi",
+    "哦", "噢", "啊", "好", "好的", "嗯嗯", "对", "对对",
+}
+_NON_WORD_RE = re.compile(r"[^\w\s]+")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?。！？])\s*")
+
+
+def normalize(text: str) -> str:
+    """Lowercase text without punctuation or repeated spaces, for comparing turns."""
+    return " ".join(_NON_WORD_RE.sub(" ", text.lower()).split())
+
+
+class TranscriptBuffer:
+    """
+    Unsaved user and assistant turns of one session, as a ring buffer.
+
+    If memory writes fall behind (or keep failing), the oldest unsaved turns
+    are dropped rather than letting the buffer grow.
+    """
+
+    def __init__(self, max_turns: int = 500, flush_chars: int = 4000):
+        """
+        Args:
+            max_turns: Unsaved turns kept (oldest are dropped first)
+            flush_chars: Unsaved characters that trigger a flush
+        """
+        self.pending: Deque[str] = deque(maxlen=max_turns)
+        self.pending_chars = 0
+        self.flush_chars = flush_chars
+        self.flush_wanted = asyncio.Event()
+        self.last_user_transcript: Optional[str] = None
+        self.turns = 0  # turns captured over the whole session
+        self.dropped = 0  # turns pushed out before they were saved
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def add(self, role: str, text: str) -> None:
+        text = text.strip()
+        if not text:
+            return
+        self._append(f"{'User' if role == 'user' else 'Assistant'}: {text}")
+        self.turns += 1
+        if role == "user":
+            self.last_user_transcript = text
+
+    def _append(self, line: str) -> None:
+        if len(self.pending) == self.pending.maxlen:
+            self.pending_chars -= len(self.pending[0])
+            self.dropped += 1
+        self.pending.append(line)
+        self.pending_chars += len(line)
+        if self.pending_chars >= self.flush_chars:
+            self.flush_wanted.set()
+
+    def take(self) -> List[str]:
+        """Remove and return all unsaved turns."""
+        turns = list(self.pending)
+        self.pending.clear()
+        self.pending_chars = 0
+        self.flush_wanted.clear()
+        return turns
+
+    def put_back(self, turns: List[str]) -> None:
+        """Return turns whose write failed, ahead of any newer ones."""
+        newer = self.take()
+        for line in turns + newer:
+            self._append(line)
+
+
+class TranscriptCompactor:
+    """
+    Trims transcript chunks before they are written to memory.
+
+    Keeps the recent turns it has seen, so a repeat is caught across chunk
+    boundaries too, and totals what it removed.
+    """
+
+    def __init__(self, window: int = 8, token_budget: int = 0):
+        """
+        Args:
+            window: Recent turns a new turn is compared against for repeats
+            token_budget: Most estimated tokens per chunk (0: no budget)
+        """
+        self.recent: Deque[str] = deque(maxlen=window)
+        self.token_budget = token_budget
+        self.input_chars = 0
+        self.output_chars = 0
+        self.fillers = 0  # turns that were only filler
+        self.duplicates = 0  # repeated turns dropped
+        self.shortened = 0  # chunks cut to the token budget
+        self._undo: Optional[tuple] = None
+
+    def compact(self, turns: List[str]) -> List[str]:
+        """Compact "Role: text" turns, oldest first."""
+        self._undo = (list(self.recent), self.input_chars, self.output_chars, self.fillers, self.duplicates, self.shortened)
+        kept = []
+        for line in turns:
+            self.input_chars += len(line)
+            role, _, text = line.partition(": ")
+            text = " ".join(DISFLUENCY_RE.sub(" ", text).split())
+            key = normalize(text)
+            if not key or key in BACKCHANNELS:
+                self.fillers += 1
+                continue
+            key = f"{role}:{key}"
+            if key in self.recent:
+                self.duplicates += 1
+                continue
+            self.recent.append(key)
+            kept.append(f"{role}: {text}")
+
+        if self.token_budget and estimate_tokens("\n".join(kept)) > self.token_budget:
+            kept = self._fit_budget(kept)
+            self.shortened += 1
+        self.output_chars += sum(len(line) for line in kept)
+        return kept
+
+    def undo(self) -> None:
+        """Forget the last compact() call, e.g. because its chunk wasn't written."""
+        if self._undo is None:
+            return
+        recent, self.input_chars, self.output_chars, self.fillers, self.duplicates, self.shortened = self._undo
+        self.recent.clear()
+        self.recent.extend(recent)
+        self._undo = None
+
+    def _fit_budget(self, turns: List[str]) -> List[str]:
+        # Memories are extracted from what the user said; the assistant's
+        # turns are context, so they give way first: down to their first
+        # sentence, then altogether, and only then is the chunk cut.
+        turns = [
+            _SENTENCE_END_RE.split(line, 1)[0] if line.startswith("Assistant: ") else line
+            for line in turns
+        ]
+        if estimate_tokens("\n".join(turns)) > self.token_budget:
+            turns = [line for line in turns if not line.startswith("Assistant: ")]
+        text, _ = cap_memory_context("\n".join(turns), self.token_budget)
+        return text.split("\n") if text else []
+
+    def stats(self) -> Dict:
+        return {
+            "input_chars": self.input_chars,
+            "output_chars": self.output_chars,
+            "filler_turns": self.fillers,
+            "duplicate_turns": self.duplicates,
+            "budget_cuts": self.shortened,
+        }
+
+
+class TranscriptStreamer:
+    """
+    Writes a session's transcript to memory in bounded chunks.
+    """
+
+    def __init__(
+        self,
+        buffer: TranscriptBuffer,
+        write: Callable[[str], Awaitable[bool]],
+        title: str,
+        interval: float = 300,
+        compactor: Optional[TranscriptCompactor] = None,
+    ):
+        """
+        Args:
+            buffer: The session's transcript buffer
+            write: Coroutine storing one chunk of text; returns False on failure
+            title: Heading for each chunk, e.g. "Study session on 2025-01-01 10:00"
+            interval: Seconds between flushes when the size limit isn't reached
+            compactor: Trims each chunk before it is written (None: write turns as captured)
+        """
+        self.buffer = buffer
+        self.write = write
+        self.title = title
+        self.interval = interval
+        self.compactor = compactor
+        self.chunks = 0
+        self.saved_chars = 0
+        self.failures = 0
+        self._lock = asyncio.Lock()
+
+    async def run(self) -> None:
+        """Flush on size or interval until cancelled."""
+        failed = False
+        while True:
+            if failed:
+                await asyncio.sleep(self.interval)  # after a failed write, retry on the interval only
+            else:
+                try:
+                    await asyncio.wait_for(self.buffer.flush_wanted.wait(), timeout=self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            failures = self.failures
+            # Shielded: cancelling the loop must not abort a chunk mid-write
+            await asyncio.shield(self.flush())
+            failed = self.failures > failures
+
+    async def flush(self) -> int:
+        """
+        Write the unsaved turns as one chunk.
+
+        Returns:
+            Turns written (0 if there were none or the write failed)
+        """
+        async with self._lock:
+            turns = self.buffer.take()
+            if not turns:
+                return 0
+            lines = self.compactor.compact(turns) if self.compactor else turns
+            if not lines:
+                return len(turns)  # nothing but filler and repeats
+            text = f"{self.title} (part {self.chunks + 1}):\n\n" + "\n".join(lines)
+            try:
+                ok = await self.write(text)
+            except Exception as e:
+                print(f"[transcripts] ⚠️ Error writing transcript chunk: {e}")
+                ok = False
+            if not ok:
+                self.failures += 1
+                if self.compactor:
+                    self.compactor.undo()  # the raw turns are compacted again on the next try
+                self.buffer.put_back(turns)
+                return 0
+            self.chunks += 1
+            self.saved_chars += len(text)
+            print(f"[transcripts] 💾 Saved transcript part {self.chunks} ({len(lines)} of {len(turns)} turns, {len(text)} chars)")
+            return len(turns)